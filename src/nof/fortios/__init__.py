@@ -7,6 +7,7 @@
 """
 from .views import APP
 from .v1api import API
+from .cli import CLI
 from .common import PREFIX, API_PREFIX
 
 # vim:sw=4:ts=4:et:
@@ -0,0 +1,42 @@
+#
+# Copyright (C) 2021 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+"""CLI commands for fortios app, e.g. 'flask fortios bulk-upload ...'.
+"""
+import json
+
+import click
+import flask.cli
+
+from . import common
+
+
+CLI = flask.cli.AppGroup("fortios", help="Commands for fortios app.")
+
+
+@CLI.command("bulk-upload")
+@click.argument("archive", type=click.File("rb"))
+@click.option("--workers", type=int, default=common.BULK_WORKERS,
+              help="Max number of worker processes [number of CPUs]")
+@click.option("--force", is_flag=True,
+              help="Process data even if the same data was processed")
+@click.option("--incremental", is_flag=True,
+              help="Process only parts of data changed since the last time")
+def bulk_upload(archive, workers, force, incremental):
+    """
+    Upload and process a tar or zip ARCHIVE of fortigate's "show
+    *configuration" outputs and print the results as JSON.
+    """
+    try:
+        res = common.bulk_upload_forti_show_configs(archive, workers=workers,
+                                                    force=force,
+                                                    incremental=incremental)
+    except RuntimeError as exc:
+        raise click.ClickException(str(exc))
+
+    click.echo(json.dumps(res, indent=2))
+    if any(r["error"] for r in res):
+        raise click.exceptions.Exit(1)
+
+# vim:sw=4:ts=4:et:
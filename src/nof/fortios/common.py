@@ -4,11 +4,22 @@
 #
 """common globals and utility functions.
 """
+import collections
+import concurrent.futures
 import glob
+import io
 import os.path
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+
+import anyconfig
 import werkzeug.utils
 
 from .. import libs, utils
+from ..lib import fortios, jobs
 
 
 CTYPE = "fortios"
@@ -16,6 +27,30 @@ CTYPE = "fortios"
 PREFIX = "/" + CTYPE
 API_PREFIX = PREFIX + "/api/v1"
 
+# The kind of jobs to process uploaded files, the database file of the job
+# queue under data dir, and max number of threads to process jobs in each
+# process.
+JOB_KIND = "fortios_show_config"
+JOBS_DB_FILENAME = "jobs.sqlite"
+JOB_WORKERS = 2
+
+_JOB_EXECUTOR = None
+_JOB_EXECUTOR_LOCK = threading.Lock()
+
+# Max number of worker processes to process files in archives uploaded at
+# once, or None (number of CPUs).
+BULK_WORKERS = None
+
+# Max number of threads to search firewall policies of hosts in parallel.
+SEARCH_WORKERS = 8
+
+_SEARCH_EXECUTOR = None
+_SEARCH_EXECUTOR_LOCK = threading.Lock()
+
+# Sub dir in upload dir to keep the hostname of the results of each data
+# uploaded and processed, by the checksum of the data.
+REGISTRY_DIRNAME = "registry"
+
 
 def secure_filename(filename):
     """Just an wrapper for werkzeug.secure_filename
@@ -87,29 +122,212 @@ def find_firewall_policy_by_addr(hostname, ipa):
     ipa = secure_filename(ipa)
     hname = secure_filename(hostname)
 
-    rdf = libs.load_firewall_policy_table(hname)
+    table = libs.load_firewall_policy_columns(hname)
+    idx = libs.load_firewall_policy_index(hname)
+
+    return libs.search_firewall_policy_by_addr(table, ipa, index=idx)
+
+
+def query_firewall_policies(hostname, **options):
+    """
+    Filter, sort and slice firewall policies of the host to show them page by
+    page, e.g. in DataTables.
+
+    :param hostname: a str gives hostname of the fortigate node
+    :param options:
+        Keyword options, see :func:`nof.libs.query_firewall_policy_table`
+
+    :return:
+        A mapping object, {recordsTotal, recordsFiltered, data}, gives the
+        total number of policies, number of policies matched and policies in
+        the page
+    :raises: ValueError (could not find/open data file, etc.)
+    """
+    hname = secure_filename(hostname)
+
+    table = libs.load_firewall_policy_columns(hname)
+    texts = libs.load_firewall_policy_texts(hname)
+    (nfiltered, data) = libs.query_firewall_policy_table(table, texts,
+                                                         **options)
+
+    return dict(recordsTotal=len(table), recordsFiltered=nfiltered,
+                data=data)
 
-    return libs.search_firewall_policy_by_addr(rdf, ipa)
+
+def _search_executor():
+    """
+    :return: A thread pool to search firewall policies of hosts
+    """
+    global _SEARCH_EXECUTOR  # pylint: disable=global-statement
+
+    with _SEARCH_EXECUTOR_LOCK:
+        if _SEARCH_EXECUTOR is None:
+            _SEARCH_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+                max_workers=SEARCH_WORKERS
+            )
+
+    return _SEARCH_EXECUTOR
+
+
+def find_firewall_policy_by_addr_in_all_hosts(ipa, hostnames=None):
+    """
+    Find firewall policies match given ip address in all hosts in parallel.
+    Tables of hosts are loaded through the in-process cache and reused.
+
+    :param ipa: a str gives an ip address
+    :param hostnames:
+        A list of hostnames to search, or None to search all hosts, see
+        :func:`list_hostnames`
+
+    :return:
+        An iterator yields a mapping object, {hostname, policies} or
+        {hostname, error}, for each host in the order of completion
+    """
+    if hostnames is None:
+        hostnames = list_hostnames()
+
+    exe = _search_executor()
+    futs = dict((exe.submit(find_firewall_policy_by_addr, h, ipa), h)
+                for h in hostnames)
+    try:
+        for fut in concurrent.futures.as_completed(futs):
+            try:
+                yield dict(hostname=futs[fut], policies=fut.result())
+            except ValueError as exc:
+                yield dict(hostname=futs[fut], error=str(exc))
+    finally:
+        for fut in futs:
+            fut.cancel()  # e.g. the client was disconnected.
 
 
-def upload_forti_show_config(filename, payload):
+def find_firewall_policies_by_addrs(hostname, addrs):
+    """
+    Find firewall policies match each of given ip addresses or networks.
+
+    :param hostname: a str gives hostname of the fortigate node
+    :param addrs: A list of str gives ip addresses or networks
+
+    :return:
+        An iterator yields a mapping object, {addr, policies} or {addr,
+        error}, for each `addrs`
+    :raises: ValueError (could not find/open data file, etc.)
+    """
+    hname = secure_filename(hostname)
+
+    table = libs.load_firewall_policy_columns(hname)
+    idx = libs.load_firewall_policy_index(hname)
+
+    return libs.search_firewall_policies_by_addrs(table, addrs, idx)
+
+
+def diff_firewall_configs(hostname, kinds=None):
+    """
+    Compare firewall policies and objects of the current and the previous
+    uploads of the host.
+
+    :param hostname: a str gives hostname of the fortigate node
+    :param kinds:
+        A list of kinds of items to compare, see
+        :data:`nof.libs.FORTI_DIFF_SOURCES`, or None (all kinds)
+
+    :return: A mapping object, see :func:`nof.libs.diff_firewall_configs`
+    :raises: ValueError (could not find/open data file, etc.)
+    """
+    return libs.diff_firewall_configs(secure_filename(hostname), kinds=kinds)
+
+
+def _registry_path(fpath):
+    """
+    :param fpath: Path to the file uploaded
+    :return: Path to the file keeps the result of the data uploaded
+    """
+    return os.path.join(os.path.dirname(fpath), REGISTRY_DIRNAME,
+                        utils.uploaded_file_checksum(fpath) + ".json")
+
+
+def find_processed_hostname(fpath):
+    """
+    Find the result of the same data processed before.
+
+    :param fpath: Path to the file uploaded
+    :return:
+        The hostname of the result or None if the data was not processed or
+        the result was overwritten with other data of the host after that
+    """
+    rpath = _registry_path(fpath)
+    if not os.path.exists(rpath):
+        return None
+
+    try:
+        entry = anyconfig.load(rpath)
+        hostname = entry["hostname"]
+        metadata = anyconfig.load(
+            os.path.join(os.path.dirname(fpath), secure_filename(hostname),
+                         libs.FORTI_CNF_META)
+        )
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+    if metadata.get("origina_data") != entry.get("filepath"):
+        return None
+
+    return hostname
+
+
+def process_uploaded_file(fpath, stage_fn=None, force=False,
+                          incremental=False):
+    """
+    Process fortigate's "show *configuration" outputs uploaded, or just
+    return the result of the same data processed before.
+
+    :param fpath: Path to the file uploaded
+    :param stage_fn: A callable to record the time to process each stage
+    :param force: Process the data even if it was processed before
+    :param incremental: Process only changed parts of the data
+
+    :return: A tuple of (hostname, True if the data was processed before)
+    :raises: ValueError and so on
+    """
+    if not force:
+        hostname = find_processed_hostname(fpath)
+        if hostname:
+            return (hostname, True)
+
+    # process the source and generate JSON and database files.
+    (hostname, _cnf) = libs.parse_fortigate_config_and_save_files(
+        fpath, stage_fn=stage_fn, incremental=incremental
+    )
+    content = anyconfig.dumps(dict(hostname=hostname, filepath=fpath),
+                              ac_parser="json")
+    utils.save_file_atomically(content.encode("utf-8"), _registry_path(fpath))
+
+    return (hostname, False)
+
+
+def upload_forti_show_config(filename, payload, force=False,
+                             incremental=False):
     """
     Upload and process fortigate's "show *configuration" outputs.
 
     :param filename:
         a str gives a name of the fortigate's "show *configuration" output
-    :param payload: byte data to upload
+    :param payload:
+        byte data or a file-like object opened in binary mode to read data
+        to upload
+    :param force: Process the data even if it was processed before
+    :param incremental: Process only changed parts of the data
+
+    :return: A mapping object, {hostname, filenames, reused}
     """
-    content = payload.decode("utf-8")
+    if isinstance(payload, bytes):
+        payload = io.BytesIO(payload)
 
-    ftype = libs.FT_FORTI_SHOW_CONFIG
-    fpath = utils.uploaded_filepath(filename, ftype, content=content)
     try:
-        utils.ensure_dir_exists(fpath)
-        open(fpath, 'wb').write(payload)  # the source
-
-        # process the source and generate JSON and database files.
-        (hostname, _cnf) = libs.parse_fortigate_config_and_save_files(fpath)
+        # the source
+        fpath = utils.save_uploaded_stream(payload, filename,
+                                           libs.FT_FORTI_SHOW_CONFIG)
+        (hostname, reused) = process_uploaded_file(fpath, force=force,
+                                                   incremental=incremental)
 
     except (IOError, OSError, ValueError, RuntimeError) as exc:
         raise RuntimeError(
@@ -117,6 +335,267 @@ def upload_forti_show_config(filename, payload):
             "uploaded file: {} exc={!r}".format(filename, exc)
         )
 
-    return dict(hostname=hostname, filenames=list_host_files(hostname))
+    return dict(hostname=hostname, filenames=list_host_files(hostname),
+                reused=reused)
+
+
+def job_queue():
+    """
+    :return: A :class:`nof.lib.jobs.JobQueue` object
+    """
+    return jobs.JobQueue(os.path.join(utils.datadir_maybe_from_env(),
+                                      JOBS_DB_FILENAME))
+
+
+def process_forti_show_config(params, stage_fn=None):
+    """
+    Process fortigate's "show *configuration" outputs uploaded.
+
+    :param params:
+        A mapping object, {filepath, filename, force, incremental}
+    :param stage_fn: A callable to record the time to process each stage
+
+    :return: A mapping object, {hostname, filenames, reused}
+    :raises: ValueError and so on
+    """
+    (hostname, reused) = process_uploaded_file(
+        params["filepath"], stage_fn=stage_fn,
+        force=params.get("force", False),
+        incremental=params.get("incremental", False)
+    )
+    return dict(hostname=hostname, filenames=list_host_files(hostname),
+                reused=reused)
+
+
+def run_jobs():
+    """
+    Process jobs queued including ones left running by dead processes.
+
+    :return: Number of jobs processed
+    """
+    queue = job_queue()
+    queue.requeue_orphans()
+
+    return queue.run({JOB_KIND: process_forti_show_config})
+
+
+def start_jobs():
+    """
+    Start to process jobs queued in the background threads.
+    """
+    global _JOB_EXECUTOR  # pylint: disable=global-statement
+
+    with _JOB_EXECUTOR_LOCK:
+        if _JOB_EXECUTOR is None:
+            _JOB_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+                max_workers=JOB_WORKERS
+            )
+
+    return _JOB_EXECUTOR.submit(run_jobs)
+
+
+def enqueue_forti_show_config(filename, payload, force=False,
+                              incremental=False):
+    """
+    Upload fortigate's "show *configuration" outputs and enqueue the job to
+    process it later.
+
+    :param filename:
+        a str gives a name of the fortigate's "show *configuration" output
+    :param payload:
+        byte data or a file-like object opened in binary mode to read data
+        to upload
+    :param force: Process the data even if it was processed before
+    :param incremental: Process only changed parts of the data
+
+    :return: A mapping object gives the job enqueued
+    """
+    if isinstance(payload, bytes):
+        payload = io.BytesIO(payload)
+
+    try:
+        fpath = utils.save_uploaded_stream(payload, filename,
+                                           libs.FT_FORTI_SHOW_CONFIG)
+    except (IOError, OSError) as exc:
+        raise RuntimeError(
+            "Something went wrong while uploading data. "
+            "uploaded file: {} exc={!r}".format(filename, exc)
+        )
+
+    job = job_queue().enqueue(JOB_KIND, dict(filepath=fpath,
+                                             filename=filename,
+                                             force=force,
+                                             incremental=incremental))
+    start_jobs()
+
+    return job
+
+
+def get_job(job_id):
+    """
+    :param job_id: Job ID
+    :return: A mapping object gives the job or None if it's not found
+    """
+    queue = job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return None
+
+    # It may be left running by the process exited, e.g. before restart.
+    if job["state"] == jobs.ST_RUNNING and not jobs.is_alive(job["worker"]):
+        queue.requeue_orphans()
+        job = queue.get(job_id)
+
+    if job["state"] == jobs.ST_QUEUED:
+        start_jobs()  # It may be queued before restart.
+
+    return job
+
+
+def _process_uploaded_file(fpath, force=False, incremental=False):
+    """
+    Process a fortigate's "show *configuration" output uploaded. It's run in
+    worker processes.
+
+    :param fpath: Path to the file uploaded
+    :param force: Process the data even if it was processed before
+    :param incremental: Process only changed parts of the data
+
+    :return: A mapping object, {hostname, reused, error}
+    """
+    try:
+        (hostname, reused) = process_uploaded_file(fpath, force=force,
+                                                   incremental=incremental)
+        return dict(hostname=hostname, reused=reused, error=None)
+    except Exception as exc:  # pylint: disable=broad-except
+        return dict(hostname=None, reused=False, error=str(exc))
+
+
+def _process_uploaded_files(fpaths, force=False, incremental=False):
+    """
+    Process fortigate's "show *configuration" outputs of the same host
+    uploaded one by one in order. It's run in worker processes.
+
+    :param fpaths: A list of paths to the files uploaded
+    :param force: Process the data even if it was processed before
+    :param incremental: Process only changed parts of the data
+
+    :return: A list of mapping objects, [{hostname, reused, error}]
+    """
+    return [_process_uploaded_file(fpath, force=force,
+                                   incremental=incremental)
+            for fpath in fpaths]
+
+
+def _uploaded_files_results(fut, count):
+    """
+    :param fut: A future of :func:`_process_uploaded_files`
+    :param count: Number of files processed in it
+    :return: A list of mapping objects, [{hostname, reused, error}]
+    """
+    try:
+        return fut.result()
+    except Exception as exc:  # pylint: disable=broad-except
+        # e.g. BrokenProcessPool if the worker process was killed.
+        return [dict(hostname=None, reused=False, error=str(exc))
+                for _i in range(count)]
+
+
+def _archive_members_itr(archive):
+    """
+    :param archive: A file object of tar or zip archive opened in binary mode
+    :return:
+        An iterator yields a tuple of (member name, file object to read the
+        content of the member)
+    :raises: ValueError
+    """
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as zarc:
+            for info in zarc.infolist():
+                if not info.is_dir():
+                    with zarc.open(info) as inp:
+                        yield (info.filename, inp)
+        return
+
+    archive.seek(0)
+    try:
+        tarc = tarfile.open(fileobj=archive, mode="r:*")
+    except tarfile.TarError:
+        raise ValueError("Not a tar or zip archive")
+
+    with tarc:
+        for member in tarc:
+            if member.isfile():
+                yield (member.name, tarc.extractfile(member))
+
+
+def bulk_upload_forti_show_configs(payload, workers=BULK_WORKERS,
+                                   force=False, incremental=False):
+    """
+    Upload an archive (tar or zip) of fortigate's "show *configuration"
+    outputs and process each file in it in worker processes in parallel.
+
+    The archive is saved to a temporary file at first, and each file in it is
+    saved to upload dir. Files of different hosts are processed in parallel,
+    and files of the same host are processed one by one in the order in the
+    archive, so that the last one of them is the latest data of the host.
+
+    :param payload:
+        byte data or a file-like object opened in binary mode to read data
+        of the archive to upload
+    :param workers: Max number of worker processes or None (number of CPUs)
+    :param force: Process the data even if it was processed before
+    :param incremental: Process only changed parts of the data
+
+    :return:
+        A list of mapping objects, [{filename, hostname, filenames, reused,
+        error}], gives the result of each file in the archive
+    :raises: RuntimeError
+    """
+    if isinstance(payload, bytes):
+        payload = io.BytesIO(payload)
+
+    udir = uploaddir()
+    os.makedirs(udir, exist_ok=True)
+
+    members = []  # [(name, fpath)]
+    groups = collections.OrderedDict()  # {<hostname>: [index of members]}
+    with tempfile.TemporaryFile(dir=udir) as archive:
+        try:
+            shutil.copyfileobj(payload, archive, utils.CHECKSUM_CHUNK_SIZE)
+            for name, inp in _archive_members_itr(archive):
+                fpath = utils.save_uploaded_stream(
+                    inp, os.path.basename(name), libs.FT_FORTI_SHOW_CONFIG
+                )
+                # Files the hostname was not found are processed separately.
+                hostname = fortios.hostname_from_show_config_file(fpath)
+                groups.setdefault(hostname or fpath, []).append(len(members))
+                members.append((name, fpath))
+
+        except (IOError, OSError, ValueError, EOFError, tarfile.TarError,
+                zipfile.BadZipFile) as exc:
+            raise RuntimeError(
+                "Uploaded archive was invalid or something went wrong. "
+                "exc={!r}".format(exc)
+            )
+
+    res = [None] * len(members)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as exe:
+        futs = [(idxs, exe.submit(_process_uploaded_files,
+                                  [members[i][1] for i in idxs],
+                                  force=force, incremental=incremental))
+                for idxs in groups.values()]
+
+        for idxs, fut in futs:
+            for idx, fres in zip(idxs, _uploaded_files_results(fut,
+                                                               len(idxs))):
+                res[idx] = dict(fres, filename=members[idx][0])
+
+    for fres in res:
+        fres["filenames"] = (list_host_files(fres["hostname"])
+                             if fres["hostname"] else [])
+
+    return res
 
 # vim:sw=4:ts=4:et:
@@ -19,9 +19,15 @@ IDX_PATH = "/"
 GET_PATH_0 = "/configs/<string:hostname>/"
 GET_PATH_1 = GET_PATH_0 + "<path:filename>"
 UP_PATH = "/upload/<path:filename>"
+JOB_PATH = "/jobs/<string:job_id>"
+BULK_UP_PATH = "/bulk_upload"
 
 FIND_POLICY_BY_ADDR = ("/firewall/policies/by_addr/"
                        "<string:hostname>/<string:ipa>")
+FIND_POLICIES_BY_ADDRS = "/firewall/policies/by_addrs/<string:hostname>"
+FIND_POLICY_BY_ADDR_IN_ALL = "/firewall/policies/by_addr/<string:ipa>"
+POLICIES_TABLE_PATH = "/firewall/policies/table/<string:hostname>"
+DIFF_PATH = "/firewall/diffs/<string:hostname>"
 
 
 def _get_host_config(hostname, filename):
@@ -33,8 +39,18 @@ def _get_host_config(hostname, filename):
 
     :param filename: a str gives a name of the fortigate JSON config file
     """
-    return flask.send_from_directory(common.host_uploaddir(hostname),
-                                     common.secure_filename(filename))
+    return libs.send_file_with_encodings(common.host_uploaddir(hostname),
+                                         common.secure_filename(filename))
+
+
+def _upload_options():
+    """
+    :return:
+        A mapping object gives options to process data uploaded, force and
+        incremental, from the query parameters
+    """
+    return dict((key, bool(flask.request.args.get(key)))
+                for key in ("force", "incremental"))
 
 
 def _upload_show_config(filename):
@@ -44,13 +60,40 @@ def _upload_show_config(filename):
     :param filename:
         a str gives a name of the fortigate's "show *configuration" output
     """
+    opts = _upload_options()
+    if flask.request.args.get("async"):
+        return _upload_show_config_async(filename, **opts)
+
+    try:
+        data = common.upload_forti_show_config(filename,
+                                               flask.request.stream, **opts)
+    except RuntimeError as exc:
+        flask.abort(400, dict(code="Invalid data", message=str(exc)))
+
+    # The result of the same data processed before was returned.
+    status = 200 if data["reused"] else 201
+
+    return flask.make_response(flask.jsonify(data), status)
+
+
+def _upload_show_config_async(filename, **opts):
+    """
+    Upload fortigate's "show *configuration" outputs and process it later.
+
+    :param filename:
+        a str gives a name of the fortigate's "show *configuration" output
+    :param opts: Options to process data, see :func:`_upload_options`
+    """
     try:
-        payload = flask.request.get_data()
-        data = common.upload_forti_show_config(filename, payload)
+        job = common.enqueue_forti_show_config(filename,
+                                               flask.request.stream, **opts)
     except RuntimeError as exc:
         flask.abort(400, dict(code="Invalid data", message=str(exc)))
 
-    return flask.make_response(flask.jsonify(data), 201)
+    resp = flask.make_response(flask.jsonify(job), 202)
+    resp.headers["Location"] = flask.url_for(".get_job", job_id=job["id"])
+
+    return resp
 
 
 @API.route("/", methods=["GET"])
@@ -87,6 +130,37 @@ def upload_show_config(filename):
     return _upload_show_config(filename)
 
 
+@API.route(BULK_UP_PATH, methods=["POST"])
+def bulk_upload_show_configs():
+    """
+    Upload an archive (tar or zip) of fortigate's "show *configuration"
+    outputs and process them in parallel.
+    """
+    try:
+        res = common.bulk_upload_forti_show_configs(flask.request.stream,
+                                                    **_upload_options())
+    except RuntimeError as exc:
+        flask.abort(400, dict(code="Invalid data", message=str(exc)))
+
+    return flask.make_response(flask.jsonify(res), 200)
+
+
+@API.route(JOB_PATH, methods=["GET"])
+def get_job(job_id):
+    """
+    Get the state, the time to process each stage and the result of the job
+    to process fortigate's "show *configuration" outputs uploaded.
+
+    :param job_id: Job ID
+    """
+    job = common.get_job(job_id)
+    if job is None:
+        flask.abort(404, dict(code="Not found",
+                              message="No such job: {}".format(job_id)))
+
+    return flask.make_response(flask.jsonify(job), 200)
+
+
 @API.route(FIND_POLICY_BY_ADDR, methods=["GET"])
 def find_firewall_policy_by_ipa(hostname, ipa):
     """
@@ -109,4 +183,161 @@ def find_firewall_policy_by_ipa(hostname, ipa):
     status = 200
     return flask.make_response(flask.jsonify(res), status)
 
+
+def _json_list_itr(items):
+    """
+    :param items: An iterable yields objects can be serialized to JSON
+    :return: An iterator yields chunks of a JSON list of `items`
+    """
+    yield "["
+    for idx, item in enumerate(items):
+        yield ("," if idx else "") + flask.json.dumps(item)
+    yield "]\n"
+
+
+@API.route(FIND_POLICY_BY_ADDR_IN_ALL, methods=["GET"])
+def find_firewall_policy_by_ipa_in_all_hosts(ipa):
+    """
+    Find firewall policies match given ip address in all hosts and stream
+    the results of each host, [{"hostname": ..., "policies": [...]} or
+    {"hostname": ..., "error": ...}], as they are found.
+
+    :param ipa: a str gives an ip address
+    """
+    res = common.find_firewall_policy_by_addr_in_all_hosts(ipa)
+
+    return flask.Response(_json_list_itr(res), 200,
+                          mimetype="application/json")
+
+
+@API.route(FIND_POLICIES_BY_ADDRS, methods=["POST"])
+def find_firewall_policies_by_addrs(hostname):
+    """
+    Find firewall policies match each of ip addresses or networks given as a
+    JSON list, e.g. ["192.168.1.1", "10.0.0.0/8"], and stream the results,
+    [{"addr": ..., "policies": [...]} or {"addr": ..., "error": ...}].
+
+    :param hostname: a str gives hostname of the fortigate node
+    """
+    addrs = flask.request.get_json(force=True, silent=True)
+    if not isinstance(addrs, list):
+        flask.abort(400, dict(code="Invalid data",
+                              message="Expected a JSON list of addresses"))
+
+    try:
+        res = common.find_firewall_policies_by_addrs(hostname, addrs)
+    except ValueError as exc:
+        flask.abort(404, dict(code="Not found", message=str(exc)))
+
+    return flask.Response(_json_list_itr(res), 200,
+                          mimetype="application/json")
+
+
+def _int_arg(args, key, default=0):
+    """
+    :param args: A mapping object gives parameters
+    :param key: Key of the parameter
+    :param default: Default value if the parameter is not an int
+    """
+    try:
+        return int(args.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _datatables_options(args):
+    """
+    Parse parameters sent by DataTables in server-side processing mode.
+
+    .. seealso:: https://datatables.net/manual/server-side
+
+    :param args: A mapping object gives parameters
+    :return:
+        A mapping object gives keyword options of
+        :func:`nof.libs.query_firewall_policy_table`
+    """
+    cols = []
+    while "columns[{}][data]".format(len(cols)) in args:
+        prefix = "columns[{}]".format(len(cols))
+        cols.append(dict(
+            data=args.get(prefix + "[data]"),
+            searchable=args.get(prefix + "[searchable]", "true") == "true",
+            orderable=args.get(prefix + "[orderable]", "true") == "true",
+            search=args.get(prefix + "[search][value]", "")
+        ))
+
+    orders = []
+    while "order[{}][column]".format(len(orders)) in args:
+        prefix = "order[{}]".format(len(orders))
+        idx = _int_arg(args, prefix + "[column]", -1)
+        if 0 <= idx < len(cols) and cols[idx]["orderable"]:
+            orders.append((cols[idx]["data"],
+                           args.get(prefix + "[dir]") != "desc"))
+        else:
+            orders.append((None, True))
+
+    return dict(start=max(_int_arg(args, "start"), 0),
+                length=_int_arg(args, "length", -1),
+                search=(args.get("search[value]", ""),
+                        [c["data"] for c in cols if c["searchable"]]),
+                searches=[(c["data"], c["search"]) for c in cols
+                          if c["searchable"] and c["search"]],
+                orders=[o for o in orders if o[0]])
+
+
+@API.route(POLICIES_TABLE_PATH, methods=["GET", "POST"])
+def firewall_policies_table(hostname):
+    """
+    Get firewall policies of the host in pages for DataTables in server-side
+    processing mode, which does paging, sorting and searching.
+
+    .. seealso:: https://datatables.net/manual/server-side
+
+    :param hostname: a str gives hostname of the fortigate node
+    """
+    args = flask.request.values
+    res = dict(draw=_int_arg(args, "draw"))
+    try:
+        res.update(common.query_firewall_policies(
+            hostname, **_datatables_options(args)
+        ))
+    except ValueError as exc:
+        res.update(recordsTotal=0, recordsFiltered=0, data=[],
+                   error="No data found: {}".format(hostname))
+        flask.current_app.logger.warning(
+            "Failed to load the firewall policies: "
+            "hostname={}, exc={!s}".format(hostname, exc)
+        )
+
+    return flask.make_response(flask.jsonify(res), 200)
+
+
+@API.route(DIFF_PATH, methods=["GET"])
+def diff_firewall_configs(hostname):
+    """
+    Get the diff of firewall policies and objects between the current and
+    the previous uploads of the host, {hostname, current, previous, diffs},
+    and diffs is {<kind>: {added, removed, modified}}. Kinds to compare may
+    be given as a comma separated list, e.g. ?kinds=policies,addresses.
+
+    :param hostname: a str gives hostname of the fortigate node
+    """
+    kinds = flask.request.args.get("kinds")
+    if kinds:
+        kinds = [k.strip() for k in kinds.split(',') if k.strip()]
+        unknowns = [k for k in kinds if k not in libs.FORTI_DIFF_SOURCES]
+        if unknowns:
+            flask.abort(400, dict(code="Invalid data",
+                                  message="Unknown kinds: {}".format(
+                                      ", ".join(unknowns))))
+    else:
+        kinds = None
+
+    try:
+        res = common.diff_firewall_configs(hostname, kinds=kinds)
+    except ValueError as exc:
+        flask.abort(404, dict(code="Not found", message=str(exc)))
+
+    return flask.make_response(flask.jsonify(res), 200)
+
 # vim:sw=4:ts=4:et:
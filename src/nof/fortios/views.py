@@ -68,7 +68,7 @@ def index():
         try:
             payload = form.upload.data
             common.upload_forti_show_config(payload.filename,
-                                            payload.read())
+                                            payload.stream)
             msg = u"File was successfully uploaded."
 
         except RuntimeError as exc:
@@ -87,9 +87,8 @@ def host_firewall_policies(hostname):
     """Host's firewall policy page.
     """
     summary = "Host {}: Firewall Policies".format(hostname)
-    purl = flask.url_for("forti_api.get_host_config",
-                         hostname=hostname,
-                         filename=libs.FORTI_FIREWALL_POLICIES_RESOLVED)
+    purl = flask.url_for("forti_api.firewall_policies_table",
+                         hostname=hostname)
 
     return flask.render_template("fortios_host_firewall_policies.html",
                                  summary=summary, hostname=hostname,
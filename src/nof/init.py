@@ -34,6 +34,7 @@ def create_app(cnf_name="development"):
 
     app.register_blueprint(fortios.APP)
     app.register_blueprint(fortios.API)
+    app.cli.add_command(fortios.CLI)
 
     return app
 
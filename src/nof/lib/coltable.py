@@ -0,0 +1,478 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+r"""A columnar file format of tables loaded by memory mapping.
+
+Tables are saved in a file as arrays of fixed-width integers:
+
+- integer columns are arrays of int64
+- other columns are arrays of int32 codes of values interned, and each value
+  is saved once in the dictionary of the column as a JSON str
+- address ranges, [(start, end)] of IPv4 networks in columns given, are
+  arrays of uint64 with the positions of rows have them
+
+The file is a magic, the length of the header, the header (JSON) and these
+arrays aligned to 8 bytes::
+
+    NOFCOLS1 <header length: uint64> <header> <arrays ...>
+
+Only the header is read to load tables and arrays are mapped to memory, so
+that processes share pages of the file and only pages of columns and rows
+accessed are read.
+
+.. versionadded:: 0.2.0
+
+   - initial checkin
+"""
+from __future__ import absolute_import
+
+import hashlib
+import ipaddress
+import json
+import mmap
+import struct
+
+import numpy
+
+
+MAGIC = b"NOFCOLS1"
+VERSION = 1
+
+COLUMN_KINDS = (CK_INT, CK_JSON) = ("int", "json")
+
+_ALIGN = 8
+_HEADER_LEN = struct.Struct("<Q")
+
+# An odd multiplier to combine hashes of values into hashes of rows.
+_HASH_MULT = numpy.uint64(0x9E3779B97F4A7C15)
+
+
+def hash64(data):
+    """
+    :param data: A bytes object
+    :return: An int gives the 64 bits hash of `data`
+
+    >>> hash64(b"a") == hash64(b"a") != hash64(b"b")
+    True
+    """
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(),
+                          "little")
+
+
+def _plain(val):
+    """
+    :param val: A value in a cell of tables
+    :return:
+        The value can be serialized as JSON, NaN is converted to None and
+        floats of integral values, e.g. ones in int columns upcasted by pandas
+        as they have NaN, are converted to ints
+
+    >>> _plain(numpy.int64(1)), _plain(float("nan")), _plain((1, "a"))
+    (1, None, [1, 'a'])
+    >>> _plain(numpy.float64(2.0)), _plain(2.5)
+    (2, 2.5)
+    """
+    if isinstance(val, numpy.generic):
+        val = val.item()
+
+    if isinstance(val, float):
+        if val != val:  # NaN
+            return None
+        if val.is_integer():
+            return int(val)
+
+    if isinstance(val, (list, tuple)):
+        return [_plain(v) for v in val]
+
+    if isinstance(val, dict):
+        return {k: _plain(v) for k, v in val.items()}
+
+    return val
+
+
+def _intern(vals):
+    """
+    :param vals: An iterable yields values of a column
+    :return: A tuple of (codes, a list of JSON str of unique values)
+    """
+    (codes, uniqs, strs) = ([], {}, {})  # strs: {str: JSON str}
+    for val in vals:
+        if isinstance(val, str):
+            jstr = strs.get(val)
+            if jstr is None:
+                jstr = strs[val] = json.dumps(val, ensure_ascii=False)
+        else:
+            jstr = json.dumps(_plain(val), ensure_ascii=False)
+
+        codes.append(uniqs.setdefault(jstr, len(uniqs)))
+
+    return (numpy.asarray(codes, dtype=numpy.int32), list(uniqs))
+
+
+def _strs_to_arrays(strs):
+    """
+    :param strs: A list of str
+    :return: A tuple of (offsets, blob) arrays of utf-8 encoded `strs`
+    """
+    bstrs = [s.encode("utf-8") for s in strs]
+    offsets = numpy.zeros(len(bstrs) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(b) for b in bstrs], out=offsets[1:])
+
+    return (offsets, numpy.frombuffer(b"".join(bstrs), dtype=numpy.uint8))
+
+
+def _ip_network(addr):
+    """
+    :param addr: A str gives an address, e.g. 10.0.1.0/24
+    :return: A IPv*Network object or None if `addr` is not a network
+    """
+    try:
+        return ipaddress.ip_network(addr)
+    except ValueError:
+        return None
+
+
+def _ipv4_range(net):
+    """
+    :param net: An IPv*Network object or None
+    :return: A tuple of (start, end) of `net` if it's an IPv4 network or None
+    """
+    if isinstance(net, ipaddress.IPv4Network):
+        start = int(net.network_address)
+        return (start, start | int(net.hostmask))
+
+    return None
+
+
+def _make_ranges(tbl_rdf, range_cols, to_network):
+    """
+    :param tbl_rdf: A :class:`pandas.DataFrame` object
+    :param range_cols: Names of columns of lists of addresses
+    :param to_network:
+        A callable to convert an address to an IPv*Network object or None
+
+    :return: A tuple of arrays of (positions of rows, starts, ends)
+    """
+    (ranges, memo) = (set(), {})  # memo: {addr: (start, end) or None}
+    for col in range_cols:
+        if col not in tbl_rdf:
+            continue
+
+        for pos, addrs in enumerate(tbl_rdf[col]):
+            if not isinstance(addrs, (list, tuple)):
+                continue
+
+            for addr in addrs:
+                if not isinstance(addr, str):
+                    continue
+
+                if addr not in memo:
+                    memo[addr] = _ipv4_range(to_network(addr))
+
+                rng = memo[addr]
+                if rng is not None:
+                    ranges.add((pos, ) + rng)
+
+    ranges = sorted(ranges)
+    return tuple(numpy.asarray([r[i] for r in ranges], dtype=dtype)
+                 for i, dtype in enumerate((numpy.int64, numpy.uint64,
+                                            numpy.uint64)))
+
+
+def dumps(tbl_rdf, meta=None, range_cols=(), to_network=_ip_network):
+    """
+    Serialize a table in the columnar format.
+
+    :param tbl_rdf: A :class:`pandas.DataFrame` object gives the table
+    :param meta: A mapping object gives extra data to save in the header
+    :param range_cols:
+        Names of columns of lists of addresses to save the ranges of them
+    :param to_network:
+        A callable to convert an address in `range_cols` to an IPv*Network
+        object or None
+
+    :return: A bytes object gives the table serialized
+    """
+    (blobs, size) = ([], 0)
+
+    def _add(arr):
+        nonlocal size
+        data = numpy.ascontiguousarray(arr).tobytes()
+        ref = [size, arr.dtype.str, len(arr)]
+        pad = -len(data) % _ALIGN
+        blobs.append(data + b"\0" * pad)
+        size += len(data) + pad
+        return ref
+
+    columns = []
+    for col in tbl_rdf.columns:
+        vals = tbl_rdf[col]
+        if numpy.issubdtype(vals.dtype, numpy.integer):
+            columns.append(dict(name=col, kind=CK_INT, arrays=dict(
+                data=_add(vals.to_numpy(dtype=numpy.int64))
+            )))
+            continue
+
+        (codes, uniqs) = _intern(vals)
+        (offsets, blob) = _strs_to_arrays(uniqs)
+        columns.append(dict(name=col, kind=CK_JSON, arrays=dict(
+            codes=_add(codes), offsets=_add(offsets), blob=_add(blob)
+        )))
+
+    (rows, starts, ends) = _make_ranges(tbl_rdf, range_cols, to_network)
+    labels = tbl_rdf.index.to_numpy(dtype=numpy.int64)
+    if numpy.array_equal(labels, numpy.arange(len(labels))):
+        labels = None  # Labels are same as positions.
+    else:
+        labels = _add(labels)
+
+    header = dict(version=VERSION, rows=len(tbl_rdf), meta=meta or {},
+                  columns=columns, labels=labels,
+                  ranges=dict(rows=_add(rows), starts=_add(starts),
+                              ends=_add(ends)))
+
+    hdr = json.dumps(header).encode("utf-8")
+    hdr += b" " * (-(len(MAGIC) + _HEADER_LEN.size + len(hdr)) % _ALIGN)
+
+    return b"".join([MAGIC, _HEADER_LEN.pack(len(hdr)), hdr] + blobs)
+
+
+def read_header(filepath):
+    """
+    :param filepath: Path to the file of a table
+    :return: A tuple of (header, offset of arrays in the file)
+    :raises: ValueError if it's not a file of a table
+    """
+    with open(filepath, "rb") as inp:
+        if inp.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a columnar table: {}".format(filepath))
+
+        (hlen, ) = _HEADER_LEN.unpack(inp.read(_HEADER_LEN.size))
+        header = json.loads(inp.read(hlen).decode("utf-8"))
+
+    if header.get("version") != VERSION:
+        raise ValueError("Unsupported version: {!r}, "
+                         "{}".format(header.get("version"), filepath))
+
+    return (header, len(MAGIC) + _HEADER_LEN.size + hlen)
+
+
+class ColumnarTable():
+    """
+    A table loaded from a file in the columnar format by memory mapping.
+
+    Rows are referred by positions, and index labels of rows of the original
+    table are kept to convert them to positions.
+    """
+    def __init__(self, filepath):
+        """
+        :param filepath: Path to the file of a table, see :func:`dumps`
+        :raises: ValueError, IOError, OSError
+        """
+        (self.header, self._start) = read_header(filepath)
+        self.filepath = filepath
+        self.meta = self.header["meta"]
+        self.columns = [c["name"] for c in self.header["columns"]]
+        self._columns = {c["name"]: c for c in self.header["columns"]}
+        self._label_positions = None
+
+        with open(filepath, "rb") as inp:
+            self._mmap = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def __contains__(self, col):
+        return col in self._columns
+
+    def nbytes(self):
+        """
+        :return:
+            Approx. size in bytes of data of the table in memory excluding
+            pages mapped, shared with other processes
+        """
+        return self._start + (0 if self._label_positions is None
+                              else 100 * len(self._label_positions))
+
+    def _array(self, ref):
+        """
+        :param ref: A list of [offset, dtype, length] of an array
+        :return: A read-only :class:`numpy.ndarray` object mapped to memory
+        """
+        (offset, dtype, length) = ref
+        return numpy.frombuffer(self._mmap, dtype=numpy.dtype(dtype),
+                                count=length, offset=self._start + offset)
+
+    def _arrays(self, col):
+        """
+        :param col: The name of a column
+        :return: A tuple of (kind, a mapping object of arrays) of the column
+        """
+        try:
+            col = self._columns[col]
+        except KeyError:
+            raise KeyError("No such column: {}".format(col))
+
+        return (col["kind"],
+                {k: self._array(r) for k, r in col["arrays"].items()})
+
+    def labels(self):
+        """
+        :return: An int64 array of the index labels of rows
+        """
+        if self.header["labels"] is None:
+            return numpy.arange(len(self), dtype=numpy.int64)
+
+        return self._array(self.header["labels"])
+
+    def positions(self, labels):
+        """
+        :param labels: A list of index labels of rows
+        :return: A sorted list of unique positions of the rows
+        """
+        if self.header["labels"] is None:
+            return sorted(set(lbl for lbl in labels if 0 <= lbl < len(self)))
+
+        if self._label_positions is None:
+            self._label_positions = {lbl: pos for pos, lbl
+                                     in enumerate(self.labels().tolist())}
+
+        return sorted(set(self._label_positions[lbl] for lbl in labels
+                          if lbl in self._label_positions))
+
+    def numbers(self, col):
+        """
+        :param col: The name of a column
+        :return:
+            An int64 array of the values of the column or None if it's not an
+            integer column
+        """
+        (kind, arrs) = self._arrays(col)
+        return arrs["data"] if kind == CK_INT else None
+
+    def _dict_values(self, arrs, codes):
+        """
+        :param arrs: A mapping object of arrays of a column
+        :param codes: An iterable yields codes of values
+        :return: A list of values of `codes`
+        """
+        (offsets, blob) = (arrs["offsets"], arrs["blob"])
+        return [json.loads(blob[offsets[c]:offsets[c + 1]].tobytes()
+                           .decode("utf-8"))
+                for c in codes]
+
+    def values(self, col, rows=None):
+        """
+        :param col: The name of a column
+        :param rows: A list of positions of rows or None (all rows)
+        :return: A list of values of the column in `rows`
+        """
+        (kind, arrs) = self._arrays(col)
+        if kind == CK_INT:
+            data = arrs["data"]
+            return (data if rows is None else data[rows]).tolist()
+
+        codes = arrs["codes"] if rows is None else arrs["codes"][rows]
+        (uniqs, inv) = numpy.unique(codes, return_inverse=True)
+        vals = self._dict_values(arrs, uniqs.tolist())
+
+        return [vals[i] for i in inv.tolist()]
+
+    def map_values(self, col, fn):
+        """
+        Apply `fn` to each value of the column. `fn` is called once for each
+        unique value of columns interned.
+
+        :param col: The name of a column
+        :param fn: A callable to convert a value
+        :return: A :class:`numpy.ndarray` object of results of rows
+        """
+        (kind, arrs) = self._arrays(col)
+        if kind == CK_INT:
+            return numpy.asarray([fn(v) for v in arrs["data"].tolist()],
+                                 dtype=object)
+
+        res = numpy.empty(len(arrs["offsets"]) - 1, dtype=object)
+        res[:] = [fn(v) for v in
+                  self._dict_values(arrs, range(len(res)))]
+
+        return res[arrs["codes"]]
+
+    def value_hashes(self, col):
+        """
+        Hashes of values are computed from JSON str of them, so that these
+        of the same values in tables are same.
+
+        :param col: The name of a column
+        :return: An uint64 array of hashes of the values of the column
+        """
+        (kind, arrs) = self._arrays(col)
+        if kind == CK_INT:
+            (uniqs, codes) = numpy.unique(arrs["data"], return_inverse=True)
+            jstrs = [str(v).encode("utf-8") for v in uniqs.tolist()]
+        else:
+            offsets = arrs["offsets"].tolist()
+            blob = arrs["blob"].tobytes()
+            jstrs = [blob[offsets[i]:offsets[i + 1]]
+                     for i in range(len(offsets) - 1)]
+            codes = arrs["codes"]
+
+        hashes = numpy.asarray([hash64(j) for j in jstrs], dtype=numpy.uint64)
+        return hashes[codes] if len(hashes) else numpy.zeros(0, numpy.uint64)
+
+    def row_hashes(self, columns=None):
+        """
+        Hashes of rows are computed from hashes of the names and the values
+        of columns, and columns not in the table are regarded as columns of
+        null (None) values, so that these of rows of the same content in
+        tables are same.
+
+        :param columns: Names of columns or None (all columns)
+        :return: An uint64 array of hashes of rows
+        """
+        hashes = numpy.zeros(len(self), dtype=numpy.uint64)
+        for col in sorted(self.columns if columns is None else columns):
+            if col in self:
+                vals = self.value_hashes(col)
+            else:
+                vals = numpy.full(len(self), hash64(b"null"),
+                                  dtype=numpy.uint64)
+
+            salt = numpy.uint64(hash64(col.encode("utf-8")))
+            hashes = hashes * _HASH_MULT + (vals ^ salt)
+
+        return hashes
+
+    def records(self, rows, fill=''):
+        """
+        :param rows: A list of positions of rows
+        :param fill: A value to fill None (null) values
+        :return: A list of mapping objects gives the rows
+        """
+        rows = list(rows)
+        cols = [(c, self.values(c, rows)) for c in self.columns]
+
+        return [{c: fill if vals[i] is None else vals[i] for c, vals in cols}
+                for i in range(len(rows))]
+
+    def ranges(self):
+        """
+        :return:
+            A tuple of arrays of (positions of rows, starts, ends) of IPv4
+            address ranges of rows
+        """
+        return tuple(self._array(self.header["ranges"][k])
+                     for k in ("rows", "starts", "ends"))
+
+    def rows_containing(self, ipa):
+        """
+        :param ipa: An IPv4Address object
+        :return: A sorted list of unique positions of rows have the address
+        """
+        (rows, starts, ends) = self.ranges()
+        ipn = numpy.uint64(int(ipa))
+
+        return numpy.unique(rows[(starts <= ipn) & (ipn <= ends)]).tolist()
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,159 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+r"""Diff of items, e.g. firewall policies and address objects, between two
+versions of configs.
+
+Items are matched by their keys, e.g. policy IDs and names of objects, and
+compared by hashes of their content, so that the diff is computed in linear
+time of the number of items. Items having the same keys, e.g. objects of the
+same name in some vdoms, are matched in order of appearance.
+
+The diff is a mapping object, {added, removed, modified}, and modified is a
+list of mapping objects, [{key, old, new, changes}], and changes is a mapping
+object, {<field>: [<old value>, <new value>]}.
+
+.. versionadded:: 0.2.0
+
+   - initial checkin
+"""
+from __future__ import absolute_import
+
+import collections
+import json
+
+from . import coltable
+
+
+def _keyed(keys):
+    """
+    :param keys: An iterable yields keys of items
+    :return: A list of tuples of (key, nth occurrence of the key)
+
+    >>> _keyed(["a", "b", "a"])
+    [('a', 0), ('b', 0), ('a', 1)]
+    """
+    (res, seen) = ([], collections.Counter())
+    for key in keys:
+        res.append((key, seen[key]))
+        seen[key] += 1
+
+    return res
+
+
+def match(old_keys, old_hashes, new_keys, new_hashes):
+    """
+    :param old_keys: A list of keys of old items
+    :param old_hashes: A list of hashes of the content of old items
+    :param new_keys: A list of keys of new items
+    :param new_hashes: A list of hashes of the content of new items
+
+    :return:
+        A tuple of (positions of new items added, positions of old items
+        removed, a list of tuples of positions of (old, new) items modified)
+
+    >>> match(["a", "b", "c"], [1, 2, 3], ["c", "b", "d"], [3, 4, 5])
+    ([2], [0], [(1, 1)])
+    """
+    olds = dict((k, i) for i, k in enumerate(_keyed(old_keys)))
+    news = _keyed(new_keys)
+    newset = set(news)
+
+    added = [j for j, k in enumerate(news) if k not in olds]
+    removed = [i for k, i in olds.items() if k not in newset]
+    modified = [(olds[k], j) for j, k in enumerate(news)
+                if k in olds and old_hashes[olds[k]] != new_hashes[j]]
+
+    return (added, sorted(removed), modified)
+
+
+def changes(old, new):
+    """
+    :param old: A mapping object gives an old item
+    :param new: A mapping object gives a new item
+    :return: A mapping object, {<field>: [<old value>, <new value>]}
+
+    >>> changes(dict(a=1, b=2), dict(a=1, b=3, c=4))
+    {'b': [2, 3], 'c': [None, 4]}
+    """
+    keys = list(old) + [k for k in new if k not in old]
+    return dict((k, [old.get(k), new.get(k)]) for k in keys
+                if old.get(k) != new.get(k))
+
+
+def _modified(pairs, key):
+    """
+    :param pairs: An iterable yields tuples of (old, new) items
+    :param key: The name of the key of items
+    :return:
+        A list of mapping objects, [{key, old, new, changes}], of items have
+        some changes
+    """
+    res = []
+    for old, new in pairs:
+        chgs = changes(old, new)
+        if chgs:  # Hashes may differ even if values are equal, e.g. 1 and 1.0
+            res.append(dict(key=new.get(key), old=old, new=new,
+                            changes=chgs))
+
+    return res
+
+
+def digest(item):
+    """
+    :param item: An object can be serialized to JSON
+    :return: An int gives the hash of the content of `item`
+
+    >>> digest(dict(a=1, b=[2])) == digest(dict(b=[2], a=1))
+    True
+    """
+    return coltable.hash64(json.dumps(item, sort_keys=True).encode("utf-8"))
+
+
+def diff_items(olds, news, key="edit"):
+    """
+    :param olds: A list of mapping objects gives old items
+    :param news: A list of mapping objects gives new items
+    :param key: The name of the key of items
+
+    :return: A mapping object, {added, removed, modified}
+    """
+    (added, removed, modified) = match(
+        [o.get(key) for o in olds], [digest(o) for o in olds],
+        [n.get(key) for n in news], [digest(n) for n in news]
+    )
+
+    return dict(added=[news[j] for j in added],
+                removed=[olds[i] for i in removed],
+                modified=_modified(((olds[i], news[j]) for i, j in modified),
+                                   key))
+
+
+def diff_tables(old, new, key="edit"):
+    """
+    Rows are compared by hashes computed from columns of tables and only
+    rows differ are loaded.
+
+    :param old:
+        A :class:`nof.lib.coltable.ColumnarTable` object gives the old table
+    :param new:
+        A :class:`nof.lib.coltable.ColumnarTable` object gives the new table
+    :param key: The name of the column gives the key of rows
+
+    :return: A mapping object, {added, removed, modified}
+    """
+    cols = list(new.columns) + [c for c in old.columns if c not in new]
+    (added, removed, modified) = match(
+        old.values(key) if key in old else [None] * len(old),
+        old.row_hashes(cols).tolist(),
+        new.values(key) if key in new else [None] * len(new),
+        new.row_hashes(cols).tolist()
+    )
+
+    return dict(added=new.records(added), removed=old.records(removed),
+                modified=_modified(zip(old.records(i for i, _j in modified),
+                                       new.records(j for _i, j in modified)),
+                                   key))
+
+# vim:sw=4:ts=4:et:
@@ -10,18 +10,41 @@ r"""Parse fortios configuration
 """
 from __future__ import absolute_import
 
+import array
+import codecs
 import collections.abc
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import gc
 import hashlib
+import io
 import ipaddress
 import itertools
+import json
 import logging
+import marshal
 import os.path
+import os
 import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 
 import anyconfig
+import anyconfig_fortios_backend.fortios.loader as fortios_loader
+import anyconfig_fortios_backend.fortios.parser as fortios_parser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from .. import utils
+from . import netaddrs
 
 
 CNF_NAMES = ("system.*",
@@ -35,10 +58,70 @@ CNF_NAMES = ("system.*",
 METADATA_FILENAME = "metadata.json"
 ALL_FILENAME = "all.json"
 
+# Sub dir to save configs of global and each vdom separately.
+PARTITIONS_DIR = "vdoms"
+PARTITION_GLOBAL_FILENAME = "global.json"
+
+# Sub dir to keep the previous versions of files to compare them with.
+PREVIOUS_DIR = "previous"
+
 LOG = logging.getLogger(__name__)
 
 NET_MAX_PREFIX = 24
 
+# Min number of networks to summarize them packed into integers, and smaller
+# ones are summarized with ipaddress module as it's faster for them.
+SUMMARIZE_PACKED_MIN = 8
+
+# Status of network related data extracted from each config file, see
+# :func:`net_info_from_config_file`, and the version of manifest files keep
+# them.
+NET_INFO_STATUSES = (NI_OK, NI_LOAD_FAILED, NI_NO_GLOBAL) = (
+    "ok", "load_failed", "no_global"
+)
+NET_MANIFEST_VERSION = 2
+
+# Types of nodes and edges in network graphs.
+NODE_TYPES = (NT_FIREWALL, NT_NETWORK) = ("firewall", "network")
+NT_EDGE = "edge"
+
+# File extensions of NDJSON files.
+NDJSON_EXTS = (".ndjson", ".jsonl")
+
+# Encodings of 'show *configuration' outputs to try in this order, and the
+# size of the head of the file to detect its encoding.
+ENCODINGS = ("utf-8", "shift-jis")
+ENC_SNIFF_SIZE = 64 * 1024
+
+# 'show *configuration' outputs of fortigate should contain this line.
+GLOBAL_CONFIG_MARKER = "config system global"
+
+# The line of the hostname in the global config.
+HOSTNAME_LINE_RE = re.compile(r'^set hostname "?([^"]*)"?$')
+
+# Max number of threads to save parsed results as JSON files.
+DUMP_WORKERS = 8
+
+# Max number of lines of top-level config blocks parsed in a worker process
+# at once in parallel parse mode.
+PARSE_CHUNK_SIZE = 20000
+
+# Format version of parsed results cached, see :class:`BlockCache`.
+CACHE_VERSION = 2
+
+# Max size in bytes of parsed results cached in memory (0 disables it), and
+# the environment variable to override it.
+CACHE_MAX_SIZE = 256 * 1024 * 1024
+CACHE_MAX_SIZE_ENV = "NOF_CONFIGS_CACHE_SIZE"
+
+# Database file to keep parsed results of top-level config blocks by the
+# checksum of each block, and max time in seconds to keep ones not used.
+BLOCKS_DB_FILENAME = "blocks.sqlite"
+BLOCKS_MAX_AGE = 30 * 24 * 3600
+
+# Max number of blocks looked up in the database with a query at once.
+BLOCKS_QUERY_SIZE = 500
+
 
 def list_configs_from_config_data_0(cnf, filepath=None):
     """
@@ -62,9 +145,14 @@ def list_configs_from_config_data_0(cnf, filepath=None):
 
 def has_vdom(cnfs):
     """
-    :param cnfs: A list of fortios config objects, [{"config": ...}]
+    :param cnfs:
+        A list of fortios config objects, [{"config": ...}] or
+        :class:`ConfigIndex` object
     :return: True if vdoms are found in given configurations
     """
+    if isinstance(cnfs, ConfigIndex):
+        return cnfs.has_vdom
+
     return any(c for c in cnfs if c.get("config") == "vdom")
 
 
@@ -80,6 +168,22 @@ def is_regexp_obj(obj):
     return False
 
 
+def _vdom_partitions(cnfs):
+    """
+    :param cnfs: A list of fortios config objects with vdoms
+    :return: A tuple of (global configs, [(<vdom_name>, <vdom_configs>)])
+    """
+    gcnfs = [c["configs"] for c in cnfs
+             if c.get("config") == "global" and "configs" in c]
+    if not gcnfs or len(gcnfs) > 1:  # It should not happen.
+        raise ValueError("No or corrupt global configs were found")
+
+    css = [(c["edits"][0]["edit"], c["edits"][0]["configs"]) for c in cnfs
+           if c.get("edits") and c["edits"][0].get("configs")]
+
+    return (gcnfs[0], css)
+
+
 def list_configs_from_configs_data(cnfs, vdom=None):
     """
     Patterns:
@@ -100,23 +204,17 @@ def list_configs_from_configs_data(cnfs, vdom=None):
              "configs": [ ... <configs to retun> ...]
                 ...
 
-    :param cnfs: Configs data
+    :param cnfs: Configs data or :class:`ConfigIndex` object
     :param vdom: VDom name or regexp pattern
     """
+    if isinstance(cnfs, ConfigIndex):
+        return cnfs.list_configs(vdom=vdom)
+
     if not has_vdom(cnfs):
         return cnfs  # Just return `cnfs` as it is for single VDom cases
 
     # {"configs": [{"config": "global", "configs": [...]}, ...]}
-    gcnfs = [c["configs"] for c in cnfs
-             if c.get("config") == "global" and "configs" in c]
-    if not gcnfs or len(gcnfs) > 1:  # It should not happen.
-        raise ValueError("No or corrupt global configs were found")
-    gcnfs = gcnfs[0]
-
-    css = (  # (<vdom_name>, <vdom_configs>)
-        (c["edits"][0]["edit"], c["edits"][0]["configs"]) for c in cnfs
-        if c.get("edits") and c["edits"][0].get("configs")
-    )
+    (gcnfs, css) = _vdom_partitions(cnfs)
 
     if vdom is None or '*' in vdom:
         vdom = re.compile(r".*")
@@ -131,14 +229,155 @@ def list_configs_from_configs_data(cnfs, vdom=None):
     ))
 
 
+class ConfigIndex():
+    """
+    An index of fortios config objects built once from parsed configs to find
+    configs by name in O(1) instead of scanning the list of configs each time.
+
+    - configs: A list of configs of global and all vdoms, same as the result
+      of :func:`list_configs_from_configs_data` (vdom=None)
+    - vdoms: A list of the name of vdoms, same as :func:`list_vdom_names`
+    """
+    def __init__(self, cnfs):
+        """
+        :param cnfs: A list of fortios config objects, [{"config": ...}]
+        """
+        self.has_vdom = has_vdom(cnfs)
+        self.vdoms = list_vdom_names(cnfs)
+
+        if self.has_vdom:
+            (self.global_configs, self._partitions) = _vdom_partitions(cnfs)
+            self.configs = self.global_configs + list(
+                itertools.chain.from_iterable(cs for _v, cs
+                                              in self._partitions)
+            )
+        else:
+            self.global_configs = []
+            self._partitions = [("root", cnfs)]
+            self.configs = cnfs
+
+        # {<config_name>: [<index of config in self.configs>]}
+        self._positions = collections.OrderedDict()
+        for idx, cnf in enumerate(self.configs):
+            self._positions.setdefault(cnf.get("config"), []).append(idx)
+
+        self._by_name = collections.OrderedDict(
+            (name, [self.configs[i] for i in idxs])
+            for name, idxs in self._positions.items()
+        )
+        self._cache = dict()  # {(<kind>, <key>): [config]}
+
+    def __len__(self):
+        return len(self.configs)
+
+    def __iter__(self):
+        return iter(self.configs)
+
+    def vdom_configs(self, vdom):
+        """
+        :param vdom: VDom name
+        :return: A list of configs of the vdom `vdom` (global is not included)
+        """
+        return list(itertools.chain.from_iterable(
+            cs for v, cs in self._partitions if v == vdom
+        ))
+
+    def list_configs(self, vdom=None):
+        """
+        Same as :func:`list_configs_from_configs_data` but uses precomputed
+        vdom partitions.
+
+        :param vdom: VDom name or regexp pattern
+        """
+        if not self.has_vdom or vdom is None:
+            return self.configs
+
+        if is_regexp_obj(vdom):
+            return self.global_configs + list(itertools.chain.from_iterable(
+                cs for v, cs in self._partitions if vdom.match(v)
+            ))
+
+        if '*' in vdom:
+            return self.configs
+
+        return self.global_configs + self.vdom_configs(vdom)
+
+    def _collect(self, names):
+        """
+        :param names: An iterable yields the names of configs
+        :return: A list of configs having given names in original order
+        """
+        idxs = sorted(itertools.chain.from_iterable(self._positions[n]
+                                                    for n in names))
+        return [self.configs[i] for i in idxs]
+
+    def configs_by_prefix(self, prefix):
+        """
+        :param prefix: A str gives the prefix of the names of configs
+        :return: A list of configs or [] (not found)
+        """
+        key = ("prefix", prefix)
+        if key not in self._cache:
+            self._cache[key] = self._collect(
+                n for n in self._positions
+                if n is not None and n.startswith(prefix)
+            )
+
+        return self._cache[key]
+
+    def configs_by_regexp(self, regexp):
+        """
+        :param regexp: A str or re.Pattern object to match config names
+        :return: A list of configs or [] (not found)
+        """
+        key = ("regexp", getattr(regexp, "pattern", regexp))
+        if key not in self._cache:
+            if not is_regexp_obj(regexp):
+                regexp = re.compile(regexp)
+
+            self._cache[key] = self._collect(
+                n for n in self._positions if regexp.match(n or "")
+            )
+
+        return self._cache[key]
+
+    def configs_by_name(self, name_or_re):
+        """
+        :param name_or_re: Name of the configuration or re.Pattern object
+        :return: A list of configs or [] (not found)
+        """
+        if is_regexp_obj(name_or_re) or "*" in name_or_re:
+            return self.configs_by_regexp(name_or_re)
+
+        return self._by_name.get(name_or_re, [])
+
+    def edits_by_config_name(self, name_or_re):
+        """
+        :param name_or_re: Name of the configuration or re.Pattern object
+        :return: A list of edits or []
+        """
+        key = ("edits", getattr(name_or_re, "pattern", name_or_re))
+        if key not in self._cache:
+            ess = (c["edits"] for c in self.configs_by_name(name_or_re)
+                   if c.get("edits"))
+            self._cache[key] = list(itertools.chain.from_iterable(ess))
+
+        return self._cache[key]
+
+
 def configs_by_name(cnfs, name_or_re):
     """
-    :param cnfs: A list of fortios config objects, [{"config": ...}]
+    :param cnfs:
+        A list of fortios config objects, [{"config": ...}] or
+        :class:`ConfigIndex` object
     :param name_or_re: Name of the configuration or re.Pattern object to match
 
     :return: A list of configs or [] (not found)
     """
-    if "*" in name_or_re:
+    if isinstance(cnfs, ConfigIndex):
+        return cnfs.configs_by_name(name_or_re)
+
+    if not is_regexp_obj(name_or_re) and "*" in name_or_re:
         name_or_re = re.compile(name_or_re)
 
     if is_regexp_obj(name_or_re):
@@ -155,7 +394,7 @@ def config_by_name(fwcnfs, name_or_re):
        Even if there are more than one matched results were found, it returns
        the first item only.
 
-    :param fwcnfs: A list of fortios config objects
+    :param fwcnfs: A list of fortios config objects or :class:`ConfigIndex`
     :param name_or_re: Name of the configuration or re.Pattern object to match
 
     :return: A list of config or None
@@ -170,11 +409,14 @@ def config_by_name(fwcnfs, name_or_re):
 
 def edits_by_config_name(fwcnfs, name_or_re):
     """
-    :param fwcnfs: A list of fortios config objects
+    :param fwcnfs: A list of fortios config objects or :class:`ConfigIndex`
     :param name_or_re: Name of the configuration or re.Pattern object to match
 
     :return: A list of edits or []
     """
+    if isinstance(fwcnfs, ConfigIndex):
+        return fwcnfs.edits_by_config_name(name_or_re)
+
     ess = (c["edits"] for c in configs_by_name(fwcnfs, name_or_re)
            if c.get("edits"))
 
@@ -186,7 +428,7 @@ def hostname_from_configs(fwcnfs):
     Detect hostname of the fortigate node from its '[system ]global'
     configuration.
 
-    :param fwcnfs: A list of fortios config objects
+    :param fwcnfs: A list of fortios config objects or :class:`ConfigIndex`
     :raises:
         ValueError if given data does not contain global configuration to find
         hostname
@@ -200,29 +442,528 @@ def hostname_from_configs(fwcnfs):
     return sgcnf.get("hostname", '').lower() or None
 
 
-def parse_show_config(filepath):
+def _hostname_from_lines(lines):
+    """
+    :param lines: An iterable yields lines of 'show *configuration' outputs
+    :return: hostname str or None (if hostname was not found)
+
+    >>> _hostname_from_lines(["config system global",
+    ...                       "    config x", "        set hostname b",
+    ...                       "    end", '    set hostname "A"', "end"])
+    'a'
+    >>> _hostname_from_lines(["config system global", "end",
+    ...                       "set hostname a"]) is None
+    True
+    """
+    level = None  # Nesting level of configs in the global config.
+    for line in lines:
+        stripped = line.strip()
+        if level is None:
+            if stripped == GLOBAL_CONFIG_MARKER:
+                level = 0
+            continue
+
+        if stripped == "end":
+            if not level:  # The end of the global config.
+                return None
+            level -= 1
+        elif stripped.startswith("config "):
+            level += 1
+        elif not level:
+            match = HOSTNAME_LINE_RE.match(stripped)
+            if match:
+                return match.group(1).lower() or None
+
+    return None
+
+
+def hostname_from_show_config_file(filepath, encodings=ENCODINGS):
+    """
+    Find the hostname of the fortigate node from its 'show *configuration'
+    outputs quickly without parsing them, e.g. to know which files are of the
+    same host before parsing them. It may differ from the one found in the
+    parsed results by :func:`hostname_from_configs` in some corner cases.
+
+    :param filepath: File path contains 'show *configuration` outputs
+    :param encodings: Encodings to try
+    :return: hostname str or None (if hostname was not found)
+    :raises: IOError, OSError
+    """
+    return _parse_show_config_file(filepath, _hostname_from_lines,
+                                   encodings=encodings)
+
+
+def detect_encoding(head, encodings=ENCODINGS):
+    """
+    Detect the encoding of the content from its head.
+
+    :param head: Byte data of the head of the content
+    :param encodings: Encodings to try in this order
+
+    :return: The first one of `encodings` can decode `head`, or the last one
+
+    >>> detect_encoding(b"config system global")
+    'utf-8'
+    >>> detect_encoding(u"\u30db\u30b9\u30c8".encode("shift-jis"))
+    'shift-jis'
+    """
+    for enc in encodings:
+        try:
+            # The last multibyte character in `head` might be truncated.
+            codecs.getincrementaldecoder(enc)().decode(head, final=False)
+            return enc
+        except UnicodeDecodeError:
+            pass  # Try the next encoding...
+
+    return encodings[-1]
+
+
+def _lines_with_marker_itr(stream, marker, filepath=None):
+    """
+    Yield lines from `stream` and check if `marker` was found in them.
+
+    :param stream: A file or file like object
+    :param marker: A str must be found in some lines of `stream`
+    :raises: ValueError if `marker` was not found
+    """
+    found = False
+    for line in stream:
+        if not found and marker in line:
+            found = True
+        yield line
+
+    if not found:
+        raise ValueError("Not a fortigate's show *configuration output? "
+                         "{}".format(filepath))
+
+
+def split_show_config_itr(stream, comments=None):
+    """
+    Split 'show *configuration' outputs into top-level 'config ... end'
+    blocks. It follows the state transitions of the parser
+    (:func:`anyconfig_fortios_backend.fortios.parser.parse_show_config_itr`)
+    without making any config objects, so that each block yielded can be
+    parsed independently and the results are same as the one parsed at once.
+
+    Comment lines outside multiline values are not in blocks because the
+    parser collects all of them into a mapping object at the end.
+
+    :param stream: A file or file like object or an iterable yields lines
+    :param comments: A list to append comment lines found in `stream`
+    :return: An iterator yields a list of lines of each top-level block
+    """
+    stack = []  # [(<config or edit>, <name>)]
+    in_multiline_value = False
+    block = []
+
+    for line in stream:
+        if fortios_parser.EMPTY_RE.match(line):
+            continue
+
+        if in_multiline_value:
+            block.append(line)
+            if fortios_parser.SET_MULTILINE_VALUE_END_RE.match(line):
+                in_multiline_value = False
+            continue
+
+        if fortios_parser.COMMENT_RE.match(line):
+            if comments is not None:
+                comments.append(line)
+            continue
+
+        block.append(line)
+
+        matched = fortios_parser.CONFIG_START_RE.match(line)
+        if matched:
+            stack.append((fortios_parser.NT_CONFIG, matched.groups()[0]))
+            continue
+
+        if fortios_parser.EDIT_START_RE.match(line):
+            stack.append((fortios_parser.NT_EDIT, None))
+            continue
+
+        if fortios_parser.SET_MULTILINE_VALUE_START_RE.match(line):
+            in_multiline_value = True
+            continue
+
+        if fortios_parser.SET_OR_UNSET_LINE_RE.match(line) or not stack:
+            continue
+
+        if stack[-1][0] == fortios_parser.NT_CONFIG:
+            end_re = fortios_parser.CONFIG_END_RE
+        else:
+            end_re = fortios_parser.EDIT_END_RE
+
+        if end_re.match(line):
+            stack.pop()
+        elif (len(stack) > 1 and fortios_parser.CONFIG_END_RE.match(line) and
+              stack[-2] == (fortios_parser.NT_CONFIG, "vdom") and
+              stack[-1][0] == fortios_parser.NT_EDIT):
+            del stack[-2:]  # 'edit' in 'config vdom' ends without 'next'.
+        else:
+            continue
+
+        if not stack:  # A top-level block ends.
+            yield block
+            block = []
+
+    if block:
+        yield block  # Not closed or no blocks; the parser ignores them.
+
+
+def _chunks_itr(blocks, chunk_size=PARSE_CHUNK_SIZE):
+    """
+    :param blocks: An iterable yields a list of lines of each block
+    :param chunk_size: Max number of lines in a chunk
+    :return: An iterator yields lists of lines of consecutive blocks
+    """
+    chunk = []
+    for block in blocks:
+        chunk.extend(block)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def parse_lines(lines):
+    """
+    :param lines: A list of lines of 'show *configuration' outputs
+    :return: A list of configs (mapping objects) parsed
+    """
+    return fortios_loader.load(lines, container=dict)["configs"]
+
+
+def _parse_in_parallel(stream, workers=None, chunk_size=PARSE_CHUNK_SIZE):
+    """
+    Split 'show *configuration' outputs into chunks of top-level blocks,
+    parse them in worker processes and stitch the results in order.
+
+    :param stream: A file or file like object or an iterable yields lines
+    :param workers: Number of worker processes or None (number of CPUs)
+    :param chunk_size: Max number of lines parsed in a worker at once
+
+    :return: A mapping object, {"configs": [...]}
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    comments = []
+    chunks = _chunks_itr(split_show_config_itr(stream, comments),
+                         chunk_size=chunk_size)
+    configs = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as exe:
+        futs = collections.deque()
+        for chunk in chunks:
+            futs.append(exe.submit(parse_lines, chunk))
+            if len(futs) > workers * 2:  # Limit the chunks in memory.
+                configs.extend(futs.popleft().result())
+
+        while futs:
+            configs.extend(futs.popleft().result())
+
+    configs.extend(parse_lines(comments))  # [{"comments": ...}] or []
+
+    return dict(configs=configs)
+
+
+def parse_show_config(filepath, marker=None, encodings=ENCODINGS, workers=1,
+                      chunk_size=PARSE_CHUNK_SIZE):
     """
     Parse 'show full-configuration output and returns a list of parsed configs.
 
+    The file is read as a stream only once in most cases; its encoding is
+    detected from its head (:data:`ENC_SNIFF_SIZE` bytes), and lines decoded
+    are fed to the parser incrementally. It is parsed again with the next
+    encoding only if it fails to decode some lines after the head.
+
     :param filepath:
         a str or :class:`pathlib.Path` object represents file path contains
         'show full-configuration` or any other 'show ...' outputs
+    :param marker:
+        A str must be found in the file, e.g. :data:`GLOBAL_CONFIG_MARKER`,
+        checked while parsing it
+    :param encodings: Encodings to try
+    :param workers:
+        Number of worker processes to parse top-level config blocks in
+        parallel, or None or 0 (number of CPUs). It's parsed in the current
+        process if it's 1.
+    :param chunk_size: Max number of lines parsed in a worker at once
 
     :return:
         A list of configs (mapping objects) or [] (no data or something went
         wrong)
-    :raises: IOError, OSError
+    :raises: IOError, OSError, ValueError (`marker` was not found)
     """
-    for enc in ("utf-8", "shift-jis"):
-        try:
-            with open(filepath, encoding=enc) as inp:
-                return anyconfig.load(inp, ac_parser="fortios")
-        except UnicodeDecodeError:
-            pass  # Try the next encoding...
+    if workers == 1:
+        parse_fn = functools.partial(fortios_loader.load, container=dict)
+    else:
+        parse_fn = functools.partial(_parse_in_parallel, workers=workers,
+                                     chunk_size=chunk_size)
+
+    return _parse_show_config_file(filepath, parse_fn, marker=marker,
+                                   encodings=encodings)
+
+
+def _parse_show_config_file(filepath, parse_fn, marker=None,
+                            encodings=ENCODINGS):
+    """
+    Open and decode 'show *configuration' outputs and parse them with
+    `parse_fn`, see :func:`parse_show_config`.
+
+    :param filepath: File path contains 'show *configuration` outputs
+    :param parse_fn: A callable to parse an iterable yields lines decoded
+    :param marker: A str must be found in the file
+    :param encodings: Encodings to try
+
+    :return: The result of `parse_fn` or None (something went wrong)
+    :raises: IOError, OSError, ValueError (`marker` was not found)
+    """
+    bufsize = max(ENC_SNIFF_SIZE, io.DEFAULT_BUFFER_SIZE)
+
+    with open(filepath, "rb", buffering=bufsize) as binp:
+        head = binp.peek(ENC_SNIFF_SIZE)[:ENC_SNIFF_SIZE]
+        encs = encodings[encodings.index(detect_encoding(head, encodings)):]
+
+        for enc in encs:
+            binp.seek(0)
+            tinp = io.TextIOWrapper(binp, encoding=enc)
+            try:
+                inp = tinp
+                if marker:
+                    inp = _lines_with_marker_itr(tinp, marker, filepath)
+
+                return parse_fn(inp)
+            except UnicodeDecodeError:
+                LOG.warning("Failed to decode %s as %s", filepath, enc)
+            finally:
+                tinp.detach()  # Don't close `binp` with the wrapper.
 
     return None
 
 
+class BlockCache():
+    """
+    A cache of parsed results of top-level config blocks, keyed by the
+    checksum of the lines of each block, backed by a SQLite database file.
+    Parsed results are saved in JSON, not in any format may run code on load
+    as the file is in the upload dir.
+    """
+    def __init__(self, dbpath):
+        """
+        :param dbpath: Path to the database file
+        """
+        self.dbpath = dbpath
+        utils.ensure_dir_exists(dbpath)
+
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS blocks ("
+                         "checksum TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                         "used REAL NOT NULL)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Connect to the database.
+        """
+        conn = sqlite3.connect(self.dbpath, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def checksum(lines):
+        """
+        :param lines: A list of lines of a block
+        :return: A str gives the checksum of the block
+        """
+        hobj = hashlib.sha1("{}\n".format(CACHE_VERSION).encode("utf-8"))
+        for line in lines:
+            hobj.update(line.encode("utf-8"))
+
+        return hobj.hexdigest()
+
+    def _select_many(self, conn, columns, checksums):
+        """
+        :param conn: A connection to the database
+        :param columns: Columns to select, e.g. 'checksum, data'
+        :param checksums: A list of the checksums of blocks
+        :return: An iterator yields rows of blocks found
+        """
+        checksums = list(checksums)
+        for start in range(0, len(checksums), BLOCKS_QUERY_SIZE):
+            chunk = checksums[start:start + BLOCKS_QUERY_SIZE]
+            yield from conn.execute(
+                "SELECT {} FROM blocks WHERE checksum IN ({})"
+                "".format(columns, ", ".join("?" * len(chunk))), chunk
+            )
+
+    def contains_many(self, checksums):
+        """
+        :param checksums: A list of the checksums of blocks
+        :return: A set of the checksums of blocks cached
+        """
+        with self._connect() as conn:
+            return set(row[0] for row
+                       in self._select_many(conn, "checksum", set(checksums)))
+
+    def get_many(self, checksums):
+        """
+        :param checksums: A list of the checksums of blocks
+        :return:
+            A mapping object, {<checksum>: <list of configs>}, of blocks
+            cached and valid
+        """
+        res = dict()
+        with self._connect() as conn:
+            rows = list(self._select_many(conn, "checksum, data",
+                                          set(checksums)))
+            for checksum, data in rows:
+                try:
+                    res[checksum] = json.loads(data)
+                except ValueError:
+                    LOG.warning("Ignored the invalid block: %s", checksum)
+
+            conn.executemany("UPDATE blocks SET used = ? WHERE checksum = ?",
+                             [(time.time(), c) for c in res])
+        return res
+
+    def put_many(self, results):
+        """
+        :param results: A mapping object, {<checksum>: <list of configs>}
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO blocks (checksum, data, used) "
+                "VALUES (?, ?, ?)",
+                [(c, json.dumps(r, separators=(',', ':')), now)
+                 for c, r in results.items()]
+            )
+
+    def prune(self, max_age=BLOCKS_MAX_AGE):
+        """
+        Remove parsed results of blocks not used for `max_age` seconds.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM blocks WHERE used < ?",
+                         (time.time() - max_age, ))
+
+
+def _block_config_ids_itr(cnfs):
+    """
+    :param cnfs: A list of configs parsed from a top-level block
+    :return:
+        An iterator yields ids of `cnfs` and configs in them, e.g. configs of
+        vdoms, which may be saved separately
+    """
+    for cnf in cnfs:
+        yield id(cnf)
+        for ccnf in cnf.get("configs", []):
+            yield id(ccnf)
+        for edit in cnf.get("edits", []):
+            for ccnf in edit.get("configs", []):
+                yield id(ccnf)
+
+
+def _parse_blocks(blocks, workers=1):
+    """
+    :param blocks: A mapping object, {<checksum>: [line]}
+    :param workers:
+        Number of worker processes, see :func:`_parse_blocks_with_cache`
+    :return: A mapping object, {<checksum>: <list of configs>}
+    """
+    if workers == 1 or len(blocks) < 2:
+        return dict((c, parse_lines(b)) for c, b in blocks.items())
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or
+                                                None) as exe:
+        return dict(zip(blocks, exe.map(parse_lines, blocks.values())))
+
+
+def _parse_blocks_with_cache(stream, cache, workers=1):
+    """
+    Split 'show *configuration' outputs into top-level blocks and parse only
+    blocks not cached in `cache`.
+
+    :param stream: A file or file like object or an iterable yields lines
+    :param cache: A :class:`BlockCache` object
+    :param workers:
+        Number of worker processes or None or 0 (number of CPUs). Blocks are
+        parsed in the current process if it's 1.
+
+    :return:
+        A tuple of (a mapping object, {"configs": [...]}, a mapping object
+        gives the checksum of the block each config came from, {id(config):
+        checksum})
+    """
+    comments = []
+    checksums = []
+    blocks = collections.OrderedDict()  # {<checksum>: [line]}
+
+    for block in split_show_config_itr(stream, comments):
+        checksum = cache.checksum(block)
+        checksums.append(checksum)
+        blocks.setdefault(checksum, block)
+
+    cached = cache.contains_many(blocks)
+    parsed = _parse_blocks(collections.OrderedDict(
+        (c, b) for c, b in blocks.items() if c not in cached
+    ), workers=workers)
+    cache.put_many(parsed)
+    parsed.update(cache.get_many([c for c in blocks if c not in parsed]))
+
+    # Blocks removed from the cache, e.g. pruned in other processes, or
+    # invalid in it after they were checked are parsed again.
+    missing = collections.OrderedDict((c, b) for c, b in blocks.items()
+                                      if c not in parsed)
+    if missing:
+        reparsed = _parse_blocks(missing, workers=workers)
+        cache.put_many(reparsed)
+        parsed.update(reparsed)
+
+    configs = []
+    block_ids = dict()
+    for checksum in checksums:
+        cnfs = parsed[checksum]
+        configs.extend(cnfs)
+        block_ids.update((i, checksum) for i in _block_config_ids_itr(cnfs))
+
+    configs.extend(parse_lines(comments))  # [{"comments": ...}] or []
+
+    return (dict(configs=configs), block_ids)
+
+
+def parse_show_config_incrementally(filepath, cache, marker=None,
+                                    encodings=ENCODINGS, workers=1):
+    """
+    Similar to :func:`parse_show_config` but parse only top-level config
+    blocks changed since the last time; parsed results of blocks are kept in
+    `cache` and reused if the same blocks are found.
+
+    :param filepath: File path contains 'show *configuration` outputs
+    :param cache: A :class:`BlockCache` object
+    :param marker: A str must be found in the file
+    :param encodings: Encodings to try
+    :param workers: Number of worker processes to parse blocks changed
+
+    :return:
+        A tuple of (a mapping object, {"configs": [...]}, a mapping object
+        gives the checksum of the block each config came from) or (None,
+        None) (something went wrong)
+    :raises: IOError, OSError, ValueError (`marker` was not found)
+    """
+    parse_fn = functools.partial(_parse_blocks_with_cache, cache=cache,
+                                 workers=workers)
+    res = _parse_show_config_file(filepath, parse_fn, marker=marker,
+                                  encodings=encodings)
+
+    return (None, None) if res is None else res
+
+
 def config_filename(name, ext="json"):
     """
     >>> config_filename("system global")
@@ -253,6 +994,9 @@ def list_vdom_names(cnfs):
 
     :return: A list of the name of VDoms
     """
+    if isinstance(cnfs, ConfigIndex):
+        return cnfs.vdoms
+
     if not has_vdom(cnfs):
         return ["root"]
 
@@ -268,7 +1012,7 @@ def checksum(filepath, hash_fn=hashlib.md5):
     """
     Compute the checksum of given file, `filepath`
     """
-    return hash_fn(open(filepath).read().encode("utf-8")).hexdigest()
+    return utils.checksum_file(filepath, hash_fn=hash_fn)
 
 
 def unknown_hostname(inpath):
@@ -278,6 +1022,336 @@ def unknown_hostname(inpath):
     return "unknown-{}".format(checksum(inpath))
 
 
+def dump_file(obj, filepath):
+    """
+    Serialize `obj` in JSON and save it to `filepath` atomically.
+
+    :param obj: An object to save
+    :param filepath: Path to the file to save `obj`
+
+    :return: A mapping object, {filename, size (bytes), elapsed (sec)}
+    """
+    start = time.perf_counter()
+    content = anyconfig.dumps(obj, ac_parser="json").encode("utf-8")
+    size = utils.save_file_atomically(content, filepath)
+
+    return dict(filename=os.path.basename(filepath), size=size,
+                elapsed=round(time.perf_counter() - start, 6))
+
+
+def dump_files(objs, outdir, workers=DUMP_WORKERS):
+    """
+    Save objects as JSON files under `outdir` concurrently.
+
+    :param objs: A mapping object, {<filename>: <object to save>}
+    :param outdir: Dir to save files
+    :param workers: Max number of threads to save files
+
+    :return:
+        A list of mapping objects, [{filename, size, elapsed}], and filename
+        is relative to `outdir`
+    :raises: IOError, OSError
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as exe:
+        futs = [(fname,
+                 exe.submit(dump_file, obj, os.path.join(outdir, fname)))
+                for fname, obj in objs.items()]
+
+        return [dict(f.result(), filename=fname) for fname, f in futs]
+
+
+def _section_sources(fwcnfs, cnames=CNF_NAMES):
+    """
+    :param fwcnfs: A list of fortios config objects or :class:`ConfigIndex`
+    :param cnames: Names or regexp patterns of configs to save separately
+
+    :return: A mapping object, {<filename>: [config to save in the file]}
+    """
+    cnfs = collections.OrderedDict()  # {<filename>: {id(<config>): config}}
+    for name in cnames:
+        for xcnf in configs_by_name(fwcnfs, name):
+            fname = config_filename(xcnf["config"])
+            cnfs.setdefault(fname, collections.OrderedDict())[id(xcnf)] = xcnf
+
+    return collections.OrderedDict((f, list(cs.values()))
+                                   for f, cs in cnfs.items())
+
+
+def configs_fingerprint(cnfs, block_ids):
+    """
+    Compute the fingerprint of configs from the checksums of the blocks they
+    came from; it does not change if these blocks were not changed.
+
+    :param cnfs: A list of configs
+    :param block_ids:
+        A mapping object gives the checksum of the block each config came
+        from, see :func:`parse_show_config_incrementally`
+
+    :return: A str gives the fingerprint or None if it's not available
+    """
+    checksums = [block_ids.get(id(c)) for c in cnfs]
+    if None in checksums:
+        return None
+
+    return hashlib.sha1("\n".join(checksums).encode("utf-8")).hexdigest()
+
+
+def section_configs(fwcnfs, cnames=CNF_NAMES):
+    """
+    Collect configs to save separately. Configs having the same name, e.g.
+    'firewall address' in some vdoms, are saved in a file together.
+
+    :param fwcnfs: A list of fortios config objects or :class:`ConfigIndex`
+    :param cnames: Names or regexp patterns of configs to save separately
+
+    :return: A mapping object, {<filename>: <object to save>}
+    """
+    res = collections.OrderedDict()
+    for fname, xcnfs in _section_sources(fwcnfs, cnames).items():
+        if len(xcnfs) == 1:
+            res[fname] = xcnfs[0].get("edits", xcnfs[0])  # edits if avail.
+        else:
+            res[fname] = list(itertools.chain.from_iterable(
+                c.get("edits", [c]) for c in xcnfs
+            ))
+
+    return res
+
+
+def partition_configs(fwcnfs):
+    """
+    Collect configs of global and each vdom to save separately.
+
+    :param fwcnfs: :class:`ConfigIndex` object of configs with vdoms
+
+    :return:
+        A tuple of (index, {<filename>: <object to save>}), and index is a
+        mapping object, {global: <filename>, vdoms: [{name, filename}]}
+    """
+    vcnfs = collections.OrderedDict()  # {<vdom_name>: [config]}
+    for vdom, cnfs in fwcnfs._partitions:  # pylint: disable=protected-access
+        vcnfs.setdefault(vdom, []).extend(cnfs)
+
+    gfname = os.path.join(PARTITIONS_DIR, PARTITION_GLOBAL_FILENAME)
+    index = {"global": gfname, "vdoms": []}
+    objs = collections.OrderedDict()
+    objs[gfname] = dict(configs=fwcnfs.global_configs)
+
+    # Vdom names may not be safe as filenames.
+    for idx, (vdom, cnfs) in enumerate(vcnfs.items()):
+        fname = os.path.join(PARTITIONS_DIR, "{}.json".format(idx))
+        index["vdoms"].append(dict(name=vdom, filename=fname))
+        objs[fname] = dict(configs=cnfs)
+
+    return (index, objs)
+
+
+def _fingerprints(objs, sources, block_ids):
+    """
+    :param objs: A mapping object, {<filename>: <object to save>}
+    :param sources:
+        A mapping object gives configs each object came from, {<filename>:
+        [config]}
+    :param block_ids: See :func:`configs_fingerprint`
+
+    :return: A mapping object, {<filename>: <fingerprint>}
+    """
+    res = dict()
+    for fname in objs:
+        if fname in sources:
+            fprint = configs_fingerprint(sources[fname], block_ids)
+            if fprint:
+                res[fname] = fprint
+
+    return res
+
+
+def _files_not_changed(houtdir, fprints):
+    """
+    :param houtdir: Dir parsed results of the host were saved
+    :param fprints: A mapping object, {<filename>: <fingerprint>}
+
+    :return:
+        A mapping object, {<filename>: <stat of the file>}, gives files saved
+        last time from the same configs
+    """
+    mpath = os.path.join(houtdir, METADATA_FILENAME)
+    try:
+        metadata = anyconfig.load(mpath) if os.path.exists(mpath) else {}
+    except (IOError, OSError, ValueError) as exc:
+        LOG.warning("Ignored the invalid metadata: %s, exc=%r", mpath, exc)
+        return {}
+
+    pfprints = metadata.get("fingerprints") or {}
+    stats = dict((f["filename"], f) for f in metadata.get("files", []))
+
+    return dict((fname, stats[fname]) for fname, fprint in fprints.items()
+                if pfprints.get(fname) == fprint and fname in stats and
+                os.path.exists(os.path.join(houtdir, fname)))
+
+
+def keep_previous_files(houtdir, filenames, inpath=None):
+    """
+    Copy files in `houtdir` to <houtdir>/previous/ to keep the previous
+    versions of them before these are overwritten. Files kept last time are
+    removed if these files are not found.
+
+    Nothing is done if the metadata file in `houtdir` says the files were
+    saved from the same data `inpath`, e.g. it's processed again.
+
+    :param houtdir: Dir to save parsed results of a host
+    :param filenames: Names of files to keep
+    :param inpath: Path of the file gives parsed results to save
+    :return: A list of names of files kept
+    """
+    mpath = os.path.join(houtdir, METADATA_FILENAME)
+    if not os.path.exists(mpath):
+        return []
+
+    if inpath:
+        try:
+            with open(mpath) as inp:
+                if json.load(inp).get("origina_data") == inpath:
+                    return []
+        except (IOError, OSError, ValueError, AttributeError):
+            pass
+
+    pdir = os.path.join(houtdir, PREVIOUS_DIR)
+    os.makedirs(pdir, exist_ok=True)
+
+    kept = []
+    for fname in filenames:
+        (src, dst) = (os.path.join(houtdir, fname),
+                      os.path.join(pdir, fname))
+        if not os.path.exists(src):
+            if os.path.exists(dst):
+                os.remove(dst)
+            continue
+
+        (fd, tmp) = tempfile.mkstemp(dir=pdir, prefix=".{}.".format(fname))
+        os.close(fd)
+        try:
+            shutil.copy2(src, tmp)  # Keep mtime to check the stat later.
+            os.replace(tmp, dst)
+        except (IOError, OSError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        kept.append(fname)
+
+    return kept
+
+
+def _resolve_hostname(fwcnfs, inpath):
+    """
+    :param fwcnfs: A :class:`ConfigIndex` object
+    :param inpath: Path of the file gives configs `fwcnfs`
+    :return: Hostname or None if it's not set
+    """
+    try:
+        return hostname_from_configs(fwcnfs)
+    except ValueError as exc:
+        LOG.warning("%r: %s\nCould not resovle hostname", exc, inpath)
+        return unknown_hostname(inpath)
+
+
+def hostname_from_config_data(data, inpath):
+    """
+    Resolve the hostname of the fortigate node as :func:`save_configs` does.
+
+    :param data: A mapping object contains parsed results, {"configs": [...]}
+    :param inpath: Path of the file gives parsed results `data`
+
+    :return: Hostname or None if it's not set
+    :raises: ValueError, TypeError
+    """
+    cnfs = list_configs_from_config_data_0(data, filepath=inpath)
+    return _resolve_hostname(ConfigIndex(cnfs), inpath)
+
+
+def save_configs(data, inpath, outdir, cnames=CNF_NAMES,
+                 workers=DUMP_WORKERS, block_ids=None, keep_previous=None,
+                 hostname=None):
+    """
+    Save parsed results `data` as JSON files under <outdir>/<hostname>/.
+
+    Each object is serialized only once and files are written concurrently.
+    The size and the time to save each file are saved in the metadata file.
+    Configs of global and each vdom are also saved separately under
+    <outdir>/<hostname>/vdoms/ if there are vdoms, and the index of them are
+    saved in the metadata file, to load some of them later.
+
+    If `block_ids` is given, the fingerprint of the configs saved in each file
+    is also saved in the metadata file, and files saved last time from the
+    same configs are not saved again.
+
+    :param data: A mapping object contains parsed results, {"configs": [...]}
+    :param inpath: Path of the file gives parsed results `data`
+    :param outdir: Dir to save parsed results
+    :param cnames: Names or regexp patterns of configs to save separately
+    :param workers: Max number of threads to save files
+    :param block_ids:
+        A mapping object gives the checksum of the block each config came
+        from, see :func:`parse_show_config_incrementally`
+    :param keep_previous:
+        Names of files in <outdir>/<hostname>/ to keep the previous versions
+        of them, see :func:`keep_previous_files`
+    :param hostname:
+        Hostname of the fortigate node resolved from `data` already, see
+        :func:`hostname_from_config_data`
+
+    :return: A tuple of (hostname, path of all.json) or (None, None)
+    :raises: IOError, OSError, ValueError, TypeError
+    """
+    cnfs = list_configs_from_config_data_0(data, filepath=inpath)
+    fwcnfs = ConfigIndex(cnfs)
+    vdoms = fwcnfs.vdoms
+
+    if hostname is None:
+        hostname = _resolve_hostname(fwcnfs, inpath)
+
+    if not hostname:  # It should have this in most cases.
+        return (None, None)
+
+    houtdir = os.path.join(outdir, hostname)
+    if keep_previous:
+        keep_previous_files(houtdir, keep_previous, inpath=inpath)
+
+    objs = collections.OrderedDict()
+    objs[ALL_FILENAME] = data
+    objs.update(section_configs(fwcnfs, cnames))
+
+    pindex = None
+    if fwcnfs.has_vdom:
+        (pindex, pobjs) = partition_configs(fwcnfs)
+        objs.update(pobjs)
+
+    (fprints, unchanged) = (None, {})
+    if block_ids is not None:
+        sources = _section_sources(fwcnfs, cnames)
+        if fwcnfs.has_vdom:
+            sources.update((f, o["configs"]) for f, o in pobjs.items())
+
+        fprints = _fingerprints(objs, sources, block_ids)
+        unchanged = _files_not_changed(houtdir, fprints)
+
+    stats = dict((f["filename"], f) for f in dump_files(
+        collections.OrderedDict((f, o) for f, o in objs.items()
+                                if f not in unchanged),
+        houtdir, workers=workers
+    ))
+    stats.update(unchanged)
+    files = [stats[f] for f in objs]
+
+    dump_file(dict(timestamp=timestamp(), hostname=hostname, vdoms=vdoms,
+                   origina_data=inpath, files=files, partitions=pindex,
+                   fingerprints=fprints),
+              os.path.join(houtdir, METADATA_FILENAME))
+
+    return (hostname, os.path.join(houtdir, ALL_FILENAME))
+
+
 def parse_show_config_and_dump(inpath, outpath, cnames=CNF_NAMES):
     """
     Similiar to the above :func:`parse_show_config` but save results as JSON
@@ -293,52 +1367,159 @@ def parse_show_config_and_dump(inpath, outpath, cnames=CNF_NAMES):
     """
     data = parse_show_config(inpath)  # {"configs": [...]}
 
-    utils.ensure_dir_exists(outpath)
-    anyconfig.dump(data, outpath)
+    (_hostname, apath) = save_configs(data, inpath, os.path.dirname(outpath),
+                                      cnames=cnames)
+    if apath is None:
+        dump_file(data, outpath)
+    else:
+        # Link or copy the file already saved instead of saving it again.
+        utils.ensure_dir_exists(outpath)
+        if os.path.exists(outpath):
+            os.remove(outpath)
+        try:
+            os.link(apath, outpath)
+        except OSError:
+            shutil.copyfile(apath, outpath)
 
-    cnfs = list_configs_from_config_data_0(data, filepath=inpath)
-    vdoms = list_vdom_names(cnfs)
+    return data
+
+
+def group_config_path(filepath, group):
+    """
+    Compute the path of the group config file.
+
+    :param filepath: (JSON) file path contains parsed results of group
+    """
+    return os.path.join(os.path.dirname(filepath), group + ".json")
 
-    fwcnfs = list_configs_from_configs_data(cnfs)
+
+_CACHE = collections.OrderedDict()  # {<path>: (<stat>, <serialized data>)}
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache_max_size():
+    """
+    :return: Max size in bytes of parsed results cached in memory
+    """
+    size = os.environ.get(CACHE_MAX_SIZE_ENV, "")
     try:
-        hostname = hostname_from_configs(fwcnfs)
-    except ValueError as exc:
-        LOG.warning("%r: %s\nCould not resovle hostname", exc, inpath)
-        hostname = "unknown-{!s}".format(checksum(inpath))
+        return int(size)
+    except ValueError:
+        return CACHE_MAX_SIZE
 
-    if hostname:  # It should have this in most cases.
-        outdir = os.path.join(os.path.dirname(outpath), hostname)
 
-        anyconfig.dump(dict(timestamp=timestamp(), hostname=hostname,
-                            vdoms=vdoms, origina_data=inpath),
-                       os.path.join(outdir, METADATA_FILENAME))
-        anyconfig.dump(data, os.path.join(outdir, ALL_FILENAME))
+def clear_cache():
+    """Clear the in-process cache of parsed results.
+    """
+    with _CACHE_LOCK:
+        _CACHE.clear()
 
-        for name in cnames:
-            xcnfs = configs_by_name(fwcnfs, name)
 
-            for xcnf in xcnfs:
-                fname = config_filename(xcnf["config"])
-                opath = os.path.join(outdir, fname)
-                odata = xcnf.get("edits", xcnf)  # only dump edits if avail.
+@contextlib.contextmanager
+def _gc_paused():
+    """
+    Pause the cyclic garbage collector while loading large data consist of
+    lots of small containers, that the collector runs repeatedly on.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
-                anyconfig.dump(odata, opath)
 
-    return data
+def _load_json_file(filepath):
+    """
+    Load data from the JSON file `filepath` with orjson if it's available as
+    it's faster than json.
+
+    :param filepath: JSON file path
+    :return: Data loaded
+    :raises: IOError, OSError, ValueError
+    """
+    if orjson is None:
+        return anyconfig.load(filepath)
 
+    with open(filepath, 'rb') as inp:
+        content = inp.read()
 
-def group_config_path(filepath, group):
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:  # e.g. NaN, which json accepts.
+        return json.loads(content)
+
+
+def _cache_data(filepath, stat, data):
     """
-    Compute the path of the group config file.
+    Keep `data` in the in-process cache in serialized form and evict the least
+    recently used ones if the total size exceeds the max size.
 
-    :param filepath: (JSON) file path contains parsed results of group
+    :param filepath: (JSON) file path contains parsed results
+    :param stat: A tuple of (mtime (ns), size) of `filepath`
+    :param data: Data loaded from `filepath`
     """
-    return os.path.join(os.path.dirname(filepath), group + ".json")
+    max_size = _cache_max_size()
+    content = marshal.dumps(data) if max_size > 0 else b''
+
+    with _CACHE_LOCK:
+        _CACHE.pop(filepath, None)
+        if not content or len(content) > max_size:
+            return
+
+        _CACHE[filepath] = (stat, content)
+        size = sum(len(c) for _s, c in _CACHE.values())
+        while size > max_size:
+            (_path, (_stat, evicted)) = _CACHE.popitem(last=False)
+            size -= len(evicted)
+
+
+def load_data_with_cache(filepath, cache=True):
+    """
+    Load data from the JSON file `filepath` with the in-process cache.
 
+    Data are kept in the cache in serialized (marshal) form, that is faster to
+    load than JSON, and deserialized on each load so that callers get their
+    own copies of them and may modify them freely. The JSON file is always the
+    source of truth and the cache is refreshed if its mtime or size changed.
 
-def load_configs(filepath, group=None):
+    :param filepath: (JSON) file path contains parsed results
+    :param cache: Do not use the cache and just load `filepath` if False
+
+    :return: Data loaded
+    :raises: IOError, OSError, ValueError
+    """
+    if not cache:
+        return _load_json_file(filepath)
+
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    stat = (stat.st_mtime_ns, stat.st_size)
+
+    with _CACHE_LOCK:
+        entry = _CACHE.get(filepath)
+        if entry is not None and entry[0] == stat:
+            _CACHE.move_to_end(filepath)
+        else:
+            entry = None
+
+    with _gc_paused():
+        if entry is not None:
+            return marshal.loads(entry[1])
+
+        data = _load_json_file(filepath)
+
+    _cache_data(filepath, stat, data)
+    return data
+
+
+def load_configs(filepath, group=None, cache=True):
     """
     :param filepath: (JSON) file path contains parsed results
+    :param group: Group name of configs to load, see :func:`save_configs`
+    :param cache: Use caches of parsed results, see
+        :func:`load_data_with_cache`
     :raises: ValueError, TypeError
     """
     if group is not None:
@@ -348,7 +1529,7 @@ def load_configs(filepath, group=None):
         raise IOError("File not found: {}".format(filepath))
 
     try:
-        cnf = anyconfig.load(filepath)
+        cnf = load_data_with_cache(filepath, cache=cache)
         return list_configs_from_config_data_0(cnf, filepath)
 
     except (IOError, OSError, ValueError) as exc:
@@ -356,6 +1537,65 @@ def load_configs(filepath, group=None):
                          "Ignore it.".format(exc, filepath))
 
 
+def select_vdom_names(vdoms, vdom=None):
+    """
+    :param vdoms: A list of the name of vdoms
+    :param vdom: VDom name or regexp pattern, see
+        :func:`list_configs_from_configs_data`
+
+    :return: A list of the name of vdoms selected
+
+    >>> select_vdom_names(["root", "ro", "test"], "ro")
+    ['ro']
+    >>> select_vdom_names(["root", "ro", "test"], re.compile("ro.*"))
+    ['root', 'ro']
+    >>> select_vdom_names(["root", "ro", "test"], "*")
+    ['root', 'ro', 'test']
+    """
+    if vdom is None:
+        return vdoms
+
+    if is_regexp_obj(vdom):
+        return [v for v in vdoms if vdom.match(v)]
+
+    if '*' in vdom:
+        return vdoms
+
+    return [v for v in vdoms if v == vdom]
+
+
+def load_configs_by_vdom(hostdir, vdom=None, cache=True):
+    """
+    Load configs of global and given vdoms only from the files saved
+    separately by :func:`save_configs`. All configs are loaded from all.json
+    if there are no such files, e.g. no vdoms.
+
+    :param hostdir: Dir in which parsed results of the host were saved
+    :param vdom: VDom name or regexp pattern
+    :param cache: Use caches of parsed results, see
+        :func:`load_data_with_cache`
+
+    :return:
+        Same as :func:`list_configs_from_configs_data` with configs loaded
+        from all.json
+    :raises: IOError, OSError, ValueError, TypeError
+    """
+    metadata = load_data_with_cache(os.path.join(hostdir, METADATA_FILENAME),
+                                    cache=cache)
+    pindex = metadata.get("partitions")
+    if not pindex:
+        cnfs = load_configs(os.path.join(hostdir, ALL_FILENAME), cache=cache)
+        return list_configs_from_configs_data(ConfigIndex(cnfs), vdom=vdom)
+
+    fnames = dict((v["name"], v["filename"]) for v in pindex["vdoms"])
+    vdoms = select_vdom_names(list(fnames), vdom)
+
+    return list(itertools.chain.from_iterable(
+        load_configs(os.path.join(hostdir, fname), cache=cache)
+        for fname in [pindex["global"]] + [fnames[v] for v in vdoms]
+    ))
+
+
 def network_prefix(net_addr):
     """
     :param net_addr: IPv*Network object
@@ -364,13 +1604,15 @@ def network_prefix(net_addr):
     >>> network_prefix(net)
     24
     """
-    return int(net_addr.compressed.split('/')[-1])
+    return net_addr.prefixlen
 
 
 def summarize_networks(*net_addrs, prefix=None):
     """
     Degenerate and summarize given network addresses. For example,
 
+    .. seealso:: :meth:`nof.lib.netaddrs.PackedNetworks.summarize_batch`
+
     >>> net1 = ipaddress.ip_network("192.168.122.0/25")
     >>> net2 = ipaddress.ip_network("192.168.122.128/25")
     >>> net3 = ipaddress.ip_network("10.1.0.0/16")
@@ -381,6 +1623,13 @@ def summarize_networks(*net_addrs, prefix=None):
     >>> summarize_networks(net1, net3)
     >>> summarize_networks(net1, net3, prefix=1)
     """
+    if len(set(n.version for n in net_addrs)) != 1:
+        return None
+
+    if len(net_addrs) >= SUMMARIZE_PACKED_MIN:
+        pnets = netaddrs.PackedNetworks.from_networks(list(net_addrs))
+        return pnets.summarize(prefix=prefix)
+
     if prefix is None:
         prefix_len = min(network_prefix(n) for n in net_addrs)
 
@@ -399,7 +1648,7 @@ def summarize_networks(*net_addrs, prefix=None):
 
 def interface_ip_addrs_from_configs(fwcnfs):
     """
-    :param fwcnfs: A list of fortios config objects
+    :param fwcnfs: A list of fortios config objects or :class:`ConfigIndex`
     :return: A list of interface IP addresses (IPv*Address objects)
     """
     for iface in edits_by_config_name(fwcnfs, "system interface"):
@@ -415,9 +1664,33 @@ def interface_ip_addrs_from_configs(fwcnfs):
             LOG.warning("Found invalid IP address/mask: %s/%s", *ip_netmask)
 
 
+def _firewall_network(subnet, max_prefix=NET_MAX_PREFIX):
+    """
+    :param subnet: A pair of (network_or_host_ip_addr, netmask)
+    :param max_prefix: Max prefix for networks
+    :return: A IPv*Network object or None if it's not a network
+    """
+    try:
+        maybe_net = ipaddress.ip_network("{}/{}".format(*subnet))
+        if maybe_net.num_addresses > 1:  # It's network.
+            # Replace it with its supernet (larger network segment).
+            if network_prefix(maybe_net) > max_prefix:
+                maybe_net = maybe_net.supernet(new_prefix=max_prefix)
+
+            return maybe_net
+    except ValueError:  # Invalid IP address, etc.
+        LOG.warning("Found invalid address/mask: %r", subnet)
+
+    return None
+
+
 def firewall_networks_from_configs(fwcnfs, max_prefix=NET_MAX_PREFIX):
     """
-    :param fwcnfs: A list of fortios config objects
+    Subnets are packed into integers and networks having prefixes longer
+    than `max_prefix` are replaced with their supernets (larger network
+    segments) in batch, see :class:`nof.lib.netaddrs.PackedNetworks`.
+
+    :param fwcnfs: A list of fortios config objects or :class:`ConfigIndex`
     :param max_prefix: Max prefix for networks
 
     :return: A list of network addresses (IPv*Network objects)
@@ -429,59 +1702,236 @@ def firewall_networks_from_configs(fwcnfs, max_prefix=NET_MAX_PREFIX):
     if not edits:
         raise ValueError(hostname_from_configs(fwcnfs))
 
-    for edit in edits_by_config_name(fwcnfs, "firewall address"):
-        if "subnet" not in edit:
-            continue  # It is not subnet and may be iprange, etc.
+    # It is not subnet and may be iprange, etc. if it does not have subnet.
+    subnets = [e["subnet"] for e in edits if "subnet" in e]
+    (pnets, errs) = netaddrs.PackedNetworks.from_subnets(subnets)
 
-        subnet = edit["subnet"]  # (network_or_host_ip_addr, netmask)
-        try:
-            maybe_net = ipaddress.ip_network("{}/{}".format(*subnet))
-            if maybe_net.num_addresses > 1:  # It's network.
-                # Replace it with its supernet (larger network segment).
-                if network_prefix(maybe_net) > max_prefix:
-                    maybe_net = maybe_net.supernet(new_prefix=max_prefix)
+    # Subnets could not be packed, e.g. these having host masks, are
+    # processed in the same way as before to keep the results same.
+    errs = set(errs)
+    res = dict((i, _firewall_network(subnets[i], max_prefix)) for i in errs)
 
-                yield maybe_net
-        except ValueError:  # Invalid IP address, etc.
-            LOG.warning("Found invalid address/mask: %s/%s", *subnet)
+    idxs = [i for i in range(len(subnets)) if i not in errs]
+    nets = [(i, p) for i, p in enumerate(pnets.prefixes.tolist()
+                                         if pnets.vectorized
+                                         else pnets.prefixes)
+            if p < pnets.width]  # Networks, not hosts.
+    res.update(zip((idxs[i] for i, _p in nets),
+                   pnets.take([i for i, _p in nets])
+                   .cap_prefix(max_prefix).to_networks()))
+
+    return [res[i] for i in sorted(res) if res[i] is not None]
 
 
-def collect_net_info_from_files(config_files, max_prefix=NET_MAX_PREFIX):
+def net_info_from_config_file(cpath, max_prefix=NET_MAX_PREFIX):
+    """
+    Extract network related data from a parsed fortigate config file. It
+    should be picklable to run in worker processes.
+
+    :param cpath: Path to the fortios' config file parsed
+    :param max_prefix: Max prefix for networks
+
+    :return:
+        A tuple of (status, hostname, [interface address], [network], error)
+        where status is one of :data:`NET_INFO_STATUSES`, hostname may be
+        None if it's not set, and addresses and networks are IPv*Address and
+        IPv*Network objects.
+
+        - NI_OK: error is None, or an exception object if no firewall
+          addresses were found, to raise it later
+        - NI_LOAD_FAILED: The file could not be loaded; addresses and
+          networks are None and error is the error message
+        - NI_NO_GLOBAL: No system global configs were found; addresses and
+          networks are None and error is the error message
+    """
+    try:
+        fwcnfs = ConfigIndex(load_configs(cpath))
+    except (ValueError, TypeError) as exc:
+        return (NI_LOAD_FAILED, None, None, None, str(exc))
+
+    try:
+        name = hostname_from_configs(fwcnfs)
+    except ValueError as exc:
+        return (NI_NO_GLOBAL, None, None, None,
+                "{!r}: {}".format(exc, cpath))
+
+    addrs = list(interface_ip_addrs_from_configs(fwcnfs))
+    try:
+        nets = list(firewall_networks_from_configs(fwcnfs, max_prefix))
+    except ValueError as exc:  # No firewall addresses.
+        return (NI_OK, name, addrs, [], exc)
+
+    return (NI_OK, name, addrs, nets, None)
+
+
+def _net_infos_itr(config_files, max_prefix=NET_MAX_PREFIX, workers=1):
+    """
+    :param config_files: A list of fortios' config files parsed
+    :param max_prefix: Max prefix for networks
+    :param workers:
+        Number of worker processes or None or 0 (number of CPUs). Files are
+        processed in the current process if it's 1.
+
+    :return:
+        An iterator yields the results of :func:`net_info_from_config_file`
+        in order of `config_files`
+    """
+    extract_fn = functools.partial(net_info_from_config_file,
+                                   max_prefix=max_prefix)
+    if workers == 1:
+        for cpath in config_files:
+            yield extract_fn(cpath)
+        return
+
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as exe:
+        for res in exe.map(extract_fn, config_files):
+            yield res
+
+
+def _net_info_to_entry(info):
+    """
+    :param info: A tuple, see :func:`net_info_from_config_file`
+    :return: A mapping object can be saved in manifest files
+    """
+    (status, name, addrs, nets, err) = info
+    return dict(status=status, name=name,
+                addrs=None if addrs is None else [str(a) for a in addrs],
+                nets=None if nets is None else [str(n) for n in nets],
+                error=None if err is None else str(err),
+                raise_error=isinstance(err, Exception))
+
+
+def _net_info_from_entry(entry):
+    """
+    :param entry: A mapping object made by :func:`_net_info_to_entry`
+    :return: A tuple, see :func:`net_info_from_config_file`
+    """
+    (addrs, nets, err) = (entry["addrs"], entry["nets"], entry["error"])
+    if addrs is not None:
+        addrs = [ipaddress.ip_address(a) for a in addrs]
+    if nets is not None:
+        nets = [ipaddress.ip_network(n) for n in nets]
+    if entry.get("raise_error"):
+        err = ValueError(err)
+
+    return (entry["status"], entry["name"], addrs, nets, err)
+
+
+def _file_stat(filepath):
+    """
+    :return: [mtime (ns), size] of the file or None if it does not exist
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _net_infos_with_manifest(config_files, manifest, max_prefix=NET_MAX_PREFIX,
+                             workers=1):
+    """
+    Similar to :func:`_net_infos_itr` but extract data only from files
+    changed since the last time using the manifest file. It keeps the mtime
+    and the size of each file and data extracted from it.
+
+    :param config_files: A list of fortios' config files parsed
+    :param manifest: Path to the manifest file
+    :param max_prefix: Max prefix for networks
+    :param workers: Number of worker processes, see :func:`_net_infos_itr`
+
+    :return: A list of tuples, see :func:`net_info_from_config_file`
+    """
+    entries = dict()
+    if os.path.exists(manifest):
+        try:
+            mdata = anyconfig.load(manifest)
+            if mdata.get("max_prefix") == max_prefix and \
+                    mdata.get("version") == NET_MANIFEST_VERSION:
+                entries = mdata.get("files", {})
+        except (IOError, OSError, ValueError, AttributeError) as exc:
+            LOG.warning("Ignored the invalid manifest: %s, exc=%r",
+                        manifest, exc)
+
+    paths = [os.path.abspath(p) for p in config_files]
+    stats = [_file_stat(p) for p in paths]
+    changes = [p for p, st in zip(paths, stats)
+               if st is None or entries.get(p, {}).get("stat") != st]
+
+    infos = dict(zip(changes, _net_infos_itr(changes, max_prefix,
+                                             workers=workers)))
+
+    files = dict()
+    for path, stat in zip(paths, stats):
+        if path in infos:
+            files[path] = _net_info_to_entry(infos[path])
+            files[path]["stat"] = stat
+        else:
+            files[path] = entries[path]
+            infos[path] = _net_info_from_entry(files[path])
+
+    dump_file(dict(timestamp=timestamp(), version=NET_MANIFEST_VERSION,
+                   max_prefix=max_prefix, files=files, changes=changes),
+              manifest)
+
+    return [infos[p] for p in paths]
+
+
+def _net_info_itr(config_files, max_prefix=NET_MAX_PREFIX, workers=1,
+                  manifest=None):
     """
     Load network related data from parsed fortigate config files.
 
+    Data of each file may be extracted in worker processes in parallel or
+    loaded from the manifest file, but they are merged in order of
+    `config_files` in this process, so that the results are always same.
+
     :param config_files: A list of fortios' config files parsed
     :param max_prefix: Max prefix for networks
+    :param workers: Number of worker processes, see :func:`_net_infos_itr`
+    :param manifest:
+        Path to the manifest file to extract data only from changed files
+
+    :return:
+        An iterator yields tuples of (NT_FIREWALL, node_id, name,
+        [IPv*Address]), (NT_NETWORK, node_id, IPv*Network) or (NT_EDGE,
+        firewall_node_id, network_node_id)
     """
+    if manifest:
+        net_infos = _net_infos_with_manifest(config_files, manifest,
+                                             max_prefix, workers=workers)
+    else:
+        net_infos = _net_infos_itr(config_files, max_prefix, workers=workers)
+
     cntr = itertools.count()
     net_seen = set()      # {IP*Network}
     net_id_seen = dict()  # {IP*Network: int}
 
-    for cpath in config_files:
-        try:
-            cnfs = load_configs(cpath)
-            fwcnfs = list_configs_from_configs_data(cnfs)
-        except (ValueError, TypeError) as exc:
-            LOG.warning(str(exc))
+    for status, name, addrs, nets, err in net_infos:
+        if status == NI_LOAD_FAILED:
+            LOG.warning(err)
             continue
 
         node_id = next(cntr)
 
-        try:
-            name = hostname_from_configs(fwcnfs)
-        except ValueError as exc:
-            LOG.warning("%r: %s", exc, cpath)
+        if status == NI_NO_GLOBAL:
+            LOG.warning(err)
             continue
 
         # interfaces
-        addrs = list(interface_ip_addrs_from_configs(fwcnfs))
         if addrs:
             # firewall node
-            yield dict(id=node_id, name=name, type="firewall",
-                       addrs=[str(a) for a in addrs])
+            yield (NT_FIREWALL, node_id, name, addrs)
+
+        if err is not None:
+            raise err
 
         # firewall address
-        for net in firewall_networks_from_configs(fwcnfs, max_prefix):
+        for net in nets:
             # network nodes
             if net in net_seen:
                 net_id = net_id_seen[net]
@@ -491,47 +1941,300 @@ def collect_net_info_from_files(config_files, max_prefix=NET_MAX_PREFIX):
                 net_seen.add(net)
                 net_id_seen[net] = net_id
 
-                yield dict(id=net_id, name=str(net), type="network",
-                           addrs=[str(net)])
+                yield (NT_NETWORK, net_id, net)
 
             # firewall <-> network link
-            yield [node_id, net_id]
+            yield (NT_EDGE, node_id, net_id)
+
+
+def _net_info_to_obj(info):
+    """
+    :param info: A tuple, see :func:`_net_info_itr`
+    :return: A node (mapping object) or an edge ([node_id, node_id])
+    """
+    if info[0] == NT_EDGE:
+        return [info[1], info[2]]
+
+    if info[0] == NT_FIREWALL:
+        return dict(id=info[1], name=info[2], type=NT_FIREWALL,
+                    addrs=[str(a) for a in info[3]])
+
+    return dict(id=info[1], name=str(info[2]), type=NT_NETWORK,
+                addrs=[str(info[2])])
+
+
+def collect_net_info_from_files(config_files, max_prefix=NET_MAX_PREFIX,
+                                workers=1, manifest=None):
+    """
+    Load network related data from parsed fortigate config files.
+
+    :param config_files: A list of fortios' config files parsed
+    :param max_prefix: Max prefix for networks
+    :param workers:
+        Number of worker processes or None or 0 (number of CPUs). Files are
+        processed in the current process if it's 1.
+    :param manifest:
+        Path to the manifest file keeps data extracted from each file last
+        time, to extract data only from files changed since then
+
+    :return:
+        An iterator yields node (mapping object) and edge ([node_id,
+        node_id]) objects
+    """
+    for info in _net_info_itr(config_files, max_prefix, workers=workers,
+                              manifest=manifest):
+        yield _net_info_to_obj(info)
+
+
+class NetworkGraph():
+    """
+    Compact container of network nodes and edges. Nodes are kept in columnar
+    arrays of integers instead of mapping objects:
+
+    - ids, types: Node IDs and types (index of :data:`NODE_TYPES`)
+    - names: Names of firewall nodes, may be None if hostnames were not
+      found; network nodes are named by its address
+    - addresses: Arrays of (upper and lower 64 bits of) addresses, prefixes
+      and IP versions, and the offsets of each node's addresses
+    - edges: A flat array of pairs of node IDs
+
+    Nodes and edges are exported as the same objects yielded from
+    :func:`collect_net_info_from_files` on demand.
+    """
+    __slots__ = ("ids", "types", "names", "addr_offsets", "addr_his",
+                 "addr_los", "addr_prefixes", "addr_versions", "edges")
+
+    _MASK_64 = (1 << 64) - 1
+
+    def __init__(self):
+        self.ids = array.array('q')
+        self.types = array.array('B')
+        self.names = dict()  # {<index of firewall node>: <name or None>}
+        self.addr_offsets = array.array('Q', [0])
+        self.addr_his = array.array('Q')
+        self.addr_los = array.array('Q')
+        self.addr_prefixes = array.array('B')
+        self.addr_versions = array.array('B')
+        self.edges = array.array('q')
+
+    @classmethod
+    def from_net_info(cls, infos):
+        """
+        :param infos: An iterable yields tuples, see :func:`_net_info_itr`
+        :return: A :class:`NetworkGraph` object
+        """
+        graph = cls()
+        for info in infos:
+            if info[0] == NT_EDGE:
+                graph.add_edge(info[1], info[2])
+            elif info[0] == NT_FIREWALL:
+                graph.add_node(info[1], NT_FIREWALL, info[3], name=info[2])
+            else:
+                graph.add_node(info[1], NT_NETWORK, [info[2]])
+
+        return graph
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _add_addr(self, addr):
+        """
+        :param addr: IPv*Address or IPv*Network object
+        """
+        if isinstance(addr, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            (val, prefix) = (int(addr.network_address), addr.prefixlen)
+        else:
+            (val, prefix) = (int(addr), addr.max_prefixlen)
+
+        self.addr_his.append(val >> 64)
+        self.addr_los.append(val & self._MASK_64)
+        self.addr_prefixes.append(prefix)
+        self.addr_versions.append(addr.version)
+
+    def add_node(self, node_id, node_type, addrs, name=None):
+        """
+        :param node_id: Node ID
+        :param node_type: Node type, NT_FIREWALL or NT_NETWORK
+        :param addrs: A list of IPv*Address or IPv*Network objects
+        :param name: Node name, not needed for network nodes
+        """
+        if node_type == NT_FIREWALL:
+            self.names[len(self.ids)] = name
+
+        self.ids.append(node_id)
+        self.types.append(NODE_TYPES.index(node_type))
+        for addr in addrs:
+            self._add_addr(addr)
+        self.addr_offsets.append(len(self.addr_los))
+
+    def add_edge(self, src, dst):
+        """
+        :param src: Node ID of the firewall node
+        :param dst: Node ID of the network node
+        """
+        self.edges.append(src)
+        self.edges.append(dst)
+
+    def _addrs(self, idx):
+        """
+        :param idx: Index of the node
+        :return: A list of addresses (str) of the node
+        """
+        net = self.types[idx] == NODE_TYPES.index(NT_NETWORK)
+        res = []
+        for aidx in range(self.addr_offsets[idx], self.addr_offsets[idx + 1]):
+            val = (self.addr_his[aidx] << 64) | self.addr_los[aidx]
+            if self.addr_versions[aidx] == 4:
+                addr = ipaddress.IPv4Address(val)
+            else:
+                addr = ipaddress.IPv6Address(val)
+
+            res.append("{!s}/{}".format(addr, self.addr_prefixes[aidx])
+                       if net else str(addr))
+
+        return res
+
+    def nodes_itr(self):
+        """
+        :return: An iterator yields node objects, {id, name, type, addrs}
+        """
+        for idx, node_id in enumerate(self.ids):
+            addrs = self._addrs(idx)
+            name = self.names[idx] if idx in self.names else addrs[0]
+            yield dict(id=node_id, name=name,
+                       type=NODE_TYPES[self.types[idx]], addrs=addrs)
+
+    def edges_itr(self):
+        """
+        :return: An iterator yields edge objects, [node_id, node_id]
+        """
+        for idx in range(0, len(self.edges), 2):
+            yield [self.edges[idx], self.edges[idx + 1]]
+
+    def to_dict(self):
+        """
+        :return: A mapping object, {nodes: [node], edges: [edge]}
+        """
+        return dict(nodes=list(self.nodes_itr()),
+                    edges=list(self.edges_itr()))
+
+
+def make_network_graph_from_config_files(config_files,
+                                         max_prefix=NET_MAX_PREFIX,
+                                         workers=1, manifest=None):
+    """
+    Load network related data from parsed fortigate config files.
+
+    :param config_files: A list of fortios' config files parsed
+    :param max_prefix: Max prefix for networks
+    :param workers: Number of worker processes, see the above
+    :param manifest: Path to the manifest file, see the above
+
+    :return: A :class:`NetworkGraph` object
+    """
+    return NetworkGraph.from_net_info(
+        _net_info_itr(config_files, max_prefix, workers=workers,
+                      manifest=manifest)
+    )
 
 
-def make_networks_from_config_files(config_files, max_prefix=NET_MAX_PREFIX):
+def make_networks_from_config_files(config_files, max_prefix=NET_MAX_PREFIX,
+                                    workers=1, manifest=None):
     """
     Load network related data from parsed fortigate config files.
 
     :param config_files: A list of fortios' config files parsed
     :param max_prefix: Max prefix for networks
+    :param workers: Number of worker processes, see the above
+    :param manifest: Path to the manifest file, see the above
 
     :return: A mapping object, {nodes: [node], edges: [edge]}
     """
-    nodes_and_edges = list(collect_net_info_from_files(config_files,
-                                                       max_prefix))
-    nodes = [x for x in nodes_and_edges
-             if isinstance(x, collections.abc.Mapping)]
-    edges = [x for x in nodes_and_edges
-             if isinstance(x, collections.abc.Sequence)]
+    return make_network_graph_from_config_files(
+        config_files, max_prefix=max_prefix, workers=workers,
+        manifest=manifest
+    ).to_dict()
+
+
+def _dump_net_info_stream(infos, out):
+    """
+    Dump network nodes and edges to `out` incrementally in JSON format. The
+    result is same as the one :func:`json.dump` the mapping object
+    :func:`make_networks_from_config_files` returns. Edges are saved to a
+    temporary file and appended to `out` after all nodes.
+
+    :param infos: An iterable yields tuples, see :func:`_net_info_itr`
+    :param out: A file object to write results
+    """
+    with tempfile.TemporaryFile('w+') as edges:
+        out.write('{"nodes": [')
+        (nsep, esep) = ('', '')
+        for info in infos:
+            content = json.dumps(_net_info_to_obj(info))
+            if info[0] == NT_EDGE:
+                edges.write(esep + content)
+                esep = ", "
+            else:
+                out.write(nsep + content)
+                nsep = ", "
 
-    return dict(nodes=nodes, edges=edges)
+        out.write('], "edges": [')
+        edges.seek(0)
+        shutil.copyfileobj(edges, out)
+        out.write(']}')
 
 
 def dump_networks_from_config_files(config_files, output=None,
-                                    max_prefix=NET_MAX_PREFIX):
+                                    max_prefix=NET_MAX_PREFIX, workers=1,
+                                    streaming=False, manifest=None):
     """
     Load network related data from parsed fortigate config files.
 
     :param config_files: A list of fortios' config files parsed
     :param output: Output file path
     :param max_prefix: Max prefix for networks
+    :param workers: Number of worker processes, see the above
+    :param manifest: Path to the manifest file, see the above
+    :param streaming:
+        Write nodes and edges incrementally while loading them from files to
+        keep memory usage flat if True. `output` must be a JSON file or a
+        NDJSON file (ext: .ndjson or .jsonl) contains a node or an edge in
+        each line in this case.
+
+    :raises: ValueError if streaming mode does not support `output`
     """
-    nodes_links = make_networks_from_config_files(config_files,
-                                                  max_prefix=max_prefix)
-
     if output is None:
         output = os.path.join(os.path.dirname(config_files[0]), "output.yml")
 
-    anyconfig.dump(nodes_links, output)
+    if not streaming:
+        nodes_links = make_networks_from_config_files(config_files,
+                                                      max_prefix=max_prefix,
+                                                      workers=workers,
+                                                      manifest=manifest)
+        anyconfig.dump(nodes_links, output)
+        return
+
+    ext = os.path.splitext(output)[-1]
+    if ext not in NDJSON_EXTS and ext != ".json":
+        raise ValueError("Only JSON and NDJSON are supported in streaming "
+                         "mode: {}".format(output))
+
+    infos = _net_info_itr(config_files, max_prefix, workers=workers,
+                          manifest=manifest)
+
+    utils.ensure_dir_exists(output)
+    tmppath = "{}.{}.tmp".format(output, os.getpid())
+    try:
+        with open(tmppath, 'w') as out:
+            if ext in NDJSON_EXTS:
+                for info in infos:
+                    out.write(json.dumps(_net_info_to_obj(info)) + "\n")
+            else:
+                _dump_net_info_stream(infos, out)
+
+        os.replace(tmppath, output)
+    finally:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
 
 # vim:sw=4:ts=4:et:
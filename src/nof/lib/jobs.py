@@ -0,0 +1,320 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+r"""A simple persistent job queue backed by a SQLite database file.
+
+Jobs are saved in the database file and claimed by workers atomically, so
+that they survive restarts and can be shared among web worker processes
+running on the same host.
+
+.. versionadded:: 0.2.0
+
+   - initial checkin
+"""
+from __future__ import absolute_import
+
+import contextlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+
+JOB_STATES = (ST_QUEUED, ST_RUNNING, ST_DONE, ST_FAILED) = (
+    "queued", "running", "done", "failed"
+)
+
+# Max time in seconds to wait for the lock of the database.
+DB_TIMEOUT = 30
+
+LOG = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    state TEXT NOT NULL,
+    params TEXT NOT NULL,
+    stages TEXT NOT NULL DEFAULT '[]',
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created);
+"""
+
+_JSON_COLUMNS = ("params", "stages", "result")
+
+
+_TOKENS = dict()  # {<pid>: <token>}
+
+
+def _process_start_time(pid):
+    """
+    :param pid: Process ID
+    :return:
+        A str gives the start time of the process in clock ticks since boot
+        or None if it's not available
+    """
+    try:
+        with open("/proc/{}/stat".format(pid)) as inp:
+            # The 22nd field, and the 2nd one (comm) may contain spaces.
+            return inp.read().rsplit(')', 1)[1].split()[19]
+    except (IOError, OSError, IndexError):
+        return None
+
+
+def _process_token(pid):
+    """
+    :param pid: Process ID
+    :return:
+        A str distinguishes the process from other processes had the same
+        pid before, e.g. PID 1 in containers restarted, or None if it's not
+        available
+    """
+    token = _process_start_time(pid)
+    if token is None and pid == os.getpid():
+        token = _TOKENS.setdefault(pid, uuid.uuid4().hex)
+
+    return token
+
+
+def worker_id():
+    """
+    :return:
+        A str identifies the current process, <hostname>:<pid>:<token>, see
+        :func:`_process_token`
+    """
+    pid = os.getpid()
+    return "{}:{}:{}".format(socket.gethostname(), pid, _process_token(pid))
+
+
+def is_alive(worker):
+    """
+    :param worker: A str gives the worker ID, see :func:`worker_id`
+    :return: True if the worker process may be alive
+    """
+    (hostname, _sep, rest) = (worker or '').partition(':')
+    if hostname != socket.gethostname():
+        return True  # It cannot be checked.
+
+    (pid, _sep, token) = rest.partition(':')
+    try:
+        pid = int(pid)
+    except ValueError:
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # It's running as another user.
+
+    if token:  # The pid may be used by another process now.
+        current = _process_token(pid)
+        if current is not None and current != token:
+            return False
+
+    return True
+
+
+class JobQueue():
+    """
+    A job queue backed by a SQLite database file.
+
+    Each job is a mapping object, {id, kind, state, params, stages, result,
+    error, worker, created, started, finished}, and `stages` is a list of
+    mapping objects, [{name, elapsed}], gives the processing time of each
+    stage of the job.
+    """
+    def __init__(self, dbpath):
+        """
+        :param dbpath: Path to the database file
+        """
+        self.dbpath = dbpath
+
+        dbdir = os.path.dirname(dbpath)
+        if dbdir:
+            os.makedirs(dbdir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """
+        Connect to the database. A new connection is made each time as it's
+        used from multiple threads and processes.
+        """
+        conn = sqlite3.connect(self.dbpath, timeout=DB_TIMEOUT,
+                               isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_job(row):
+        """
+        :param row: A :class:`sqlite3.Row` object
+        :return: A mapping object gives a job
+        """
+        job = dict(row)
+        for key in _JSON_COLUMNS:
+            if job[key] is not None:
+                job[key] = json.loads(job[key])
+
+        return job
+
+    def enqueue(self, kind, params):
+        """
+        :param kind: A str gives the kind of the job
+        :param params: A mapping object gives parameters of the job
+
+        :return: A mapping object gives the job enqueued
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, kind, state, params, created) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (job_id, kind, ST_QUEUED, json.dumps(params),
+                          time.time()))
+
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """
+        :param job_id: Job ID
+        :return: A mapping object gives the job or None if it's not found
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?",
+                               (job_id, )).fetchone()
+
+        return None if row is None else self._to_job(row)
+
+    def claim(self, worker=None):
+        """
+        Claim the oldest job queued and mark it running atomically.
+
+        :param worker: A str gives the worker ID, see :func:`worker_id`
+        :return: A mapping object gives the job or None if no jobs queued
+        """
+        if worker is None:
+            worker = worker_id()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT id FROM jobs WHERE state = ? "
+                                   "ORDER BY created LIMIT 1",
+                                   (ST_QUEUED, )).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET state = ?, worker = ?, "
+                                 "started = ? WHERE id = ?",
+                                 (ST_RUNNING, worker, time.time(), row["id"]))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+
+        return None if row is None else self.get(row["id"])
+
+    def add_stage(self, job_id, name, elapsed):
+        """
+        Record the processing time of a stage of the job.
+
+        :param job_id: Job ID
+        :param name: Stage name
+        :param elapsed: Time in seconds to process the stage
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT stages FROM jobs WHERE id = ?",
+                                   (job_id, )).fetchone()
+                stages = json.loads(row["stages"]) + [
+                    dict(name=name, elapsed=round(elapsed, 6))
+                ]
+                conn.execute("UPDATE jobs SET stages = ? WHERE id = ?",
+                             (json.dumps(stages), job_id))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+
+    def finish(self, job_id, result=None, error=None):
+        """
+        Mark the job done or failed if `error` is given.
+
+        :param job_id: Job ID
+        :param result: A mapping object gives the result of the job
+        :param error: A str gives the error happened in the job
+        """
+        state = ST_DONE if error is None else ST_FAILED
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET state = ?, result = ?, error = ?, "
+                         "finished = ? WHERE id = ?",
+                         (state, json.dumps(result), error, time.time(),
+                          job_id))
+
+    def requeue_orphans(self):
+        """
+        Requeue jobs marked running but its worker processes are not alive,
+        e.g. the server was restarted while processing them.
+
+        :return: A list of IDs of jobs requeued
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, worker FROM jobs "
+                                "WHERE state = ?", (ST_RUNNING, )).fetchall()
+
+            job_ids = [r["id"] for r in rows if not is_alive(r["worker"])]
+            for job_id in job_ids:
+                conn.execute("UPDATE jobs SET state = ?, worker = NULL, "
+                             "started = NULL, stages = '[]' "
+                             "WHERE id = ? AND state = ?",
+                             (ST_QUEUED, job_id, ST_RUNNING))
+
+        return job_ids
+
+    def run(self, handlers, worker=None):
+        """
+        Process jobs queued until no jobs left.
+
+        :param handlers:
+            A mapping object, {<kind>: <callable>}, and each callable takes
+            the parameters of the job and a callable to record the time of
+            each stage, `stage_fn(name, elapsed)`, and returns the result
+        :param worker: A str gives the worker ID, see :func:`worker_id`
+
+        :return: Number of jobs processed
+        """
+        count = 0
+        while True:
+            job = self.claim(worker=worker)
+            if job is None:
+                return count
+
+            def stage_fn(name, elapsed, job_id=job["id"]):
+                self.add_stage(job_id, name, elapsed)
+
+            try:
+                result = handlers[job["kind"]](job["params"], stage_fn)
+                self.finish(job["id"], result=result)
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.warning("Job failed: %s, exc=%r", job["id"], exc)
+                self.finish(job["id"], error=str(exc))
+
+            count += 1
+
+# vim:sw=4:ts=4:et:
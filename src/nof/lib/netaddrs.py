@@ -0,0 +1,541 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+r"""Network addresses packed into integers and operations on them.
+
+Networks are represented as a pair of arrays of integers, network addresses
+and prefixes, instead of a list of :class:`ipaddress.IPv4Network` or
+:class:`ipaddress.IPv6Network` objects, and processed in batch. NumPy is used
+to vectorize the operations on IPv4 networks if it's available.
+
+.. versionadded:: 0.2.0
+
+   - initial checkin
+"""
+from __future__ import absolute_import
+
+import bisect
+import ipaddress
+import itertools
+import socket
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+WIDTHS = {4: 32, 6: 128}
+
+_IP_NETWORK_CLASSES = {4: ipaddress.IPv4Network, 6: ipaddress.IPv6Network}
+
+
+def _mask(prefix, width=32):
+    """
+    :param prefix: Network prefix length
+    :param width: Bit width of addresses
+
+    >>> hex(_mask(24))
+    '0xffffff00'
+    >>> _mask(0)
+    0
+    """
+    return ((1 << width) - 1) ^ ((1 << (width - prefix)) - 1)
+
+
+def _bit_lengths(vals, width=32):
+    """
+    :param vals: A numpy array of unsigned integers less than 2 ** `width`
+    :return: A numpy array of the bit lengths of `vals`
+    """
+    pows = numpy.left_shift(numpy.uint64(1),
+                            numpy.arange(width + 1, dtype=numpy.uint64))
+    return (vals[:, None] >= pows[None, :]).sum(axis=1)
+
+
+def _range_to_cidrs_itr(start, end, width=32):
+    """
+    :param start: The first address (int) of the range
+    :param end: The last address (int) of the range
+    :param width: Bit width of addresses
+
+    :return: An iterator yields (address, prefix) covers the range exactly
+
+    >>> list(_range_to_cidrs_itr(0, 255))
+    [(0, 24)]
+    >>> list(_range_to_cidrs_itr(1, 4))
+    [(1, 32), (2, 31), (4, 32)]
+    """
+    while start <= end:
+        size = (start & -start) if start else (1 << width)
+        while size > end - start + 1:
+            size >>= 1
+
+        yield (start, width - size.bit_length() + 1)
+        start += size
+
+
+class PackedNetworks():
+    """
+    Networks of the same IP version packed into arrays of integers.
+
+    - addrs: Network addresses
+    - prefixes: Network prefixes
+
+    These are numpy arrays if numpy is available and it's IPv4 networks, or
+    lists of ints otherwise.
+    """
+    def __init__(self, addrs, prefixes, version=4):
+        """
+        :param addrs: An iterable yields network addresses (int)
+        :param prefixes: An iterable yields network prefixes (int)
+        :param version: IP version, 4 or 6
+        """
+        self.version = version
+        self.width = WIDTHS[version]
+
+        if numpy is not None and version == 4:
+            self.addrs = numpy.asarray(addrs, dtype=numpy.uint64)
+            self.prefixes = numpy.asarray(prefixes, dtype=numpy.uint64)
+        else:
+            self.addrs = [int(a) for a in addrs]
+            self.prefixes = [int(p) for p in prefixes]
+
+    @property
+    def vectorized(self):
+        """True if operations on this object are vectorized
+        """
+        return numpy is not None and self.version == 4
+
+    @classmethod
+    def from_networks(cls, nets, version=4):
+        """
+        :param nets: A list of IPv*Network objects of the same version
+        :param version: IP version, used if `nets` is empty
+        """
+        if nets:
+            version = nets[0].version
+
+        return cls([int(n.network_address) for n in nets],
+                   [n.prefixlen for n in nets], version=version)
+
+    @classmethod
+    def from_subnets(cls, subnets):
+        """
+        Pack IPv4 subnets given as pairs of address and netmask strings, e.g.
+        `subnet` values of 'firewall address' configs, without making IPv4
+        network objects.
+
+        :param subnets:
+            A list of (<ip_address>, <netmask>) such as ('192.168.1.0',
+            '255.255.255.0')
+
+        :return:
+            A tuple of (:class:`PackedNetworks` object, [indexes of invalid
+            items in `subnets`])
+
+        >>> (nets, errs) = PackedNetworks.from_subnets(
+        ...     [("192.168.1.0", "255.255.255.0"), ("10.0.0.1", "255.0.0.0"),
+        ...      ("10.0.0.1", "255.255.255.255"), ("a.b.c.d", "0.0.0.0"),
+        ...      ("010.0.0.0", "255.0.0.0"), "10.0.0.0/8"]
+        ... )
+        >>> nets.to_networks()
+        [IPv4Network('192.168.1.0/24'), IPv4Network('10.0.0.1/32')]
+        >>> errs
+        [1, 3, 4, 5]
+        """
+        (addrs, prefixes, errs) = ([], [], [])
+        for idx, subnet in enumerate(subnets):
+            try:
+                (addr, netmask) = subnet
+                # inet_pton, not inet_aton accepts legacy forms such as
+                # '010.0.0.0' (octal) and '10.1' which ipaddress rejects.
+                addr = int.from_bytes(socket.inet_pton(socket.AF_INET, addr),
+                                      "big")
+                mask = int.from_bytes(socket.inet_pton(socket.AF_INET,
+                                                       netmask), "big")
+            except (OSError, TypeError, ValueError):
+                errs.append(idx)
+                continue
+
+            prefix = bin(mask).count("1")
+            if mask != _mask(prefix) or addr & ~mask:  # Same as ipaddress.
+                errs.append(idx)
+                continue
+
+            addrs.append(addr)
+            prefixes.append(prefix)
+
+        return (cls(addrs, prefixes), errs)
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def take(self, idxs):
+        """
+        :param idxs: A list of indexes of networks to select
+        :return: A :class:`PackedNetworks` object of the networks selected
+
+        >>> nets = PackedNetworks([1, 2, 3], [32, 32, 32])
+        >>> [int(a) for a in nets.take([2, 0]).addrs]
+        [3, 1]
+        """
+        if self.vectorized:
+            idxs = numpy.asarray(idxs, dtype=numpy.int64)
+            return type(self)(self.addrs[idxs], self.prefixes[idxs],
+                              version=self.version)
+
+        return type(self)([self.addrs[i] for i in idxs],
+                          [self.prefixes[i] for i in idxs],
+                          version=self.version)
+
+    def to_networks(self):
+        """
+        :return: A list of IPv*Network objects
+        """
+        ncls = _IP_NETWORK_CLASSES[self.version]
+        return [ncls((int(a), int(p)))
+                for a, p in zip(self.addrs, self.prefixes)]
+
+    def _masks(self, prefixes):
+        """
+        :param prefixes: A numpy array of network prefixes
+        :return: A numpy array of netmasks
+        """
+        width = numpy.uint64(self.width)
+        return (numpy.left_shift(numpy.uint64(_mask(self.width, self.width)),
+                                 width - prefixes) &
+                numpy.uint64(_mask(self.width, self.width)))
+
+    def cap_prefix(self, max_prefix):
+        """
+        Replace networks have prefixes longer than `max_prefix` with their
+        supernets have the prefix `max_prefix`, like NET_MAX_PREFIX.
+
+        :param max_prefix: Max prefix of networks
+        :return: A :class:`PackedNetworks` object
+
+        >>> nets = PackedNetworks.from_networks(
+        ...     [ipaddress.ip_network("192.168.1.128/25"),
+        ...      ipaddress.ip_network("10.0.0.0/8")]
+        ... )
+        >>> nets.cap_prefix(24).to_networks()
+        [IPv4Network('192.168.1.0/24'), IPv4Network('10.0.0.0/8')]
+        """
+        if self.vectorized:
+            prefixes = numpy.minimum(self.prefixes, numpy.uint64(max_prefix))
+            addrs = self.addrs & self._masks(prefixes)
+        else:
+            prefixes = [min(p, max_prefix) for p in self.prefixes]
+            addrs = [a & _mask(p, self.width)
+                     for a, p in zip(self.addrs, prefixes)]
+
+        return type(self)(addrs, prefixes, version=self.version)
+
+    def unique(self):
+        """
+        :return:
+            A :class:`PackedNetworks` object without duplicates, in order of
+            appearance
+        """
+        if self.vectorized:
+            keys = (self.addrs << numpy.uint64(8)) | self.prefixes
+            idxs = numpy.sort(numpy.unique(keys, return_index=True)[1])
+            return type(self)(self.addrs[idxs], self.prefixes[idxs])
+
+        pairs = list(dict.fromkeys(zip(self.addrs, self.prefixes)))
+        return type(self)([a for a, _p in pairs], [p for _a, p in pairs],
+                          version=self.version)
+
+    def summarize_batch(self, offsets, prefix=None):
+        """
+        Summarize groups of networks at once, like
+        :func:`nof.lib.fortios.summarize_networks` for each group.
+
+        :param offsets:
+            A list of start indexes of groups in ascending order; the first
+            group starts at 0 and each group must not be empty
+        :param prefix: Summarize networks to the networks of this prefix
+
+        :return:
+            A list of (address, prefix) of summarized networks or None (could
+            not be summarized) for each group
+        :raises: ValueError if `prefix` is longer than some network's prefix
+        """
+        if not len(self):
+            return []
+
+        ends = list(offsets[1:]) + [len(self)]
+        if self.vectorized:
+            starts = numpy.asarray(offsets, dtype=numpy.int64)
+            counts = numpy.asarray(ends, dtype=numpy.int64) - starts
+            firsts = numpy.repeat(self.addrs[starts], counts)
+            diffs = numpy.bitwise_or.reduceat(self.addrs ^ firsts, starts)
+            common = self.width - _bit_lengths(diffs, self.width)
+            pmins = numpy.minimum.reduceat(self.prefixes, starts).tolist()
+            pmaxs = numpy.maximum.reduceat(self.prefixes, starts).tolist()
+            (firsts, common) = (self.addrs[starts].tolist(), common.tolist())
+        else:
+            (firsts, common, pmins, pmaxs) = ([], [], [], [])
+            for start, end in zip(offsets, ends):
+                addrs = self.addrs[start:end]
+                diff = 0
+                for addr in addrs:
+                    diff |= addr ^ addrs[0]
+                firsts.append(addrs[0])
+                common.append(self.width - diff.bit_length())
+                pmins.append(min(self.prefixes[start:end]))
+                pmaxs.append(max(self.prefixes[start:end]))
+
+        res = []
+        for first, clen, pmin, pmax in zip(firsts, common, pmins, pmaxs):
+            if prefix is None:
+                # All networks must have the same prefix and the summarized
+                # one must not be '0.0.0.0/0', the same as the original.
+                if pmin != pmax or min(pmin, clen) < 1:
+                    res.append(None)
+                    continue
+                nprefix = min(pmin, clen)
+            else:
+                if prefix > pmin:
+                    raise ValueError("new prefix must be shorter")
+                if clen < prefix:
+                    res.append(None)
+                    continue
+                nprefix = prefix
+
+            res.append((int(first) & _mask(nprefix, self.width), nprefix))
+
+        return res
+
+    def summarize(self, prefix=None):
+        """
+        Summarize all networks, see :meth:`summarize_batch`.
+
+        :param prefix: Summarize networks to the networks of this prefix
+        :return: A IPv*Network object or None (could not be summarized)
+
+        >>> nets = PackedNetworks.from_networks(
+        ...     [ipaddress.ip_network("192.168.122.0/25"),
+        ...      ipaddress.ip_network("192.168.122.128/25")]
+        ... )
+        >>> nets.summarize()
+        IPv4Network('192.168.122.0/24')
+        >>> nets.summarize(prefix=16)
+        IPv4Network('192.168.0.0/16')
+        """
+        res = self.summarize_batch([0], prefix=prefix)
+        if not res or res[0] is None:
+            return None
+
+        return _IP_NETWORK_CLASSES[self.version](res[0])
+
+    def collapse(self):
+        """
+        Aggregate networks into the minimal set of networks covers them.
+
+        :return: A :class:`PackedNetworks` object
+
+        >>> nets = PackedNetworks.from_networks(
+        ...     [ipaddress.ip_network(n) for n in
+        ...      ("192.168.1.0/25", "192.168.1.128/25", "192.168.2.0/24",
+        ...       "192.168.1.64/26", "10.0.0.0/8")]
+        ... )
+        >>> nets.collapse().to_networks()
+        [IPv4Network('10.0.0.0/8'), IPv4Network('192.168.1.0/24'), \
+IPv4Network('192.168.2.0/24')]
+        """
+        if not len(self):
+            return self
+
+        hmask = (1 << self.width) - 1
+        if self.vectorized:
+            starts = self.addrs
+            ends = starts | (~self._masks(self.prefixes) &
+                             numpy.uint64(hmask))
+            order = numpy.lexsort((ends, starts))
+            (starts, ends) = (starts[order], ends[order])
+
+            reach = numpy.maximum.accumulate(ends)
+            heads = numpy.concatenate(
+                ([0], numpy.nonzero(starts[1:] > reach[:-1] + 1)[0] + 1)
+            )
+            ranges = zip(starts[heads].tolist(),
+                         numpy.maximum.reduceat(ends, heads).tolist())
+        else:
+            pairs = sorted((a, a | (hmask ^ _mask(p, self.width)))
+                           for a, p in zip(self.addrs, self.prefixes))
+            ranges = []
+            for start, end in pairs:
+                if ranges and start <= ranges[-1][1] + 1:
+                    ranges[-1][1] = max(ranges[-1][1], end)
+                else:
+                    ranges.append([start, end])
+
+        cidrs = list(itertools.chain.from_iterable(
+            _range_to_cidrs_itr(s, e, self.width) for s, e in ranges
+        ))
+        return type(self)([a for a, _p in cidrs], [p for _a, p in cidrs],
+                          version=self.version)
+
+
+class NetworkIndex():
+    """
+    An index of networks to find ones contain an IP address quickly.
+
+    As any two networks are either disjoint or one contains another, networks
+    are kept in hash tables keyed by network addresses (int) for each IP
+    version and prefix, and a lookup costs a hash lookup per prefix used plus
+    the number of results.
+    """
+    def __init__(self):
+        # {<version>: {<prefix>: {<network address>: [<value>]}}}
+        self._tables = dict((v, dict()) for v in WIDTHS)
+        self._keys = dict()  # {(<version>, <prefix>): [<network address>]}
+
+    def __len__(self):
+        return sum(len(addrs) for tbl in self._tables.values()
+                   for addrs in tbl.values())
+
+    def add(self, net, value):
+        """
+        :param net: A IPv*Network object
+        :param value: A value to associate with `net`
+        """
+        tbl = self._tables[net.version].setdefault(net.prefixlen, dict())
+        tbl.setdefault(int(net.network_address), []).append(value)
+        self._keys.pop((net.version, net.prefixlen), None)
+
+    def lookup(self, ipa):
+        """
+        :param ipa: A IPv*Address object
+        :return: A list of values associated with networks contain `ipa`
+
+        >>> idx = NetworkIndex()
+        >>> idx.add(ipaddress.ip_network("10.0.0.0/8"), 1)
+        >>> idx.add(ipaddress.ip_network("10.1.1.0/24"), 2)
+        >>> idx.add(ipaddress.ip_network("192.168.1.0/24"), 3)
+        >>> sorted(idx.lookup(ipaddress.ip_address("10.1.1.1")))
+        [1, 2]
+        >>> idx.lookup(ipaddress.ip_address("192.168.2.1"))
+        []
+        """
+        width = WIDTHS[ipa.version]
+        addr = int(ipa)
+        res = []
+        for prefix, tbl in self._tables[ipa.version].items():
+            res.extend(tbl.get(addr & _mask(prefix, width), []))
+
+        return res
+
+    def _sorted_keys(self, version, prefix):
+        """
+        :return: A sorted list of addresses of networks of the prefix
+        """
+        keys = self._keys.get((version, prefix))
+        if keys is None:
+            keys = self._keys[(version, prefix)] = sorted(
+                self._tables[version][prefix]
+            )
+        return keys
+
+    def lookup_network(self, net):
+        """
+        :param net: A IPv*Network object
+        :return:
+            A list of values associated with networks contain `net` or
+            contained in `net`
+
+        >>> idx = NetworkIndex()
+        >>> idx.add(ipaddress.ip_network("10.0.0.0/8"), 1)
+        >>> idx.add(ipaddress.ip_network("10.1.1.0/24"), 2)
+        >>> idx.add(ipaddress.ip_network("10.2.1.1/32"), 3)
+        >>> sorted(idx.lookup_network(ipaddress.ip_network("10.1.0.0/16")))
+        [1, 2]
+        >>> idx.lookup_network(ipaddress.ip_network("192.168.0.0/16"))
+        []
+        """
+        width = WIDTHS[net.version]
+        addr = int(net.network_address)
+        last = int(net.broadcast_address)
+        res = []
+        for prefix, tbl in self._tables[net.version].items():
+            if prefix <= net.prefixlen:
+                res.extend(tbl.get(addr & _mask(prefix, width), []))
+                continue
+
+            keys = self._sorted_keys(net.version, prefix)
+            for key in keys[bisect.bisect_left(keys, addr):
+                            bisect.bisect_right(keys, last)]:
+                res.extend(tbl[key])
+
+        return res
+
+    def nbytes(self):
+        """
+        :return: Approximate size in bytes of this object in memory
+        """
+        return sum(sys.getsizeof(tbl) +
+                   sum(sys.getsizeof(vals) for vals in tbl.values()) +
+                   len(tbl) * 2 * sys.getsizeof(0)
+                   for vtbl in self._tables.values() for tbl in vtbl.values())
+
+    def to_list(self):
+        """
+        :return:
+            A list of [version, prefix, network address, [value]] to serialize
+            this object
+        """
+        return [[ver, prefix, addr, vals]
+                for ver, vtbl in sorted(self._tables.items())
+                for prefix, tbl in sorted(vtbl.items())
+                for addr, vals in sorted(tbl.items())]
+
+    @classmethod
+    def from_list(cls, items):
+        """
+        :param items: A list of items, see :meth:`to_list`
+        :return: A :class:`NetworkIndex` object
+        """
+        self = cls()
+        for ver, prefix, addr, vals in items:
+            tbl = self._tables[ver].setdefault(prefix, dict())
+            tbl.setdefault(addr, []).extend(vals)
+
+        return self
+
+
+def pack_networks(nets):
+    """
+    :param nets: A list of IPv*Network objects
+    :return: A mapping object, {<ip_version>: :class:`PackedNetworks`}
+    """
+    res = dict()
+    for ver in sorted(WIDTHS):
+        vnets = [n for n in nets if n.version == ver]
+        if vnets:
+            res[ver] = PackedNetworks.from_networks(vnets)
+
+    return res
+
+
+def collapse_networks(nets):
+    """
+    Aggregate networks into the minimal set of networks covers them. IPv4
+    networks come first if both of IPv4 and IPv6 networks are given.
+
+    :param nets: A list of IPv*Network objects
+    :return: A list of IPv*Network objects
+
+    >>> collapse_networks([ipaddress.ip_network("192.168.0.0/24"),
+    ...                    ipaddress.ip_network("192.168.1.0/24")])
+    [IPv4Network('192.168.0.0/23')]
+    """
+    return list(itertools.chain.from_iterable(
+        pnets.collapse().to_networks()
+        for _v, pnets in sorted(pack_networks(nets).items())
+    ))
+
+# vim:sw=4:ts=4:et:
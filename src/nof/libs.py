@@ -4,12 +4,27 @@
 #
 """Libs to wrap external library functions.
 """
+import collections
+import functools
+import ipaddress
+import itertools
+import json
+import logging
+import mimetypes
+import operator
+import os
 import os.path
+import re
+import threading
+import time
 
 import flask
 import fortios_xutils
+import pandas
+import werkzeug.security
 
 from . import utils
+from .lib import coltable, diffs, fortios, netaddrs
 from .globals import FT_NETWORKS, FT_FORTI_SHOW_CONFIG
 
 
@@ -29,6 +44,82 @@ FORTI_FILENAMES = (
     "firewall_policy_table_resolved.json"
 )
 
+# The index of addresses in firewall policy tables, and the names of columns
+# of the tables to index.
+FORTI_FIREWALL_POLICIES_INDEX = "firewall_policy_table.index.json"
+FORTI_FIREWALL_POLICIES_ADDRS_COLS = ("addrs", "srcaddrs", "dstaddrs")
+
+# The firewall policy table in the columnar format loaded by memory mapping,
+# see :mod:`nof.lib.coltable`.
+FORTI_FIREWALL_POLICIES_COLUMNS = "firewall_policy_table.columns"
+
+# Kinds of items to compare between the current and the previous versions of
+# parsed results, {<kind>: (<file>, <name of the key of items>)}, and files to
+# keep the previous versions of, see :func:`nof.lib.fortios.save_configs`.
+FORTI_DIFF_SOURCES = collections.OrderedDict((
+    ("policies", (FORTI_FIREWALL_POLICIES, "edit")),
+    ("addresses", (fortios.config_filename("firewall address"), "edit")),
+    ("addrgrps", (fortios.config_filename("firewall addrgrp"), "edit")),
+    ("services", (fortios.config_filename("firewall service custom"),
+                  "edit")),
+    ("service_groups", (fortios.config_filename("firewall service group"),
+                        "edit")),
+))
+FORTI_PREVIOUS_FILENAMES = (
+    (FORTI_CNF_META, FORTI_FIREWALL_POLICIES_COLUMNS) +
+    tuple(f for f, _k in FORTI_DIFF_SOURCES.values())
+)
+
+# Configs used to make firewall policy tables, and the file to keep the
+# fingerprint of them in incremental mode.
+FORTI_FIREWALL_POLICIES_SOURCES = re.compile(r"^firewall (policy|address)")
+FORTI_FIREWALL_POLICIES_FINGERPRINT = ".firewall_policy_table.fingerprint"
+
+# Max size in bytes of firewall policy tables kept loaded in memory, and the
+# environment variable to override it.
+FORTI_FIREWALL_POLICIES_CACHE_SIZE = 256 * 1024 * 1024
+FORTI_FIREWALL_POLICIES_CACHE_SIZE_ENV = "NOF_POLICY_TABLE_CACHE_SIZE"
+
+LOG = logging.getLogger(__name__)
+
+
+def send_file_with_encodings(dirpath, filename):
+    """
+    Send a file in `dirpath` with a strong ETag computed from its content.
+
+    The compressed copy of the file in the content encoding the client
+    accepts most is sent instead if it's available, see
+    :func:`nof.utils.save_compressed_copies`, and 304 (Not Modified) is
+    returned if the client has the same content, by If-None-Match header.
+
+    :param dirpath: Path to the dir contains the file
+    :param filename: The name of the file to send, may be in sub dirs
+    """
+    fpath = werkzeug.security.safe_join(dirpath, filename)
+    if fpath is None or not os.path.isfile(fpath):
+        flask.abort(404)
+
+    accepts = flask.request.accept_encodings
+    (encoding, quality, spath) = (None, 0, fpath)
+    for enc in utils.compressed_copy_encodings():
+        if accepts[enc] > quality:
+            cpath = utils.compressed_copy_path(fpath, enc)
+            if cpath:
+                (encoding, quality, spath) = (enc, accepts[enc], cpath)
+
+    etag = utils.checksum_file(fpath)
+    if encoding:
+        etag = "{}-{}".format(etag, encoding)  # An etag per representation.
+
+    resp = flask.send_file(spath, etag=etag, conditional=True,
+                           mimetype=(mimetypes.guess_type(filename)[0] or
+                                     "application/octet-stream"))
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+
+    return resp
+
 
 def sendfile_from_upload_dir(filename, file_type, datadir=None):
     """
@@ -41,7 +132,7 @@ def sendfile_from_upload_dir(filename, file_type, datadir=None):
     fname = utils.uploaded_filepath(filename, file_type)
     udir = utils.uploaddir(file_type, datadir=datadir)
 
-    return flask.send_from_directory(udir, fname)
+    return send_file_with_encodings(udir, fname)
 
 
 def load_networks(filename, datadir=None):
@@ -89,33 +180,125 @@ def find_network_paths(filename, src, dst, node_type=False, datadir=None):
     return fortios_xutils.find_network_paths(fpath, src, dst, **opts)
 
 
-def parse_fortigate_config_and_save_files(filepath):
+def _policy_table_not_changed(cnf, block_ids, fpath):
+    """
+    :param cnf: A mapping object holding configs
+    :param block_ids: See :func:`nof.lib.fortios.configs_fingerprint`
+    :param fpath: Path to the file to keep the fingerprint of configs
+
+    :return:
+        A tuple of (True if the configs used to make the firewall policy table
+        were not changed since the last time, the fingerprint of them)
+    """
+    fwcnfs = fortios.ConfigIndex(cnf["configs"])
+    fprint = fortios.configs_fingerprint(
+        fortios.configs_by_name(fwcnfs, FORTI_FIREWALL_POLICIES_SOURCES),
+        block_ids
+    )
+    if not fprint or not os.path.exists(fpath):
+        return (False, fprint)
+
+    with open(fpath) as inp:
+        return (inp.read().strip() == fprint, fprint)
+
+
+def parse_fortigate_config_and_save_files(filepath, stage_fn=None,
+                                          incremental=False):
     """
     Parse fortigate's "show *configuration" output and save its result as a
     series of JSON and database files under `datadir`.
 
+    In incremental mode, only top-level config blocks changed since the last
+    time are parsed, and files made from configs of blocks not changed, e.g.
+    firewall policy tables, are not made again.
+
     :param filepath:
        Path to the fortigate's "show *configuration" output uploaded
+    :param stage_fn:
+       A callable to record the time to process each stage,
+       `stage_fn(name, elapsed)`, if given
+    :param incremental: Process it in incremental mode if True
 
     :return: (hostname, a_mapping_object_holding_configs)
     :raises: ValueError
     """
     odir = os.path.dirname(filepath)
+    start = time.perf_counter()
+
+    def _stage_done(name):
+        nonlocal start
+        now = time.perf_counter()
+        if stage_fn is not None:
+            stage_fn(name, now - start)
+        start = now
+
+    # Parse it in a single pass and check if it looks a fortigate's output.
+    block_ids = None
+    if incremental:
+        bcache = fortios.BlockCache(os.path.join(odir,
+                                                 fortios.BLOCKS_DB_FILENAME))
+        (cnf, block_ids) = fortios.parse_show_config_incrementally(
+            filepath, bcache, marker=fortios.GLOBAL_CONFIG_MARKER
+        )
+        bcache.prune()
+    else:
+        cnf = fortios.parse_show_config(filepath,
+                                        marker=fortios.GLOBAL_CONFIG_MARKER)
+    if not cnf or not cnf.get("configs"):
+        raise ValueError("Looks invalid data: {}".format(filepath))
+    _stage_done("parse")
 
-    # FIXME: Quick and dirty hack.
-    if "config system global" not in open(filepath).read():
-        raise ValueError("Not a fortigate's show *configuration output? "
-                         "{}".format(filepath))
+    hostname = fortios.hostname_from_config_data(cnf, filepath)
+    if not hostname:
+        raise ValueError("Could not resolve hostname: {}".format(filepath))
 
-    res = fortios_xutils.parse_and_save_show_configs([filepath], outdir=odir)
+    # Configs of the same host may be saved in other processes at the same
+    # time, e.g. in bulk uploads, so save files of the host one by one.
+    with utils.dir_locked(os.path.join(odir, hostname)):
+        return _save_fortigate_config_files(cnf, filepath, hostname,
+                                            block_ids, _stage_done)
 
-    # res: (path of all.json, a_mapping_object_holding_configs)
-    if not res or not res[0][-1]:
-        raise ValueError("Looks invalid data: {}".format(filepath))
 
-    (apath, cnf) = res[0]
+def _save_fortigate_config_files(cnf, filepath, hostname, block_ids,
+                                 stage_done):
+    """
+    Save parsed results `cnf` as a series of JSON and database files under
+    <datadir>/<hostname>/, see :func:`parse_fortigate_config_and_save_files`.
+
+    :param cnf: A mapping object contains parsed results
+    :param filepath:
+       Path to the fortigate's "show *configuration" output uploaded
+    :param hostname: Hostname resolved from `cnf`
+    :param block_ids: A mapping object or None (not in incremental mode)
+    :param stage_done: A callable to record that each stage was done
+
+    :return: (hostname, a_mapping_object_holding_configs)
+    :raises: ValueError
+    """
+    (hostname, apath) = fortios.save_configs(
+        cnf, filepath, os.path.dirname(filepath), block_ids=block_ids,
+        keep_previous=FORTI_PREVIOUS_FILENAMES, hostname=hostname
+    )
+    utils.save_compressed_copies(apath)  # To send it with less traffic.
+    stage_done("save")
 
     adir = os.path.dirname(apath)
+    fp_path = os.path.join(adir, FORTI_FIREWALL_POLICIES_FINGERPRINT)
+    fprint = None
+    if block_ids is not None:
+        (not_changed, fprint) = _policy_table_not_changed(cnf, block_ids,
+                                                          fp_path)
+        if not_changed and all(
+            os.path.exists(os.path.join(adir, f))
+            for f in (FORTI_FIREWALL_POLICIES,
+                      FORTI_FIREWALL_POLICIES_RESOLVED)
+        ):
+            stage_done("firewall_policy_table")
+            return (hostname, cnf)
+
+    if os.path.exists(fp_path):
+        os.remove(fp_path)  # It will be saved again if needed.
+
     fwp = fortios_xutils.make_and_save_firewall_policy_table(
         apath,
         os.path.join(adir, FORTI_FIREWALL_POLICIES)
@@ -126,16 +309,137 @@ def parse_fortigate_config_and_save_files(filepath):
 
     fwr_path = os.path.join(adir, FORTI_FIREWALL_POLICIES_RESOLVED)
     fwp.to_json(fwr_path, orient='records')  # For REST API (get).
-
-    hostname = os.path.basename(os.path.split(apath)[0])
+    utils.save_compressed_copies(fwr_path)
+    save_firewall_policy_index(fwp, os.path.join(adir,
+                                                 FORTI_FIREWALL_POLICIES))
+    save_firewall_policy_columns(os.path.join(adir, FORTI_FIREWALL_POLICIES))
+    if fprint:
+        utils.save_file_atomically(fprint.encode("utf-8"), fp_path)
+    stage_done("firewall_policy_table")
 
     return (hostname, cnf)
 
 
-def load_firewall_policy_table(hostname, datadir=None):
+class PolicyTableCache():
+    """
+    An LRU cache of firewall policy tables loaded, keyed by the path and the
+    stat (mtime and size) of each file, and limited by the total size of the
+    tables in memory. Tables are loaded again if these files were replaced.
+    """
+    def __init__(self, max_size=FORTI_FIREWALL_POLICIES_CACHE_SIZE):
+        """
+        :param max_size: Max size in bytes of tables to keep
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._tables = collections.OrderedDict()  # {path: (stat, tbl, size)}
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        """Evict least recently used tables until it fits in the budget.
+        """
+        while self._tables and self.size > self.max_size:
+            (_fpath, (_stat, _tbl, size)) = self._tables.popitem(last=False)
+            self.size -= size
+
+    def _pop(self, fpath):
+        """Remove the table of `fpath` if it's kept.
+        """
+        if fpath in self._tables:
+            self.size -= self._tables.pop(fpath)[-1]
+
+    def get(self, fpath, load_fn, size_fn=None, key=None):
+        """
+        :param fpath: Path to the file contains firewall policy table data
+        :param load_fn: A callable to load the table from `fpath`
+        :param size_fn:
+            A callable to compute the size in bytes of the object loaded, or
+            None to compute the size of :class:`pandas.DataFrame` objects
+        :param key:
+            A key to cache the object loaded instead of `fpath`, to cache
+            objects made from the same file, e.g. the index of the table
+
+        :return:
+            A :class:`pandas.DataFrame` object gives firewall policy table data
+        :raises: IOError, OSError, ValueError
+        """
+        fst = os.stat(fpath)
+        stat = (fst.st_mtime_ns, fst.st_size)
+        if key is None:
+            key = fpath
+
+        with self._lock:
+            if key in self._tables and self._tables[key][0] == stat:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return self._tables[key][1]
+
+            self.misses += 1
+            self._pop(key)  # It was replaced.
+
+        tbl = load_fn(fpath)
+        if size_fn is None:
+            size = int(tbl.memory_usage(index=True, deep=True).sum())
+        else:
+            size = size_fn(tbl)
+
+        with self._lock:
+            self._pop(key)
+            if size <= self.max_size:
+                self._tables[key] = (stat, tbl, size)
+                self.size += size
+                self._evict()
+
+        return tbl
+
+    def resize(self, max_size):
+        """
+        :param max_size: Max size in bytes of tables to keep
+        """
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self):
+        """Clear tables kept and counters.
+        """
+        with self._lock:
+            self._tables.clear()
+            self.size = self.hits = self.misses = 0
+
+    def stats(self):
+        """
+        :return:
+            A mapping object, {hits, misses, entries, size, max_size}, gives
+            the statistics of the cache
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        entries=len(self._tables), size=self.size,
+                        max_size=self.max_size)
+
+
+def _policy_table_cache_size():
+    """
+    :return: Max size in bytes of firewall policy tables kept in memory
+    """
+    size = os.environ.get(FORTI_FIREWALL_POLICIES_CACHE_SIZE_ENV, "")
+    try:
+        return int(size)
+    except ValueError:
+        return FORTI_FIREWALL_POLICIES_CACHE_SIZE
+
+
+POLICY_TABLE_CACHE = PolicyTableCache(_policy_table_cache_size())
+
+
+def load_firewall_policy_table(hostname, datadir=None, cache=True):
     """
     :param hostname: Hostname
     :param datadir: Path to the top dir for data files
+    :param cache: Use the in-process cache of tables if True
 
     :return:
         A :class:`pandas.DataFrame` object gives firewall policy table data
@@ -145,19 +449,519 @@ def load_firewall_policy_table(hostname, datadir=None):
     fpath = os.path.join(udir, hostname, FORTI_FIREWALL_POLICIES)
 
     try:
+        if cache:
+            return POLICY_TABLE_CACHE.get(
+                fpath, fortios_xutils.load_firewall_policy_table
+            )
+
         return fortios_xutils.load_firewall_policy_table(fpath)
     except (IOError, OSError, ValueError) as exc:
         raise ValueError("Could not load the firewall policy table "
                          "data: {}, exc={!r}".format(fpath, exc))
 
 
-def search_firewall_policy_by_addr(tbl_rdf, ipa):
+def _file_stat(fpath):
+    """
+    :param fpath: File path
+    :return: A list of [mtime in nanoseconds, size] of the file
+    """
+    fst = os.stat(fpath)
+    return [fst.st_mtime_ns, fst.st_size]
+
+
+def _to_network(addr):
+    """
+    Convert an address in firewall policy tables to a network object in the
+    same way as :func:`fortios_xutils.netutils.to_network`, that is, an
+    address with host bits set, e.g. 10.0.1.2/24, means the host.
+
+    :param addr: A str gives an address, e.g. 10.0.1.0/24, 10.0.1.2/32
+    :return: A IPv*Network object or None if `addr` is not an address
+
+    >>> _to_network("10.0.1.0/24")
+    IPv4Network('10.0.1.0/24')
+    >>> _to_network("10.0.1.2/24")
+    IPv4Network('10.0.1.2/32')
+    >>> _to_network("www.example.com") is None
+    True
+    """
+    try:
+        return ipaddress.ip_network(addr)
+    except ValueError:
+        try:
+            return ipaddress.ip_network(addr.split('/')[0])
+        except ValueError:
+            return None
+
+
+def make_firewall_policy_index(tbl_rdf):
+    """
+    Make the index of addresses in firewall policy table `tbl_rdf`.
+
+    :param tbl_rdf: A :class:`pandas.DataFrame` object gives the table
+    :return:
+        A :class:`nof.lib.netaddrs.NetworkIndex` object maps networks to the
+        index labels of rows in `tbl_rdf` have them
+    """
+    idx = netaddrs.NetworkIndex()
+    for col in FORTI_FIREWALL_POLICIES_ADDRS_COLS:
+        if col not in tbl_rdf:
+            continue
+
+        for label, addrs in tbl_rdf[col].items():
+            if not isinstance(addrs, (list, tuple)):
+                continue
+
+            for net in (_to_network(a) for a in addrs if isinstance(a, str)):
+                if net is not None:
+                    idx.add(net, int(label))
+
+    return idx
+
+
+def save_firewall_policy_index(tbl_rdf, tpath):
     """
-    :param tbl_rdf: A :class:`pandas.DataFrame` object to search
+    Make and save the index of addresses in firewall policy table `tbl_rdf`
+    saved as `tpath`.
+
+    :param tbl_rdf: A :class:`pandas.DataFrame` object gives the table
+    :param tpath: Path to the file the table was saved
+    """
+    idx = make_firewall_policy_index(tbl_rdf)
+    content = json.dumps(dict(table=_file_stat(tpath),
+                              networks=idx.to_list()))
+    utils.save_file_atomically(
+        content.encode("utf-8"),
+        os.path.join(os.path.dirname(tpath), FORTI_FIREWALL_POLICIES_INDEX)
+    )
+
+
+def _load_firewall_policy_index(tpath):
+    """
+    Load the index of addresses in firewall policy table saved as `tpath`, or
+    make it from the table if the index was not saved or it's stale.
+
+    :param tpath: Path to the file the table was saved
+    :return: A :class:`nof.lib.netaddrs.NetworkIndex` object
+    """
+    ipath = os.path.join(os.path.dirname(tpath), FORTI_FIREWALL_POLICIES_INDEX)
+    try:
+        with open(ipath) as inp:
+            data = json.load(inp)
+
+        if data.get("table") == _file_stat(tpath):
+            return netaddrs.NetworkIndex.from_list(data["networks"])
+
+        LOG.warning("The index is stale: %s", ipath)
+    except (IOError, OSError, ValueError, KeyError, TypeError) as exc:
+        LOG.warning("Could not load the index: %s, exc=%r", ipath, exc)
+
+    return make_firewall_policy_index_from_ranges(
+        _cached_firewall_policy_columns(tpath)
+    )
+
+
+def load_firewall_policy_index(hostname, datadir=None):
+    """
+    :param hostname: Hostname
+    :param datadir: Path to the top dir for data files
+
+    :return:
+        A :class:`nof.lib.netaddrs.NetworkIndex` object gives the index of
+        addresses in the firewall policy table
+    :raiess: ValueError
+    """
+    udir = utils.uploaddir(FT_FORTI_SHOW_CONFIG, datadir=datadir)
+    tpath = os.path.join(udir, hostname, FORTI_FIREWALL_POLICIES)
+
+    try:
+        return POLICY_TABLE_CACHE.get(
+            tpath, _load_firewall_policy_index,
+            size_fn=netaddrs.NetworkIndex.nbytes,
+            key=(tpath, FORTI_FIREWALL_POLICIES_INDEX)
+        )
+    except (IOError, OSError, ValueError) as exc:
+        raise ValueError("Could not load the index of the firewall policy "
+                         "table: {}, exc={!r}".format(tpath, exc))
+
+
+def make_firewall_policy_index_from_ranges(table):
+    """
+    Make the index of addresses in firewall policy table `table` from the
+    address ranges of rows in it, without loading the whole table.
+
+    :param table:
+        A :class:`nof.lib.coltable.ColumnarTable` object gives the table
+    :return: A :class:`nof.lib.netaddrs.NetworkIndex` object, see
+        :func:`make_firewall_policy_index`
+    """
+    (rows, starts, ends) = table.ranges()
+    labels = table.labels()[rows].tolist()
+
+    idx = netaddrs.NetworkIndex()
+    for label, start, end in zip(labels, starts.tolist(), ends.tolist()):
+        prefix = 32 - (end - start + 1).bit_length() + 1
+        idx.add(ipaddress.IPv4Network((start, prefix)), label)
+
+    return idx
+
+
+def save_firewall_policy_columns(tpath):
+    """
+    Save the firewall policy table saved as `tpath` in the columnar format,
+    see :mod:`nof.lib.coltable`.
+
+    The table is loaded from `tpath` to keep the types of values in it same
+    as these of the table loaded from the file.
+
+    :param tpath: Path to the file the table was saved
+    :return: Path to the file of the table in the columnar format
+    """
+    tbl = fortios_xutils.load_firewall_policy_table(tpath)
+    content = coltable.dumps(tbl, meta=dict(table=_file_stat(tpath)),
+                             range_cols=FORTI_FIREWALL_POLICIES_ADDRS_COLS,
+                             to_network=_to_network)
+
+    cpath = os.path.join(os.path.dirname(tpath),
+                         FORTI_FIREWALL_POLICIES_COLUMNS)
+    utils.save_file_atomically(content, cpath)
+
+    return cpath
+
+
+def _load_firewall_policy_columns(tpath):
+    """
+    Load the firewall policy table in the columnar format, or save it in the
+    format from the table saved as `tpath` if it was not saved or it's stale.
+
+    :param tpath: Path to the file the table was saved
+    :return: A :class:`nof.lib.coltable.ColumnarTable` object
+    """
+    cpath = os.path.join(os.path.dirname(tpath),
+                         FORTI_FIREWALL_POLICIES_COLUMNS)
+    try:
+        table = coltable.ColumnarTable(cpath)
+        if table.meta.get("table") == _file_stat(tpath):
+            return table
+
+        LOG.warning("The table in the columnar format is stale: %s", cpath)
+    except (IOError, OSError, ValueError) as exc:
+        LOG.warning("Could not load the table in the columnar format: %s, "
+                    "exc=%r", cpath, exc)
+
+    return coltable.ColumnarTable(save_firewall_policy_columns(tpath))
+
+
+def _cached_firewall_policy_columns(tpath):
+    """
+    :param tpath: Path to the file the table was saved
+    :return: A :class:`nof.lib.coltable.ColumnarTable` object, see
+        :func:`_load_firewall_policy_columns`
+    """
+    return POLICY_TABLE_CACHE.get(tpath, _load_firewall_policy_columns,
+                                  size_fn=coltable.ColumnarTable.nbytes,
+                                  key=(tpath, FORTI_FIREWALL_POLICIES_COLUMNS))
+
+
+def load_firewall_policy_columns(hostname, datadir=None):
+    """
+    :param hostname: Hostname
+    :param datadir: Path to the top dir for data files
+
+    :return:
+        A :class:`nof.lib.coltable.ColumnarTable` object gives the firewall
+        policy table loaded by memory mapping
+    :raiess: ValueError
+    """
+    udir = utils.uploaddir(FT_FORTI_SHOW_CONFIG, datadir=datadir)
+    tpath = os.path.join(udir, hostname, FORTI_FIREWALL_POLICIES)
+
+    try:
+        return _cached_firewall_policy_columns(tpath)
+    except (IOError, OSError, ValueError) as exc:
+        raise ValueError("Could not load the firewall policy table "
+                         "data: {}, exc={!r}".format(tpath, exc))
+
+
+def search_firewall_policy_by_addr(table, ipa, index=None):
+    """
+    :param table:
+        A :class:`nof.lib.coltable.ColumnarTable` object to search, see
+        :func:`load_firewall_policy_columns`, or a :class:`pandas.DataFrame`
+        object to search all rows of it
     :param ipa: A str gives an ip address to find nodes
+    :param index:
+        A :class:`nof.lib.netaddrs.NetworkIndex` object gives the index of
+        addresses in `table` to search, see
+        :func:`make_firewall_policy_index`, or None to search address
+        ranges of all rows
 
     :return: A list of mappping objects contains results
+    :raises: ValueError
+    """
+    if isinstance(table, pandas.DataFrame):
+        return fortios_xutils.search_firewall_policy_table_by_addr(ipa, table)
+
+    if not isinstance(ipa, str):
+        raise ValueError("Expected a str but: {!r}".format(ipa))
+
+    ipa = ipaddress.ip_interface(ipa).ip
+    if index is None:
+        rows = table.rows_containing(ipa) if ipa.version == 4 else []
+    else:
+        rows = table.positions(index.lookup(ipa))
+
+    return table.records(rows)
+
+
+def search_firewall_policies_by_addrs(table, addrs, index):
+    """
+    Search firewall policies match each of ip addresses or networks `addrs`
+    in a batch. A network matches policies have networks contain or are
+    contained in it.
+
+    Rows matched are converted to mapping objects at once and shared among
+    results.
+
+    :param table:
+        A :class:`nof.lib.coltable.ColumnarTable` object to search, see
+        :func:`load_firewall_policy_columns`
+    :param addrs: A list of str gives ip addresses or networks
+    :param index:
+        A :class:`nof.lib.netaddrs.NetworkIndex` object gives the index of
+        addresses in `table`, see :func:`make_firewall_policy_index`
+
+    :return:
+        An iterator yields a mapping object, {addr, policies} or {addr,
+        error} if `addr` is not an ip address or network, for each `addrs`
+    """
+    queries = []  # [(addr, [position] or None, error or None)]
+    for addr in addrs:
+        try:
+            if not isinstance(addr, str):
+                raise ValueError("Expected a str but: {!r}".format(addr))
+
+            net = ipaddress.ip_network(addr, strict=False)
+            rows = table.positions(index.lookup_network(net))
+            queries.append((addr, rows, None))
+        except ValueError as exc:
+            queries.append((addr, None, str(exc)))
+
+    rows = sorted(set(itertools.chain.from_iterable(
+        r for _a, r, _e in queries if r
+    )))
+    recs = dict(zip(rows, table.records(rows)))
+
+    for addr, rows, err in queries:
+        if err is None:
+            yield dict(addr=addr, policies=[recs[r] for r in rows])
+        else:
+            yield dict(addr=addr, error=err)
+
+
+def _to_text(val):
+    """
+    :param val: A value in a cell of firewall policy tables
+    :return: A str to search and sort the cell
+
+    >>> _to_text(["10.0.0.1/32", "10.0.0.2/32"])
+    '10.0.0.1/32 10.0.0.2/32'
+    >>> _to_text(None), _to_text(float("nan")), _to_text("ALL")
+    ('', '', 'all')
+    """
+    if isinstance(val, (list, tuple)):
+        return " ".join(_to_text(v) for v in val)
+
+    if val is None or val != val:  # None or NaN
+        return ''
+
+    return str(val).lower()
+
+
+def make_firewall_policy_texts(table):
+    """
+    :param table:
+        A :class:`nof.lib.coltable.ColumnarTable` object gives the table
+    :return:
+        A :class:`pandas.DataFrame` object gives texts (lower case str) of
+        each cell of `table` to search and sort rows, indexed by positions
     """
-    return fortios_xutils.search_firewall_policy_table_by_addr(ipa, tbl_rdf)
+    return pandas.DataFrame(collections.OrderedDict(
+        (c, table.map_values(c, _to_text)) for c in table.columns
+    ), index=range(len(table)))
+
+
+def _load_firewall_policy_texts(tpath):
+    """
+    :param tpath: Path to the file the table was saved
+    :return: A :class:`pandas.DataFrame` object, see
+        :func:`make_firewall_policy_texts`
+    """
+    return make_firewall_policy_texts(_cached_firewall_policy_columns(tpath))
+
+
+def load_firewall_policy_texts(hostname, datadir=None):
+    """
+    :param hostname: Hostname
+    :param datadir: Path to the top dir for data files
+
+    :return:
+        A :class:`pandas.DataFrame` object gives texts of cells of the
+        firewall policy table, see :func:`make_firewall_policy_texts`
+    :raiess: ValueError
+    """
+    udir = utils.uploaddir(FT_FORTI_SHOW_CONFIG, datadir=datadir)
+    tpath = os.path.join(udir, hostname, FORTI_FIREWALL_POLICIES)
+
+    try:
+        return POLICY_TABLE_CACHE.get(tpath, _load_firewall_policy_texts,
+                                      key=(tpath, "texts"))
+    except (IOError, OSError, ValueError) as exc:
+        raise ValueError("Could not load the firewall policy table "
+                         "data: {}, exc={!r}".format(tpath, exc))
+
+
+def _sort_keys(table, texts, col):
+    """
+    :param table:
+        A :class:`nof.lib.coltable.ColumnarTable` object gives the table
+    :param texts: A :class:`pandas.DataFrame` object gives texts of cells
+    :param col: The name of a column
+    :return: An array of keys of rows to sort them by the column
+    """
+    nums = table.numbers(col)
+    return texts[col].to_numpy() if nums is None else nums
+
+
+def query_firewall_policy_table(table, texts, start=0, length=-1,
+                                search=None, searches=None, orders=None):
+    """
+    Filter, sort and slice rows of firewall policy table `table`.
+
+    :param table:
+        A :class:`nof.lib.coltable.ColumnarTable` object gives the table
+    :param texts:
+        A :class:`pandas.DataFrame` object gives texts of cells of `table`,
+        see :func:`make_firewall_policy_texts`
+    :param start: Position of the first row to return
+    :param length: Max number of rows to return or -1 (all rows)
+    :param search:
+        A tuple of (a str to search, a list of names of columns to search)
+        or None; rows have the str in any of these columns match
+    :param searches:
+        A list of tuples of (name of a column, a str to search); rows have
+        the str in all of these columns match
+    :param orders:
+        A list of tuples of (name of a column, True if ascending order) to
+        sort rows by
+
+    :return:
+        A tuple of (number of rows matched, a list of mapping objects gives
+        rows in the range)
+    """
+    mask = pandas.Series(True, index=texts.index)
+    if search and search[0]:
+        cols = [c for c in search[1] if c in texts]
+        mask &= functools.reduce(
+            operator.or_,
+            (texts[c].str.contains(search[0].lower(), regex=False)
+             for c in cols),
+            pandas.Series(False, index=texts.index)
+        )
+
+    for col, val in searches or []:
+        if col in texts and val:
+            mask &= texts[col].str.contains(val.lower(), regex=False)
+
+    rows = texts.index[mask.to_numpy()]
+    orders = [(c, asc) for c, asc in orders or [] if c in texts]
+    if orders and len(rows):
+        keys = pandas.DataFrame(dict(
+            (str(i), _sort_keys(table, texts, c)[rows])
+            for i, (c, _asc) in enumerate(orders)
+        ), index=rows)
+        rows = keys.sort_values(list(keys.columns),
+                                ascending=[asc for _c, asc in orders],
+                                kind="mergesort").index
+
+    end = len(rows) if length is None or length < 0 else start + length
+    return (len(rows), table.records(list(rows[start:end])))
+
+
+def _load_items(fpath):
+    """
+    :param fpath: Path to the file of configs, e.g. firewall_address.json
+    :return: A list of mapping objects gives edits in the file or []
+    """
+    if not os.path.exists(fpath):
+        return []
+
+    with open(fpath) as inp:
+        items = json.load(inp)
+
+    return items if isinstance(items, list) else []  # A config w/o edits.
+
+
+def _version_info(hdir):
+    """
+    :param hdir: Dir to save parsed results of a host
+    :return: A mapping object, {timestamp, filename}, gives the version
+    """
+    with open(os.path.join(hdir, FORTI_CNF_META)) as inp:
+        meta = json.load(inp)
+
+    return dict(timestamp=meta.get("timestamp"),
+                filename=os.path.basename(meta.get("origina_data") or ''))
+
+
+def diff_firewall_configs(hostname, kinds=None, datadir=None):
+    """
+    Compare firewall policies and objects of the current and the previous
+    versions of parsed results of the host, see :mod:`nof.lib.diffs`.
+
+    :param hostname: Hostname
+    :param kinds:
+        A list of kinds of items to compare, see :data:`FORTI_DIFF_SOURCES`,
+        or None (all kinds)
+    :param datadir: Path to the top dir for data files
+
+    :return:
+        A mapping object, {hostname, current, previous, diffs}, and diffs is
+        a mapping object, {<kind>: {added, removed, modified}}
+    :raiess: ValueError
+    """
+    if kinds is None:
+        kinds = list(FORTI_DIFF_SOURCES)
+
+    unknowns = [k for k in kinds if k not in FORTI_DIFF_SOURCES]
+    if unknowns:
+        raise ValueError("Unknown kinds of items: {!r}".format(unknowns))
+
+    hdir = os.path.join(utils.uploaddir(FT_FORTI_SHOW_CONFIG, datadir=datadir),
+                        hostname)
+    pdir = os.path.join(hdir, fortios.PREVIOUS_DIR)
+    try:
+        res = dict(hostname=hostname, current=_version_info(hdir),
+                   previous=_version_info(pdir),
+                   diffs=collections.OrderedDict())
+
+        for kind in kinds:
+            (fname, key) = FORTI_DIFF_SOURCES[kind]
+            (opath, npath) = (os.path.join(pdir, fname),
+                              os.path.join(hdir, fname))
+            if fname == FORTI_FIREWALL_POLICIES:
+                res["diffs"][kind] = diffs.diff_tables(
+                    _cached_firewall_policy_columns(opath),
+                    _cached_firewall_policy_columns(npath), key=key
+                )
+            else:
+                res["diffs"][kind] = diffs.diff_items(
+                    _load_items(opath), _load_items(npath), key=key
+                )
+    except (IOError, OSError, ValueError) as exc:
+        raise ValueError("Could not compare the current and the previous "
+                         "versions: {}, exc={!r}".format(hostname, exc))
+
+    return res
 
 # vim:sw=4:ts=4:et:
@@ -33,7 +33,7 @@ def _get_networks(filename):
     filename = utils.uploaded_filename(filename)
     ftype = FT_NETWORKS
 
-    return flask.send_from_directory(utils.uploaddir(ftype), filename)
+    return libs.send_file_with_encodings(utils.uploaddir(ftype), filename)
 
 
 def _upload_networks(filename):
@@ -43,18 +43,11 @@ def _upload_networks(filename):
     :param filename: a str gives a name of the networks JSON data file
     """
     url_prefix = UP_GET_PATH
-    payload = flask.request.get_data()
-
-    content = payload.decode("utf-8")
     ftype = FT_NETWORKS
-    fpath = utils.uploaded_filepath(filename, ftype, content=content)
     try:
-        utils.ensure_dir_exists(fpath)
-
-        # It does not look work...
-        # net_data = anyconfig.loads(content, ac_parser="json")
-        # anyconfig.dump(net_data, fpath)
-        open(fpath, 'wb').write(payload)
+        fpath = utils.save_uploaded_stream(flask.request.stream, filename,
+                                           ftype)
+        utils.save_compressed_copies(fpath)
         net_data = anyconfig.load(fpath, ac_parser="json")
 
     except (IOError, OSError, ValueError, RuntimeError) as exc:
@@ -62,10 +55,10 @@ def _upload_networks(filename):
                     dict(code="Invalid data",
                          message="Uploaded data was invalid "
                                  "or something goes wrong. "
-                                 "exc={!r} content="
-                                 "{!r}".format(exc, content)))
+                                 "exc={!r} filename="
+                                 "{!r}".format(exc, filename)))
 
-    filename = utils.uploaded_filename(filename, content=content)
+    filename = os.path.basename(fpath)
 
     resp = flask.jsonify(net_data)
     resp.headers["Location"] = os.path.join(url_prefix, filename)
@@ -49,15 +49,11 @@ def index():
     if form.validate_on_submit():
         ndata = form.upload.data
         ndata.seek(0)
-        content = ndata.read().decode("utf-8")
-        fpath = utils.uploaded_filepath(ndata.filename, ftype,
-                                        content=content)
+        fpath = utils.save_uploaded_stream(ndata.stream, ndata.filename,
+                                           ftype)
+        utils.save_compressed_copies(fpath)
         filename = os.path.basename(fpath)
 
-        utils.ensure_dir_exists(fpath)
-        # ndata.save() does not work as expected
-        open(fpath, 'w').write(content)
-
         msg = u"File was successfully uploaded."
         return flask.render_template(tmpl, filename=filename, msg=msg, **octxs)
 
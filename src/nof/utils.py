@@ -4,17 +4,57 @@
 #
 """Global utility routines
 """
-import functools
+import collections
+import contextlib
 import glob
+import gzip
 import hashlib
 import os.path
 import os
+import shutil
+import tempfile
+import threading
 
 import werkzeug
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 from . import globals
 
 
+# Size of chunks to read files to compute checksums, and max number of
+# checksums of files cached.
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+CHECKSUM_CACHE_SIZE = 128
+
+_CHECKSUMS = collections.OrderedDict()  # {<key>: <checksum>}
+_CHECKSUMS_LOCK = threading.Lock()
+
+# Lock file to serialize updates of files in each dir among processes.
+LOCK_FILENAME = ".lock"
+
+# Content encodings of compressed copies of files saved next to them, and
+# the suffix of each copy, in the order of preference to send.
+COMPRESSED_COPY_SUFFIXES = collections.OrderedDict((
+    ("br", ".br"),
+    ("zstd", ".zst"),
+    ("gzip", ".gz"),
+))
+
+
 def datadir_maybe_from_env():
     """
     :return: data top dir of this app
@@ -38,13 +78,70 @@ def uploaddir(file_type, datadir=None):
     return os.path.join(datadir, "uploads", file_type)
 
 
-@functools.lru_cache(maxsize=32)
+def checksum_stream(stream, hash_fn=hashlib.sha1,
+                    chunk_size=CHECKSUM_CHUNK_SIZE):
+    """
+    Compute the checksum of byte data read from `stream` in chunks.
+
+    :param stream: A file or file-like object opened in binary mode
+    :param hash_fn: Hash algorithm to compute the checksum
+    :param chunk_size: Size of each chunk to read
+
+    :return: A str gives the checksum value of the data
+    """
+    hobj = hash_fn()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    while True:
+        size = stream.readinto(buf)
+        if not size:
+            break
+        hobj.update(view[:size])
+
+    return hobj.hexdigest()
+
+
+def checksum_file(filepath, hash_fn=hashlib.sha1):
+    """
+    Compute the checksum of given file, `filepath`, in chunks.
+
+    Results are cached by the path, the inode number, the mtime and the size
+    of the file, so that it's computed only once until the file is changed.
+
+    :param filepath: Path to the file to compuste its checksum
+    :param hash_fn: Hash algorithm to compute the checksum
+
+    :return: A str gives the checksum value of the given file's content
+    :raises: IOError, OSError
+    """
+    with open(filepath, 'rb') as inp:
+        stat = os.fstat(inp.fileno())
+        key = (os.path.abspath(filepath), stat.st_ino, stat.st_mtime_ns,
+               stat.st_size, hash_fn().name)
+
+        with _CHECKSUMS_LOCK:
+            if key in _CHECKSUMS:
+                _CHECKSUMS.move_to_end(key)
+                return _CHECKSUMS[key]
+
+        chksm = checksum_stream(inp, hash_fn=hash_fn)
+
+    with _CHECKSUMS_LOCK:
+        _CHECKSUMS[key] = chksm
+        while len(_CHECKSUMS) > CHECKSUM_CACHE_SIZE:
+            _CHECKSUMS.popitem(last=False)
+
+    return chksm
+
+
 def checksum(filepath=None, content=None, hash_fn=hashlib.sha1):
     """
-    Compute the checksum of given file, `filepath`
+    Compute the checksum of given file, `filepath`, or `content`.
 
     :param filepath: Absolute path to the file to compuste its checksum
-    :param content: a (unicode) str gives the content of the file
+    :param content:
+        Byte data or a (unicode) str gives the content of the file, and the
+        latter is encoded in UTF-8 to compute its checksum
     :param hash_fn: Hash algorithm to compute the checksum
 
     :return: A str gives the checksum value of the given file's content
@@ -53,10 +150,12 @@ def checksum(filepath=None, content=None, hash_fn=hashlib.sha1):
         if filepath is None:
             raise ValueError("Either `filepath` or `content` must be given!")
 
-        content = open(filepath).read()
+        return checksum_file(filepath, hash_fn=hash_fn)
+
+    if isinstance(content, str):
+        content = content.encode("utf-8")
 
-    # content (unicode str) must be encoded to the byte data.
-    return hash_fn(content.encode("utf-8")).hexdigest()
+    return hash_fn(content).hexdigest()
 
 
 def uploaded_filename(filename, content=None):
@@ -65,17 +164,35 @@ def uploaded_filename(filename, content=None):
     content in a consistent way.
 
     :param filename: Original maybe unsecure file name
-    :param content: a (unicode) str gives the content of the file
+    :param content: Byte data or a (unicode) str gives the content of the file
 
     :return: A str gives a file name
     """
-    fbase = werkzeug.utils.secure_filename(filename)
     if content is None:
-        return fbase  # It's the name of uploaded file.
+        # It's the name of uploaded file.
+        return werkzeug.utils.secure_filename(filename)
+
+    # filepath is not fixed yet.
+    return _uploaded_filename(filename, checksum(content=content))
+
+
+def _uploaded_filename(filename, chksm):
+    """
+    :param filename: Original maybe unsecure file name
+    :param chksm: Checksum of the content of the file
+    """
+    return "{}-{}".format(chksm, werkzeug.utils.secure_filename(filename))
+
 
-    chksm = checksum(content=content)  # filepath is not fixed yet.
+def uploaded_file_checksum(filepath):
+    """
+    :param filepath: Path to the file uploaded, see :func:`uploaded_filename`
+    :return: A str gives the checksum of the content of the file
 
-    return "{}-{}".format(chksm, fbase)
+    >>> uploaded_file_checksum("/a/b/e91ba0972b-hello.txt")
+    'e91ba0972b'
+    """
+    return os.path.basename(filepath).split('-', 1)[0]
 
 
 def uploaded_filepath(filename, file_type, content=None, datadir=None):
@@ -88,7 +205,7 @@ def uploaded_filepath(filename, file_type, content=None, datadir=None):
         former case, the content of the file must be given also.
 
     :param file_type: type of file to upload
-    :param content: a (unicode) str gives the content of the file
+    :param content: Byte data or a (unicode) str gives the content of the file
     :param datadir: top dir to save data files
 
     :return: A str gives a absolute file path
@@ -99,13 +216,220 @@ def uploaded_filepath(filename, file_type, content=None, datadir=None):
     return os.path.join(udir, fname)
 
 
+def _umask():
+    """
+    Get the umask of the process without changing it if possible, as
+    :func:`os.umask` changes it for all threads even while it's read.
+
+    :return: An int gives the umask
+    """
+    try:
+        with open("/proc/self/status") as inp:
+            for line in inp:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def save_uploaded_stream(stream, filename, file_type, datadir=None,
+                         chunk_size=CHECKSUM_CHUNK_SIZE):
+    """
+    Save byte data read from `stream` in chunks to the file in upload dir,
+    and its path is same as :func:`uploaded_filepath` computes from the data.
+
+    The data is written to a temporary file in upload dir and its checksum is
+    computed at the same time, and then the file is renamed atomically.
+
+    :param stream: A file or file-like object opened in binary mode
+    :param filename: The name of the original maybe unsecure file
+    :param file_type: type of file to upload
+    :param datadir: top dir to save data files
+    :param chunk_size: Size of each chunk to read
+
+    :return: A str gives a absolute file path
+    :raises: IOError, OSError
+    """
+    udir = uploaddir(file_type, datadir=datadir)
+    os.makedirs(udir, exist_ok=True)
+
+    hobj = hashlib.sha1()  # .. seealso:: :func:`checksum`
+    (fd, tmppath) = tempfile.mkstemp(dir=udir, prefix=".upload-",
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                hobj.update(chunk)
+                out.write(chunk)
+
+        # The temporary file is only readable by the owner; make the mode
+        # of the file same as other files created with open().
+        os.chmod(tmppath, 0o666 & ~_umask())
+
+        fpath = os.path.join(udir,
+                             _uploaded_filename(filename, hobj.hexdigest()))
+        os.replace(tmppath, fpath)
+
+    except (IOError, OSError):
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+    return fpath
+
+
 def ensure_dir_exists(filepath):
     """Ensure dir for filepath exists
     """
     tdir = os.path.dirname(filepath)
 
     if not os.path.exists(tdir):
-        os.makedirs(tdir)
+        os.makedirs(tdir, exist_ok=True)  # It may be made in other threads.
+
+
+@contextlib.contextmanager
+def dir_locked(dirpath):
+    """
+    Lock the dir `dirpath` exclusively with the lock file in it while in the
+    context, to serialize updates of files in it among processes and threads.
+    It's not locked if file locks are not supported on the platform.
+
+    :param dirpath: Path to the dir to lock, made if it does not exist
+    """
+    os.makedirs(dirpath, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+
+    with open(os.path.join(dirpath, LOCK_FILENAME), 'a') as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def save_file_atomically(content, filepath):
+    """
+    Save byte data `content` to `filepath` atomically; it's written to a
+    temporary file in the same dir and renamed to `filepath` at last.
+
+    :param content: Byte data to save
+    :param filepath: Path to the file to save `content`
+
+    :return: Size of `content` in bytes
+    """
+    ensure_dir_exists(filepath)
+    tmppath = "{}.{}-{}.tmp".format(filepath, os.getpid(),
+                                    threading.get_ident())
+    try:
+        with open(tmppath, 'wb') as out:
+            out.write(content)
+        os.replace(tmppath, filepath)
+    except (IOError, OSError):
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+    return len(content)
+
+
+def _gzip_copy(inp, out):
+    """Compress data read from `inp` in gzip format and write it to `out`.
+    """
+    with gzip.GzipFile(fileobj=out, mode="wb", mtime=0) as gout:
+        shutil.copyfileobj(inp, gout, CHECKSUM_CHUNK_SIZE)
+
+
+def _zstd_copy(inp, out):
+    """Compress data read from `inp` in zstd format and write it to `out`.
+    """
+    zstandard.ZstdCompressor().copy_stream(inp, out)
+
+
+def _brotli_copy(inp, out):
+    """Compress data read from `inp` in brotli format and write it to `out`.
+    """
+    comp = brotli.Compressor()
+    for chunk in iter(lambda: inp.read(CHECKSUM_CHUNK_SIZE), b''):
+        out.write(comp.process(chunk))
+    out.write(comp.finish())
+
+
+def compressed_copy_encodings():
+    """
+    :return:
+        A list of content encodings of compressed copies available, see
+        :data:`COMPRESSED_COPY_SUFFIXES`
+    """
+    mods = dict(br=brotli, zstd=zstandard)
+    return [enc for enc in COMPRESSED_COPY_SUFFIXES
+            if enc not in mods or mods[enc] is not None]
+
+
+def compressed_copy_path(filepath, encoding):
+    """
+    :param filepath: Path to the original file
+    :param encoding: Content encoding of the copy, e.g. gzip
+
+    :return:
+        Path to the compressed copy of `filepath` if it's up to date, or None
+
+    >>> compressed_copy_path("/not/exist.json", "gzip") is None
+    True
+    """
+    cpath = filepath + COMPRESSED_COPY_SUFFIXES[encoding]
+    try:
+        if os.stat(cpath).st_mtime_ns == os.stat(filepath).st_mtime_ns:
+            return cpath
+    except (IOError, OSError):
+        pass
+
+    return None
+
+
+def save_compressed_copies(filepath):
+    """
+    Save compressed copies of `filepath` next to it in all of the content
+    encodings available, to send them to clients accept these, and compute
+    the checksum of the file in advance to make its ETag.
+
+    Copies have the same mtime as `filepath` to tell they are up to date,
+    see :func:`compressed_copy_path`.
+
+    :param filepath: Path to the file
+    :return: A list of paths to the copies
+    :raises: IOError, OSError
+    """
+    copy_fns = dict(br=_brotli_copy, zstd=_zstd_copy, gzip=_gzip_copy)
+    stat = os.stat(filepath)
+
+    res = []
+    for enc in compressed_copy_encodings():
+        cpath = filepath + COMPRESSED_COPY_SUFFIXES[enc]
+        tmppath = "{}.{}-{}.tmp".format(cpath, os.getpid(),
+                                        threading.get_ident())
+        try:
+            with open(filepath, 'rb') as inp, open(tmppath, 'wb') as out:
+                copy_fns[enc](inp, out)
+            os.utime(tmppath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmppath, cpath)
+        except (IOError, OSError):
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+        res.append(cpath)
+
+    checksum_file(filepath)
+    return res
 
 
 def list_filenames(pattern=None, datadir=None):
@@ -0,0 +1,37 @@
+#
+# Copyright (C) 2021 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+# pylint: disable=invalid-name,missing-function-docstring
+""".fortios.cli test cases
+"""
+import json
+import os.path
+
+from . import common
+
+
+class CLI_TestCase(common.TestBase):
+
+    def test_10_bulk_upload(self):
+        archive = os.path.join(self.workdir, "test.zip")
+        common.make_archive(self.cnf_files, archive, "zip")
+
+        runner = self.app.test_cli_runner()
+        res = runner.invoke(args=["fortios", "bulk-upload", archive])
+        self.assertEqual(res.exit_code, 0, res.output)
+        self.assertEqual([r["hostname"] for r in json.loads(res.output)],
+                         self.hostnames)
+
+    def test_20_bulk_upload__errors(self):
+        archive = os.path.join(self.workdir, "test.zip")
+        common.make_archive([__file__], archive, "zip")
+
+        runner = self.app.test_cli_runner()
+        res = runner.invoke(args=["fortios", "bulk-upload", archive])
+        self.assertEqual(res.exit_code, 1, res.output)
+
+        res = runner.invoke(args=["fortios", "bulk-upload", __file__])
+        self.assertNotEqual(res.exit_code, 0, res.output)
+
+# vim:sw=4:ts=4:et:
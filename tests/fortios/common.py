@@ -5,16 +5,41 @@
 # pylint: disable=invalid-name,missing-function-docstring
 """.fortios.v1api test cases
 """
+import concurrent.futures
+import json
 import os.path
 import shutil
+import socket
+import tarfile
+import time
+import zipfile
+
+import mock
 
 import nof.fortios.common as TT
+import nof.lib.jobs as jobs
 import nof.libs
 import nof.utils
 
 from .. import common as C
 
 
+def make_archive(filepaths, archive, fmt="tar"):
+    """
+    :param filepaths: A list of paths to the files to archive
+    :param archive: Path to the archive to make
+    :param fmt: Archive format, tar or zip
+    """
+    if fmt == "zip":
+        with zipfile.ZipFile(archive, 'w') as zarc:
+            for fpath in filepaths:
+                zarc.write(fpath, os.path.join("a", os.path.basename(fpath)))
+    else:
+        with tarfile.open(archive, "w:gz") as tarc:
+            for fpath in filepaths:
+                tarc.add(fpath, os.path.join("a", os.path.basename(fpath)))
+
+
 class TestBase(C.BluePrintTestCaseWithWorkdir):
 
     # .. seealso:: tests/res/forti/show_configs/*.txt, hostname value.
@@ -64,6 +89,134 @@ class TestCase(TestBase):
                 all(fname in res for fname in nof.libs.FORTI_FILENAMES)
             )
 
+    def test_36_upload_forti_show_config__reused(self):
+        fpath = self.cnf_files[0]
+        payload = open(fpath, 'rb').read()
+        fname = os.path.basename(fpath)
+
+        res = TT.upload_forti_show_config(fname, payload)
+        self.assertFalse(res["reused"])
+
+        with mock.patch.object(
+            nof.libs, "parse_fortigate_config_and_save_files"
+        ) as parse_fn:
+            ref = TT.upload_forti_show_config(fname, payload)
+            self.assertTrue(ref["reused"])
+            self.assertFalse(parse_fn.called)
+
+        self.assertEqual(ref["hostname"], res["hostname"])
+        self.assertEqual(ref["filenames"], res["filenames"])
+
+        res = TT.upload_forti_show_config(fname, payload, force=True)
+        self.assertFalse(res["reused"])
+
+        # The results were overwritten with other data of the host.
+        mpath = os.path.join(TT.host_uploaddir(res["hostname"]),
+                             nof.libs.FORTI_CNF_META)
+        metadata = json.load(open(mpath))
+        metadata["origina_data"] = "/some/other/data.txt"
+        json.dump(metadata, open(mpath, 'w'))
+
+        res = TT.upload_forti_show_config(fname, payload)
+        self.assertFalse(res["reused"])
+
+    def test_40_bulk_upload_forti_show_configs(self):
+        for fmt in ("tar", "zip"):
+            archive = os.path.join(self.workdir, "test." + fmt)
+            make_archive(self.cnf_files + [__file__], archive, fmt)
+
+            res = TT.bulk_upload_forti_show_configs(open(archive, 'rb'),
+                                                    workers=2)
+            self.assertEqual([r["hostname"] for r in res],
+                             self.hostnames + [None])
+            self.assertEqual(res[0]["filename"],
+                             "a/" + os.path.basename(self.cnf_files[0]))
+            self.assertTrue(all(r["filenames"] for r in res[:-1]))
+            self.assertTrue(res[-1]["error"])
+
+    def test_42_bulk_upload_forti_show_configs__not_archive(self):
+        self.assertRaises(RuntimeError, TT.bulk_upload_forti_show_configs,
+                          b"not an archive")
+
+    def test_44_bulk_upload_forti_show_configs__same_host(self):
+        archive = os.path.join(self.workdir, "test.tar")
+        make_archive(self.cnf_files[:1] * 4, archive)
+
+        res = TT.bulk_upload_forti_show_configs(open(archive, 'rb'),
+                                                workers=4, force=True)
+        self.assertEqual([(r["hostname"], r["error"]) for r in res],
+                         [(self.hostnames[0], None)] * 4)
+
+        mpath = os.path.join(TT.host_uploaddir(self.hostnames[0]),
+                             nof.libs.FORTI_CNF_META)
+        self.assertEqual(json.load(open(mpath))["hostname"],
+                         self.hostnames[0])
+
+    def test_45_bulk_upload_forti_show_configs__same_host_in_order(self):
+        content = open(self.cnf_files[0]).read()
+        fpaths = [os.path.join(self.workdir, f) for f in ("b.txt", "a.txt")]
+        for fpath, comment in zip(fpaths, ("older", "newer")):
+            with open(fpath, 'w') as out:
+                out.write(content.replace(
+                    "config system global",
+                    "#comments={}\nconfig system global".format(comment), 1
+                ))
+
+        archive = os.path.join(self.workdir, "test.tar")
+        make_archive(fpaths + self.cnf_files[1:], archive)
+
+        res = TT.bulk_upload_forti_show_configs(open(archive, 'rb'),
+                                                workers=3)
+        self.assertEqual([(r["hostname"], r["error"]) for r in res],
+                         [(h, None) for h
+                          in self.hostnames[:1] * 2 + self.hostnames[1:]])
+
+        # The last one in the archive is the latest data of the host.
+        mpath = os.path.join(TT.host_uploaddir(self.hostnames[0]),
+                             nof.libs.FORTI_CNF_META)
+        self.assertTrue(json.load(open(mpath))["origina_data"]
+                        .endswith("-a.txt"))
+
+    def test_46_bulk_upload_forti_show_configs__unexpected_errors(self):
+        archive = os.path.join(self.workdir, "test.tar")
+        make_archive(self.cnf_files, archive)
+
+        with mock.patch.object(TT, "process_uploaded_file",
+                               side_effect=IndexError("oops")):
+            res = TT.bulk_upload_forti_show_configs(open(archive, 'rb'),
+                                                    workers=2)
+        self.assertEqual([(r["hostname"], r["error"]) for r in res],
+                         [(None, "oops")] * len(self.cnf_files))
+
+        fut = concurrent.futures.Future()
+        fut.set_exception(concurrent.futures.process.BrokenProcessPool("x"))
+        self.assertEqual(
+            TT._uploaded_files_results(  # pylint: disable=protected-access
+                fut, 2
+            ),
+            [dict(hostname=None, reused=False, error="x")] * 2
+        )
+
+    def test_48_get_job__orphan(self):
+        fpath = nof.utils.save_uploaded_stream(
+            open(self.cnf_files[0], 'rb'), "a.txt",
+            nof.libs.FT_FORTI_SHOW_CONFIG
+        )
+        queue = TT.job_queue()
+        job = queue.enqueue(TT.JOB_KIND, dict(filepath=fpath))
+
+        # Claimed by a process exited before restart.
+        queue.claim(worker="{}:{}:x".format(socket.gethostname(),
+                                            2 ** 22 + 1))
+        for _i in range(600):
+            job = TT.get_job(job["id"])
+            if job["state"] not in (jobs.ST_QUEUED, jobs.ST_RUNNING):
+                break
+            time.sleep(0.1)
+
+        self.assertEqual(job["state"], jobs.ST_DONE, job)
+        self.assertEqual(job["result"]["hostname"], self.hostnames[0])
+
     def test_30_find_firewall_policy_by_addr__no_data(self):
         for hname in self.hostnames:
             self.assertRaises(
@@ -83,4 +236,26 @@ class TestCase(TestBase):
             res = TT.find_firewall_policy_by_addr(hname, "192.168.2.2")
             self.assertTrue(res)
 
+    def test_38_find_firewall_policy_by_addr_in_all_hosts(self):
+        self._arrange_uploaded_and_procecced_files()
+        res = list(TT.find_firewall_policy_by_addr_in_all_hosts(
+            "192.168.3.5", hostnames=self.hostnames + ["not_exist"]
+        ))
+        self.assertEqual(sorted(r["hostname"] for r in res),
+                         sorted(self.hostnames + ["not_exist"]))
+
+        for ref in res:
+            if ref["hostname"] == "not_exist":
+                self.assertTrue(ref["error"])
+            else:
+                self.assertEqual(
+                    ref["policies"],
+                    TT.find_firewall_policy_by_addr(ref["hostname"],
+                                                    "192.168.3.5")
+                )
+
+        res = list(TT.find_firewall_policy_by_addr_in_all_hosts("127.0.0.1"))
+        self.assertEqual(sorted(r["hostname"] for r in res), self.hostnames)
+        self.assertFalse(any(r["policies"] for r in res))
+
 # vim:sw=4:ts=4:et:
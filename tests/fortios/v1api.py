@@ -5,7 +5,10 @@
 # pylint: disable=invalid-name,missing-function-docstring
 """.fortios.v1api test cases
 """
+import gzip
+import json
 import os.path
+import time
 
 import anyconfig
 
@@ -19,8 +22,12 @@ from . import common
 
 # .. seealso:: nof.fortios.v1api
 UP_PREFIX = os.path.join(API_PREFIX, "upload/")
+JOB_PREFIX = os.path.join(API_PREFIX, "jobs/")
 GET_PREFIX = os.path.join(API_PREFIX, "configs/")
 FIND_PREFIX = os.path.join(API_PREFIX, "firewall/policies/by_addr/")
+FIND_BATCH_PREFIX = os.path.join(API_PREFIX, "firewall/policies/by_addrs/")
+TABLE_PREFIX = os.path.join(API_PREFIX, "firewall/policies/table/")
+DIFF_PREFIX = os.path.join(API_PREFIX, "firewall/diffs/")
 
 
 class V1_API_10_TestCase(common.TestBase):
@@ -60,6 +67,15 @@ class V1_API_10_TestCase(common.TestBase):
             )
             self.assertTrue(os.path.exists(upath))
 
+            # The result of the same data processed is returned.
+            resp = self.client.post(rpath, data=content, headers=headers)
+            self.assert200(resp, resp.data)
+            self.assertTrue(resp.json["reused"])
+
+            resp = self.client.post(rpath + "?force=1", data=content,
+                                    headers=headers)
+            self.assertStatus(resp, 201, resp.data)
+
             # API: index
             resp = self.client.get(API_PREFIX + TT.IDX_PATH)
             self.assert200(resp)
@@ -70,6 +86,49 @@ class V1_API_10_TestCase(common.TestBase):
             # self.assertStatus(resp, ?, resp.data)  # FIXME
             self.assertTrue(resp.data)
 
+    def test_14_upload_show_config__async(self):
+        for hname, fpath in zip(self.hosts, self.cnf_files):
+            rpath = os.path.join(UP_PREFIX, os.path.basename(fpath))
+            headers = {"content-type": "text/plain"}
+
+            # API: upload_show_config (async)
+            resp = self.client.post(rpath + "?async=1",
+                                    data=open(fpath, 'rb').read(),
+                                    headers=headers)
+            self.assertStatus(resp, 202, resp.data)
+            job = resp.json
+            self.assertEqual(resp.headers["Location"].split('/')[-1],
+                             job["id"])
+
+            # API: get_job
+            for _i in range(600):
+                resp = self.client.get(JOB_PREFIX + job["id"])
+                self.assert200(resp)
+                job = resp.json
+                if job["state"] not in ("queued", "running"):
+                    break
+                time.sleep(0.1)
+
+            self.assertEqual(job["state"], "done", job)
+            self.assertEqual(job["result"]["hostname"], hname)
+            self.assertEqual([s["name"] for s in job["stages"]],
+                             ["parse", "save", "firewall_policy_table"])
+
+        resp = self.client.get(JOB_PREFIX + "not_exist")
+        self.assert404(resp)
+
+    def test_16_bulk_upload_show_configs(self):
+        archive = os.path.join(self.workdir, "test.tar.gz")
+        common.make_archive(self.cnf_files, archive)
+
+        rpath = API_PREFIX + TT.BULK_UP_PATH
+        resp = self.client.post(rpath, data=open(archive, 'rb').read())
+        self.assert200(resp, resp.data)
+        self.assertEqual([r["hostname"] for r in resp.json], self.hosts)
+
+        resp = self.client.post(rpath, data=b"not an archive")
+        self.assertStatus(resp, 400, resp.data)
+
     def test_20_find_firewall_policy_by_ipa__no_data(self):
         for hname in self.hosts:
             upath = os.path.join(FIND_PREFIX, hname, "127.0.0.1")
@@ -115,4 +174,132 @@ class V1_API_10_TestCase(common.TestBase):
             )
             self.assertTrue(res)
 
+    def test_36_find_firewall_policy_by_ipa_in_all_hosts(self):
+        self._arrange_uploaded_and_procecced_files()
+        resp = self.client.get(os.path.join(FIND_PREFIX, "192.168.3.5"))
+        self.assert200(resp)
+
+        res = json.loads(resp.data.decode("utf-8"))
+        self.assertEqual(sorted(r["hostname"] for r in res), self.hostnames)
+        self.assertTrue(all(r["policies"] for r in res))
+
+    def test_40_find_firewall_policies_by_addrs(self):
+        addrs = ["192.168.3.5", "192.168.2.2", "127.0.0.1", "192.168.3.0/24",
+                 "not_an_ip"]
+        self._arrange_uploaded_and_procecced_files()
+        for hname in self.hostnames:
+            upath = os.path.join(FIND_BATCH_PREFIX, hname)
+            resp = self.client.post(upath, json=addrs)
+            self.assert200(resp)
+
+            res = json.loads(resp.data.decode("utf-8"))
+            self.assertEqual([r["addr"] for r in res], addrs)
+            for ref in res[:3]:
+                rpath = os.path.join(FIND_PREFIX, hname, ref["addr"])
+                self.assertEqual(
+                    ref["policies"],
+                    json.loads(self.client.get(rpath).data.decode("utf-8"))
+                )
+            self.assertTrue(res[3]["policies"])
+            self.assertTrue(res[-1]["error"])
+
+    def test_42_find_firewall_policies_by_addrs__invalid_data(self):
+        upath = os.path.join(FIND_BATCH_PREFIX, self.hostnames[0])
+        resp = self.client.post(upath, json=dict(addrs=[]))
+        self.assertStatus(resp, 400, resp.data)
+
+        resp = self.client.post(upath, json=["127.0.0.1"])  # no data.
+        self.assertStatus(resp, 404, resp.data)
+
+    def test_50_firewall_policies_table(self):
+        params = {"draw": "3", "start": "0", "length": "1",
+                  "search[value]": "", "search[regex]": "false",
+                  "order[0][column]": "1", "order[0][dir]": "desc"}
+        for idx, key in enumerate(("edit", "name", "srcaddrs")):
+            params.update({"columns[{}][data]".format(idx): key,
+                           "columns[{}][searchable]".format(idx): "true",
+                           "columns[{}][orderable]".format(idx): "true",
+                           "columns[{}][search][value]".format(idx): ""})
+
+        self._arrange_uploaded_and_procecced_files()
+        for hname in self.hostnames:
+            resp = self.client.get(os.path.join(TABLE_PREFIX, hname),
+                                   query_string=params)
+            self.assert200(resp)
+
+            res = json.loads(resp.data.decode("utf-8"))
+            self.assertEqual(res["draw"], 3)
+            self.assertEqual(res["recordsTotal"], res["recordsFiltered"])
+            self.assertEqual(len(res["data"]), 1)
+
+            resp = self.client.get(os.path.join(TABLE_PREFIX, hname),
+                                   query_string=dict(params, length="-1"))
+            names = [r["name"] for r in json.loads(resp.data)["data"]]
+            self.assertEqual(names, sorted(names, reverse=True))
+            self.assertEqual(res["data"][0]["name"], names[0])
+
+            resp = self.client.get(
+                os.path.join(TABLE_PREFIX, hname),
+                query_string=dict(params, **{"search[value]": "192.168.2.2"})
+            )
+            res = json.loads(resp.data.decode("utf-8"))
+            self.assertEqual(res["recordsFiltered"], 1)
+
+    def test_52_firewall_policies_table__no_data(self):
+        resp = self.client.get(os.path.join(TABLE_PREFIX, "not_exist"),
+                               query_string=dict(draw="1"))
+        self.assert200(resp)
+        res = json.loads(resp.data.decode("utf-8"))
+        self.assertEqual((res["draw"], res["data"]), (1, []))
+        self.assertTrue(res["error"])
+
+    def test_56_diff_firewall_configs(self):
+        (hname, fpath) = (self.hosts[0], self.cnf_files[0])
+        rpath = os.path.join(UP_PREFIX, os.path.basename(fpath))
+        content = open(fpath).read()
+        headers = {"content-type": "text/plain"}
+
+        resp = self.client.post(rpath, data=content, headers=headers)
+        self.assertStatus(resp, 201, resp.data)
+
+        resp = self.client.get(os.path.join(DIFF_PREFIX, hname))
+        self.assert404(resp)
+
+        resp = self.client.post(rpath, headers=headers,
+                                data=content.replace('set name "Test1"',
+                                                     'set name "Test1x"'))
+        self.assertStatus(resp, 201, resp.data)
+
+        resp = self.client.get(os.path.join(DIFF_PREFIX, hname),
+                               query_string=dict(kinds="policies,services"))
+        self.assert200(resp)
+        self.assertEqual(list(resp.json["diffs"]), ["policies", "services"])
+        self.assertEqual([m["changes"] for m
+                          in resp.json["diffs"]["policies"]["modified"]],
+                         [dict(name=["Test1", "Test1x"])])
+
+        resp = self.client.get(os.path.join(DIFF_PREFIX, hname),
+                               query_string=dict(kinds="not_a_kind"))
+        self.assert400(resp)
+
+    def test_60_get_host_config__gzip(self):
+        self._arrange_uploaded_and_procecced_files()
+        for hname in self.hostnames:
+            for fname in (nof.libs.FORTI_CNF_ALL,
+                          nof.libs.FORTI_FIREWALL_POLICIES_RESOLVED):
+                upath = os.path.join(GET_PREFIX, hname, fname)
+                ref = self.client.get(upath)
+                self.assert200(ref)
+
+                resp = self.client.get(upath,
+                                       headers={"Accept-Encoding": "gzip"})
+                self.assert200(resp)
+                self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+                self.assertEqual(gzip.decompress(resp.data), ref.data)
+
+                resp = self.client.get(
+                    upath, headers={"If-None-Match": ref.headers["ETag"]}
+                )
+                self.assertStatus(resp, 304)
+
 # vim:sw=4:ts=4:et:
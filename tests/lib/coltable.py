@@ -0,0 +1,86 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+# pylint: disable=invalid-name,missing-function-docstring
+"""nof.lib.coltable test cases
+"""
+import ipaddress
+import os.path
+import tempfile
+import unittest
+
+import pandas
+
+import nof.lib.coltable as TT
+
+
+def _make_table():
+    return pandas.DataFrame(dict(
+        edit=[10, 2, 33],
+        name=["a", None, "a"],
+        addrs=[["10.0.0.0/24", "10.0.1.1/32"], [], ["::1/128", "fqdn"]],
+        mixed=["all", ["x", "y"], float("nan")],
+    ), index=[5, 7, 9])
+
+
+class ColumnarTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.tbl = _make_table()
+        self.fpath = os.path.join(self.tdir.name, "tbl.columns")
+        with open(self.fpath, "wb") as out:
+            out.write(TT.dumps(self.tbl, meta=dict(a=1), range_cols=["addrs"]))
+
+        self.table = TT.ColumnarTable(self.fpath)
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    def test_10_load(self):
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table.columns, list(self.tbl.columns))
+        self.assertEqual(self.table.meta, dict(a=1))
+        self.assertEqual(self.table.labels().tolist(), [5, 7, 9])
+        self.assertTrue("name" in self.table)
+        self.assertFalse("uuid" in self.table)
+
+    def test_20_records(self):
+        self.assertEqual(self.table.records(range(3)),
+                         self.tbl.fillna('').to_dict(orient="records"))
+        self.assertEqual(self.table.records([2, 0], fill=None),
+                         [dict(edit=33, name="a", addrs=["::1/128", "fqdn"],
+                               mixed=None),
+                          dict(edit=10, name="a",
+                               addrs=["10.0.0.0/24", "10.0.1.1/32"],
+                               mixed="all")])
+        self.assertEqual(self.table.records([]), [])
+
+    def test_30_values(self):
+        self.assertEqual(self.table.values("name"), ["a", None, "a"])
+        self.assertEqual(self.table.values("edit", [1]), [2])
+        self.assertEqual(self.table.numbers("edit").tolist(), [10, 2, 33])
+        self.assertTrue(self.table.numbers("name") is None)
+        self.assertEqual(self.table.map_values("name", str).tolist(),
+                         ["a", "None", "a"])
+        self.assertRaises(KeyError, self.table.values, "uuid")
+
+    def test_40_positions(self):
+        self.assertEqual(self.table.positions([9, 5, 9, 1]), [0, 2])
+
+    def test_50_rows_containing(self):
+        self.assertEqual(len(self.table.ranges()[0]), 2)
+        for ipa, ref in (("10.0.0.1", [0]), ("10.0.1.1", [0]),
+                         ("10.0.1.2", []), ("127.0.0.1", [])):
+            self.assertEqual(
+                self.table.rows_containing(ipaddress.ip_address(ipa)), ref
+            )
+
+    def test_60_load__not_a_table(self):
+        with open(self.fpath, "wb") as out:
+            out.write(b"{}")
+
+        self.assertRaises(ValueError, TT.ColumnarTable, self.fpath)
+
+# vim:sw=4:ts=4:et:
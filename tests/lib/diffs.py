@@ -0,0 +1,104 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+# pylint: disable=invalid-name,missing-function-docstring
+"""nof.lib.diffs test cases
+"""
+import os.path
+import tempfile
+import unittest
+
+import pandas
+
+import nof.lib.coltable as CT
+import nof.lib.diffs as TT
+
+
+OLD_ITEMS = [dict(edit="a", subnet="10.0.0.1"),
+             dict(edit="b", member=["a"]),
+             dict(edit="a", subnet="10.0.0.2"),  # e.g. in another vdom.
+             dict(edit="c")]
+NEW_ITEMS = [dict(edit="a", subnet="10.0.0.1"),
+             dict(edit="b", member=["a", "d"]),
+             dict(edit="d", subnet="10.0.0.4"),
+             dict(edit="a", subnet="10.0.0.3")]
+
+
+class DiffItemsTestCase(unittest.TestCase):
+
+    def test_10_diff_items(self):
+        res = TT.diff_items(OLD_ITEMS, NEW_ITEMS)
+        self.assertEqual(res["added"], [NEW_ITEMS[2]])
+        self.assertEqual(res["removed"], [OLD_ITEMS[3]])
+        self.assertEqual(
+            [(m["key"], m["changes"]) for m in res["modified"]],
+            [("b", dict(member=[["a"], ["a", "d"]])),
+             ("a", dict(subnet=["10.0.0.2", "10.0.0.3"]))]
+        )
+
+    def test_20_diff_items__same(self):
+        self.assertEqual(TT.diff_items(OLD_ITEMS, list(OLD_ITEMS)),
+                         dict(added=[], removed=[], modified=[]))
+
+
+class DiffTablesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    def _table(self, name, tbl):
+        fpath = os.path.join(self.tdir.name, name)
+        with open(fpath, "wb") as out:
+            out.write(CT.dumps(tbl))
+
+        return CT.ColumnarTable(fpath)
+
+    def test_10_diff_tables(self):
+        old = self._table("old", pandas.DataFrame(dict(
+            edit=[1, 2, 3], name=["a", "b", "c"],
+            srcaddrs=[["10.0.0.1/32"], [], None]
+        )))
+        new = self._table("new", pandas.DataFrame(dict(
+            edit=[3, 1, 4], name=["c", "a", "d"],
+            srcaddrs=[["10.0.0.3/32"], ["10.0.0.1/32"], []]
+        )))
+
+        res = TT.diff_tables(old, new)
+        self.assertEqual([r["edit"] for r in res["added"]], [4])
+        self.assertEqual([r["edit"] for r in res["removed"]], [2])
+        self.assertEqual(
+            [(m["key"], m["changes"]) for m in res["modified"]],
+            [(3, dict(srcaddrs=['', ["10.0.0.3/32"]]))]
+        )
+        self.assertEqual(TT.diff_tables(new, new),
+                         dict(added=[], removed=[], modified=[]))
+
+    def test_20_diff_tables__columns_differ(self):
+        old = self._table("old", pandas.DataFrame(dict(edit=[1, 2])))
+        new = self._table("new", pandas.DataFrame(dict(
+            edit=[1, 2], comments=[None, "x"]
+        )))
+
+        res = TT.diff_tables(old, new)
+        self.assertEqual([m["key"] for m in res["modified"]], [2])
+
+    def test_30_diff_tables__int_column_with_nan(self):
+        old = self._table("old", pandas.DataFrame(dict(
+            edit=[1, 2, 3], count=[10, 20, 30]
+        )))
+        new = self._table("new", pandas.DataFrame(dict(
+            edit=[1, 2, 3, 4], count=[10, 20, 31, None]  # float64
+        )))
+
+        res = TT.diff_tables(old, new)
+        self.assertEqual(res["added"], [dict(edit=4, count='')])
+        self.assertEqual(
+            [(m["key"], m["changes"]) for m in res["modified"]],
+            [(3, dict(count=[30, 31]))]
+        )
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,493 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+# pylint: disable=invalid-name,missing-function-docstring
+"""nof.lib.fortios test cases
+"""
+import ipaddress
+import json
+import os.path
+import pickle
+import re
+import sqlite3
+import tempfile
+import unittest
+
+import mock
+
+import nof.lib.fortios as TT
+
+from .. import common as C
+
+
+CNF_FILES = C.list_res_files("forti/show_configs/*.txt")
+
+
+def _load_configs(filepath):
+    return TT.parse_show_config(filepath)["configs"]
+
+
+class ParseShowConfigTestCase(unittest.TestCase):
+
+    def test_10_parse_show_config__ok(self):
+        for cpath in C.list_res_files("fortios/*.txt"):
+            ref = json.load(open(cpath + ".exp/ref.json"))
+            self.assertEqual(TT.parse_show_config(cpath), ref)
+
+    def test_20_parse_show_config__shift_jis(self):
+        content = ("config system global\n" +
+                   "    set admintimeout 5\n" * 10000 +
+                   "    set hostname \"\u30db\u30b9\u30c8\"\nend\n")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cpath = os.path.join(tmpdir, "show.txt")
+            open(cpath, 'wb').write(content.encode("shift-jis"))
+
+            res = TT.parse_show_config(cpath,
+                                       marker=TT.GLOBAL_CONFIG_MARKER)
+            self.assertEqual(res["configs"][0]["hostname"],
+                             "\u30db\u30b9\u30c8")
+
+    def test_22_parse_show_config__parallel(self):
+        for cpath in C.list_res_files("fortios/*.txt"):
+            ref = open(cpath + ".exp/ref.json").read().strip()
+            for chunk_size in (1, 10, TT.PARSE_CHUNK_SIZE):
+                res = TT.parse_show_config(cpath, workers=2,
+                                           chunk_size=chunk_size)
+                self.assertEqual(json.dumps(res), ref)
+
+        for cpath in CNF_FILES:
+            ref = TT.parse_show_config(cpath)
+            res = TT.parse_show_config(cpath, workers=2, chunk_size=100)
+            self.assertEqual(json.dumps(res), json.dumps(ref))
+
+    def test_30_parse_show_config__no_marker(self):
+        for cpath in C.list_res_files("fortios/firewall_*.txt"):
+            self.assertRaises(ValueError, TT.parse_show_config, cpath,
+                              marker=TT.GLOBAL_CONFIG_MARKER)
+
+    def test_40_hostname_from_show_config_file(self):
+        for cpath in CNF_FILES:
+            ref = TT.hostname_from_config_data(TT.parse_show_config(cpath),
+                                               cpath)
+            self.assertEqual(TT.hostname_from_show_config_file(cpath), ref)
+
+        self.assertTrue(TT.hostname_from_show_config_file(__file__) is None)
+
+
+class ParseShowConfigAndDumpTestCase(unittest.TestCase):
+
+    def test_10_parse_show_config_and_dump(self):
+        for cpath in CNF_FILES:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                outpath = os.path.join(tmpdir, TT.ALL_FILENAME)
+                data = TT.parse_show_config_and_dump(cpath, outpath)
+                self.assertEqual(json.load(open(outpath)), data)
+
+                hname = TT.hostname_from_configs(
+                    TT.ConfigIndex(data["configs"])
+                )
+                hdir = os.path.join(tmpdir, hname)
+                meta = json.load(open(os.path.join(hdir,
+                                                   TT.METADATA_FILENAME)))
+                self.assertEqual(meta["hostname"], hname)
+
+                fnames = sorted(
+                    os.path.relpath(os.path.join(dpath, f), hdir)
+                    for dpath, _dnames, fs in os.walk(hdir) for f in fs
+                )
+                self.assertEqual(
+                    sorted(f["filename"] for f in meta["files"]),
+                    [f for f in fnames if f != TT.METADATA_FILENAME]
+                )
+                for stat in meta["files"]:
+                    fpath = os.path.join(hdir, stat["filename"])
+                    self.assertEqual(os.path.getsize(fpath), stat["size"])
+
+
+class ParseShowConfigIncrementallyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.cache = TT.BlockCache(os.path.join(self.workdir,
+                                                TT.BLOCKS_DB_FILENAME))
+
+    def tearDown(self):
+        C.prune_workdir(self.workdir)
+
+    def test_10_parse_show_config_incrementally(self):
+        for cpath in CNF_FILES:
+            ref = TT.parse_show_config(cpath)
+            (res, block_ids) = TT.parse_show_config_incrementally(cpath,
+                                                                  self.cache)
+            self.assertEqual(json.dumps(res), json.dumps(ref))
+            self.assertTrue(all(id(c) in block_ids
+                                for c in res["configs"][:-1]))
+
+            # All blocks should be found in the cache and not parsed again.
+            with mock.patch.object(TT, "parse_lines",
+                                   side_effect=TT.parse_lines) as parse:
+                (res, _bids) = TT.parse_show_config_incrementally(cpath,
+                                                                  self.cache)
+                self.assertEqual(parse.call_count, 1)  # Only comments.
+            self.assertEqual(json.dumps(res), json.dumps(ref))
+
+    def test_12_block_cache__not_json(self):
+        self.cache.put_many({"a": [dict(config="system global")]})
+        with sqlite3.connect(self.cache.dbpath) as conn:
+            conn.execute("INSERT INTO blocks VALUES ('b', ?, 0)",
+                         (pickle.dumps([]), ))
+        conn.close()
+
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]),
+                         dict(a=[dict(config="system global")]))
+
+    def _parse_again(self, cpath, sql=None):
+        ref = TT.parse_show_config(cpath)
+        TT.parse_show_config_incrementally(cpath, self.cache)
+        if sql:
+            with sqlite3.connect(self.cache.dbpath) as conn:
+                conn.execute(sql)
+            conn.close()
+
+        (res, _bids) = TT.parse_show_config_incrementally(cpath, self.cache)
+        self.assertEqual(json.dumps(res), json.dumps(ref))
+
+    def test_14_parse_show_config_incrementally__broken_blocks(self):
+        self._parse_again(CNF_FILES[0], "UPDATE blocks SET data = 'x'")
+
+        # These were parsed and saved again.
+        with sqlite3.connect(self.cache.dbpath) as conn:
+            checksums = [r[0] for r
+                         in conn.execute("SELECT checksum FROM blocks")]
+        conn.close()
+        self.assertEqual(len(self.cache.get_many(checksums)), len(checksums))
+
+    def test_16_parse_show_config_incrementally__pruned_blocks(self):
+        # Blocks are removed after they were found in the cache.
+        with mock.patch.object(self.cache, "get_many", return_value={}):
+            self._parse_again(CNF_FILES[0])
+
+    def test_20_save_configs__unchanged_files(self):
+        cpath = CNF_FILES[-1]
+        (data, block_ids) = TT.parse_show_config_incrementally(cpath,
+                                                               self.cache)
+        (_hname, apath) = TT.save_configs(data, cpath, self.workdir,
+                                          block_ids=block_ids)
+        hdir = os.path.dirname(apath)
+        meta = json.load(open(os.path.join(hdir, TT.METADATA_FILENAME)))
+        self.assertTrue(meta["fingerprints"])
+
+        (data, block_ids) = TT.parse_show_config_incrementally(cpath,
+                                                               self.cache)
+        with mock.patch.object(TT, "dump_files",
+                               side_effect=TT.dump_files) as dump:
+            TT.save_configs(data, cpath, self.workdir, block_ids=block_ids)
+            fnames = list(dump.call_args[0][0])
+
+        self.assertTrue(all(f not in fnames for f in meta["fingerprints"]))
+        self.assertTrue(TT.ALL_FILENAME in fnames)
+
+        meta2 = json.load(open(os.path.join(hdir, TT.METADATA_FILENAME)))
+        self.assertEqual(meta2["fingerprints"], meta["fingerprints"])
+        self.assertEqual(sorted(f["filename"] for f in meta2["files"]),
+                         sorted(f["filename"] for f in meta["files"]))
+
+
+class LoadConfigsByVdomTestCase(unittest.TestCase):
+
+    def test_10_load_configs_by_vdom(self):
+        vdoms = (None, "*", "root", "ro", "not_exist", re.compile(r"r.*"))
+        for cpath in CNF_FILES:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                data = TT.parse_show_config(cpath)
+                (hname, apath) = TT.save_configs(data, cpath, tmpdir)
+                hdir = os.path.dirname(apath)
+                ref = TT.ConfigIndex(TT.load_configs(apath, cache=False))
+
+                for vdom in vdoms:
+                    self.assertEqual(
+                        TT.load_configs_by_vdom(hdir, vdom, cache=False),
+                        ref.list_configs(vdom), (hname, vdom)
+                    )
+
+    def test_20_load_configs_by_vdom__partitions_only(self):
+        cpath = CNF_FILES[-1]  # It has vdoms.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = TT.parse_show_config(cpath)
+            (_hname, apath) = TT.save_configs(data, cpath, tmpdir)
+            hdir = os.path.dirname(apath)
+            ref = TT.ConfigIndex(TT.load_configs(apath, cache=False))
+
+            meta = json.load(open(os.path.join(hdir, TT.METADATA_FILENAME)))
+            self.assertEqual([v["name"] for v in meta["partitions"]["vdoms"]],
+                             ["root", "ro"])
+
+            # Files of other vdoms and all.json should not be loaded.
+            os.remove(apath)
+            os.remove(os.path.join(hdir,
+                                   meta["partitions"]["vdoms"][0]["filename"]))
+            self.assertEqual(TT.load_configs_by_vdom(hdir, "ro", cache=False),
+                             ref.list_configs("ro"))
+
+
+NO_HOSTNAME_CONFIGS = dict(configs=[
+    {"config": "system global", "timezone": "04"},
+    {"config": "system interface",
+     "edits": [{"edit": "port1", "ip": ["10.0.0.1", "255.255.255.0"]}]},
+    {"config": "firewall address",
+     "edits": [{"edit": "net_1",
+                "subnet": ["192.168.1.0", "255.255.255.0"]}]},
+])
+
+
+class NetworksTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.config_files = []
+        for idx, cpath in enumerate(CNF_FILES):
+            outpath = os.path.join(self.workdir, str(idx), TT.ALL_FILENAME)
+            TT.parse_show_config_and_dump(cpath, outpath)
+            self.config_files.append(outpath)
+
+        # It should be ignored.
+        self.config_files.insert(1, os.path.join(self.workdir, "x.json"))
+        C.touch_file(self.config_files[1])
+
+    def tearDown(self):
+        C.prune_workdir(self.workdir)
+
+    def test_10_make_networks_from_config_files(self):
+        res = TT.make_networks_from_config_files(self.config_files)
+        self.assertTrue(res["nodes"])
+        self.assertTrue(res["edges"])
+
+        node_ids = set(n["id"] for n in res["nodes"])
+        self.assertTrue(all(i in node_ids and j in node_ids
+                            for i, j in res["edges"]))
+
+    def test_12_make_network_graph_from_config_files(self):
+        nodes_and_edges = list(
+            TT.collect_net_info_from_files(self.config_files)
+        )
+        graph = TT.make_network_graph_from_config_files(self.config_files)
+
+        self.assertEqual(list(graph.nodes_itr()),
+                         [x for x in nodes_and_edges if isinstance(x, dict)])
+        self.assertEqual(list(graph.edges_itr()),
+                         [x for x in nodes_and_edges if isinstance(x, list)])
+
+    def test_14_dump_networks_from_config_files__streaming(self):
+        ref = TT.make_networks_from_config_files(self.config_files)
+
+        output = os.path.join(self.workdir, "out.json")
+        TT.dump_networks_from_config_files(self.config_files, output,
+                                           streaming=True)
+        self.assertEqual(open(output).read(), json.dumps(ref))
+
+        output = os.path.join(self.workdir, "out.ndjson")
+        TT.dump_networks_from_config_files(self.config_files, output,
+                                           streaming=True)
+        self.assertEqual(
+            [json.loads(line) for line in open(output)],
+            list(TT.collect_net_info_from_files(self.config_files))
+        )
+
+        self.assertRaises(ValueError, TT.dump_networks_from_config_files,
+                          self.config_files,
+                          os.path.join(self.workdir, "out.yml"),
+                          streaming=True)
+
+    def test_16_make_networks_from_config_files__manifest(self):
+        ref = TT.make_networks_from_config_files(self.config_files)
+        manifest = os.path.join(self.workdir, "manifest.json")
+
+        res = TT.make_networks_from_config_files(self.config_files,
+                                                 manifest=manifest)
+        self.assertEqual(res, ref)
+        self.assertEqual(len(json.load(open(manifest))["changes"]),
+                         len(self.config_files))
+
+        res = TT.make_networks_from_config_files(self.config_files,
+                                                 manifest=manifest)
+        self.assertEqual(res, ref)
+        self.assertEqual(json.load(open(manifest))["changes"], [])
+
+        # Swap the contents of two files and make them look changed.
+        (path_0, path_1) = (self.config_files[0], self.config_files[-1])
+        (content_0, content_1) = (open(path_0).read(), open(path_1).read())
+        open(path_0, 'w').write(content_1 + "\n")
+        open(path_1, 'w').write(content_0)
+
+        ref = TT.make_networks_from_config_files(self.config_files)
+        res = TT.make_networks_from_config_files(self.config_files,
+                                                 manifest=manifest)
+        self.assertEqual(res, ref)
+        self.assertEqual(json.load(open(manifest))["changes"],
+                         [path_0, path_1])
+
+    def test_20_make_networks_from_config_files__parallel(self):
+        ref = TT.make_networks_from_config_files(self.config_files)
+        res = TT.make_networks_from_config_files(self.config_files,
+                                                 workers=2)
+        self.assertEqual(res, ref)
+
+    def test_30_collect_net_info_from_files__no_hostname(self):
+        cpath = os.path.join(self.workdir, "no_hostname.json")
+        with open(cpath, 'w') as out:
+            json.dump(NO_HOSTNAME_CONFIGS, out)
+
+        ref = [dict(id=0, name=None, type=TT.NT_FIREWALL,
+                    addrs=["10.0.0.1"]),
+               dict(id=1, name="192.168.1.0/24", type=TT.NT_NETWORK,
+                    addrs=["192.168.1.0/24"]),
+               [0, 1]]
+        self.assertEqual(list(TT.collect_net_info_from_files([cpath])), ref)
+        self.assertEqual(
+            TT.make_networks_from_config_files([cpath]),
+            dict(nodes=ref[:2], edges=ref[2:])
+        )
+        self.assertEqual(
+            list(TT.collect_net_info_from_files([cpath], workers=2)), ref
+        )
+
+
+class FirewallNetworksTestCase(unittest.TestCase):
+
+    subnets = [["192.168.1.0", "255.255.255.0"],
+               ["10.1.2.0", "255.255.255.128"],
+               ["10.1.2.3", "255.255.255.255"],  # host
+               ["10.0.0.0", "0.255.255.255"],    # host mask
+               ["10.0.0.1", "255.0.0.0"],        # host bits set
+               ["a.b.c.d", "255.255.255.0"],
+               ["172.16.0.0", "255.240.0.0"],
+               ["192.168.1.0", "255.255.255.0"],
+               ["010.0.0.0", "255.0.0.0"],       # zero-padded (octal)
+               ["10.1", "255.255.0.0"],          # short form
+               ["1.2.3.0 junk", "255.255.255.0"],
+               "10.0.0.0/24",                    # not a pair
+               ["10.2.0.0", "255.255.0.0", "x"]]
+
+    def test_10_firewall_networks_from_configs(self):
+        cnfs = [{"config": "system global", "hostname": "a"},
+                {"config": "firewall address",
+                 "edits": [dict(edit=str(i), subnet=s) for i, s
+                           in enumerate(self.subnets)] + [dict(edit="x")]}]
+        for max_prefix in (8, 24, 30):
+            ref = [n for n in (TT._firewall_network(s, max_prefix)
+                               for s in self.subnets) if n is not None]
+            self.assertEqual(
+                TT.firewall_networks_from_configs(cnfs, max_prefix), ref
+            )
+
+        res = TT.firewall_networks_from_configs(cnfs)
+        self.assertFalse(ipaddress.ip_network("8.0.0.0/8") in res)
+        self.assertTrue(ipaddress.ip_network("10.2.0.0/16") in res)
+
+    def test_20_summarize_networks(self):
+        nets = [ipaddress.ip_network("192.168.122.0/25"),
+                ipaddress.ip_network("192.168.122.128/25")]
+        for prefix in (None, 16):
+            ref = TT.summarize_networks(*nets, prefix=prefix)
+            self.assertEqual(
+                TT.summarize_networks(*(nets * TT.SUMMARIZE_PACKED_MIN),
+                                      prefix=prefix), ref
+            )
+
+
+class LoadConfigsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.filepath = os.path.join(self.workdir, TT.ALL_FILENAME)
+        TT.parse_show_config_and_dump(CNF_FILES[0], self.filepath)
+        TT.clear_cache()
+
+    def tearDown(self):
+        TT.clear_cache()
+        C.prune_workdir(self.workdir)
+
+    def test_10_load_configs__cache(self):
+        ref = TT.load_configs(self.filepath, cache=False)
+        res = TT.load_configs(self.filepath)
+        self.assertEqual(res, ref)
+
+        # Copies of data are loaded from the in-process cache.
+        res[0]["edits"] = []
+        res = TT.load_configs(self.filepath)
+        self.assertEqual(res, ref)
+        self.assertFalse(TT.load_configs(self.filepath) is res)
+
+    def test_20_load_configs__cache_refreshed(self):
+        TT.load_configs(self.filepath)
+
+        data = json.load(open(self.filepath))
+        data["configs"] = data["configs"][:1]
+        with open(self.filepath, 'w') as out:
+            json.dump(data, out)
+
+        self.assertEqual(TT.load_configs(self.filepath), data["configs"])
+        TT.clear_cache()
+        self.assertEqual(TT.load_configs(self.filepath), data["configs"])
+
+    def test_30_load_configs__cache_max_size(self):
+        ref = TT.load_configs(self.filepath, cache=False)
+        cache = TT._CACHE  # pylint: disable=protected-access
+        size = os.path.getsize(self.filepath)
+        for max_size, ref_size in ((size * 10, 1), (10, 0)):
+            TT.clear_cache()
+            with mock.patch.dict(os.environ,
+                                 {TT.CACHE_MAX_SIZE_ENV: str(max_size)}):
+                self.assertEqual(TT.load_configs(self.filepath), ref)
+                self.assertEqual(len(cache), ref_size)
+
+
+class ConfigIndexTestCase(unittest.TestCase):
+
+    names = ("system global", "system interface", "firewall address",
+             "system.*", re.compile(r"firewall (service|addrgrp).*"),
+             "not exists")
+
+    def test_10_configs_by_name(self):
+        for cpath in CNF_FILES:
+            cnfs = _load_configs(cpath)
+            fwcnfs = TT.list_configs_from_configs_data(cnfs)
+            idx = TT.ConfigIndex(cnfs)
+
+            self.assertEqual(idx.configs, fwcnfs)
+            for name in self.names:
+                self.assertEqual(TT.configs_by_name(idx, name),
+                                 TT.configs_by_name(fwcnfs, name))
+                self.assertEqual(TT.edits_by_config_name(idx, name),
+                                 TT.edits_by_config_name(fwcnfs, name))
+
+    def test_20_vdoms(self):
+        for cpath in CNF_FILES:
+            cnfs = _load_configs(cpath)
+            idx = TT.ConfigIndex(cnfs)
+
+            self.assertEqual(idx.vdoms, TT.list_vdom_names(cnfs))
+            self.assertEqual(TT.has_vdom(idx), TT.has_vdom(cnfs))
+
+            for vdom in idx.vdoms + ["not_exist", "r*"]:
+                self.assertEqual(
+                    TT.list_configs_from_configs_data(idx, vdom=vdom),
+                    TT.list_configs_from_configs_data(cnfs, vdom=vdom)
+                )
+
+    def test_30_helpers(self):
+        for cpath in CNF_FILES:
+            cnfs = _load_configs(cpath)
+            fwcnfs = TT.list_configs_from_configs_data(cnfs)
+            idx = TT.ConfigIndex(cnfs)
+
+            self.assertEqual(TT.hostname_from_configs(idx),
+                             TT.hostname_from_configs(fwcnfs))
+            self.assertEqual(list(TT.interface_ip_addrs_from_configs(idx)),
+                             list(TT.interface_ip_addrs_from_configs(fwcnfs)))
+            self.assertEqual(list(TT.firewall_networks_from_configs(idx)),
+                             list(TT.firewall_networks_from_configs(fwcnfs)))
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,96 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+# pylint: disable=invalid-name,missing-function-docstring
+"""nof.lib.jobs test cases
+"""
+import os.path
+import socket
+import tempfile
+import unittest
+
+import nof.lib.jobs as TT
+
+
+def _handler(params, stage_fn):
+    if params.get("fail"):
+        raise ValueError("failed")
+
+    stage_fn("a", 0.1)
+    stage_fn("b", 0.2)
+    return dict(sum=params["x"] + params["y"])
+
+
+class JobQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue = TT.JobQueue(os.path.join(self.tmpdir.name, "a/jobs.db"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_10_enqueue_and_claim(self):
+        job_0 = self.queue.enqueue("test", dict(x=1, y=2))
+        job_1 = self.queue.enqueue("test", dict(x=3, y=4))
+        self.assertEqual(job_0["state"], TT.ST_QUEUED)
+        self.assertEqual(job_0["params"], dict(x=1, y=2))
+        self.assertEqual(self.queue.get(job_0["id"]), job_0)
+        self.assertTrue(self.queue.get("not_exist") is None)
+
+        res = self.queue.claim()
+        self.assertEqual(res["id"], job_0["id"])
+        self.assertEqual(res["state"], TT.ST_RUNNING)
+        self.assertEqual(res["worker"], TT.worker_id())
+
+        self.assertEqual(self.queue.claim()["id"], job_1["id"])
+        self.assertTrue(self.queue.claim() is None)
+
+    def test_20_run(self):
+        job_0 = self.queue.enqueue("test", dict(x=1, y=2))
+        job_1 = self.queue.enqueue("test", dict(fail=True))
+        job_2 = self.queue.enqueue("unknown", {})
+
+        self.assertEqual(self.queue.run(dict(test=_handler)), 3)
+
+        res = self.queue.get(job_0["id"])
+        self.assertEqual(res["state"], TT.ST_DONE)
+        self.assertEqual(res["result"], dict(sum=3))
+        self.assertEqual(res["stages"], [dict(name="a", elapsed=0.1),
+                                         dict(name="b", elapsed=0.2)])
+
+        for job in (job_1, job_2):
+            res = self.queue.get(job["id"])
+            self.assertEqual(res["state"], TT.ST_FAILED)
+            self.assertTrue(res["error"])
+
+    def test_30_requeue_orphans(self):
+        job_0 = self.queue.enqueue("test", dict(x=1, y=2))
+        job_1 = self.queue.enqueue("test", dict(x=3, y=4))
+
+        # The former one looks claimed by a process already exited; pid is
+        # greater than the max of pids (2 ** 22) in linux.
+        worker = "{}:{}".format(socket.gethostname(), 2 ** 22 + 1)
+        self.queue.claim(worker=worker)
+        self.queue.claim()
+
+        self.assertEqual(self.queue.requeue_orphans(), [job_0["id"]])
+        self.assertEqual(self.queue.get(job_0["id"])["state"], TT.ST_QUEUED)
+        self.assertEqual(self.queue.get(job_1["id"])["state"],
+                         TT.ST_RUNNING)
+
+    def test_32_requeue_orphans__pid_reused(self):
+        job_0 = self.queue.enqueue("test", dict(x=1, y=2))
+
+        # Claimed by a process had the same pid as the current one, e.g.
+        # PID 1 in the container restarted.
+        worker = "{}:{}:{}".format(socket.gethostname(), os.getpid(),
+                                   "another_process")
+        self.queue.claim(worker=worker)
+
+        self.assertTrue(TT.is_alive(TT.worker_id()))
+        self.assertFalse(TT.is_alive(worker))
+        self.assertEqual(self.queue.requeue_orphans(), [job_0["id"]])
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,75 @@
+#
+# Copyright (C) 2020 Satoru SATOH <ssato@redhat.com>.
+# SPDX-License-Identifier: MIT
+#
+# pylint: disable=invalid-name,missing-function-docstring
+"""nof.lib.netaddrs test cases
+"""
+import ipaddress
+import random
+import unittest
+
+import mock
+
+import nof.lib.netaddrs as TT
+
+
+def _random_networks(num, version=4, seed=0):
+    rnd = random.Random(seed)
+    width = TT.WIDTHS[version]
+    base = rnd.getrandbits(width)
+
+    return [ipaddress.ip_network((base ^ rnd.getrandbits(rnd.randint(0, 24)),
+                                  rnd.randint(width - 24, width)),
+                                 strict=False)
+            for _ in range(num)]
+
+
+class PackedNetworksTestCase(unittest.TestCase):
+
+    nets_list = [_random_networks(100, ver, seed)
+                 for ver in TT.WIDTHS for seed in range(5)]
+
+    def _assert_collapse(self):
+        for nets in self.nets_list:
+            self.assertEqual(TT.collapse_networks(nets),
+                             list(ipaddress.collapse_addresses(nets)))
+
+    def _assert_cap_prefix(self, max_prefix=24):
+        for nets in self.nets_list:
+            ref = [n.supernet(new_prefix=max_prefix)
+                   if n.prefixlen > max_prefix else n for n in nets]
+            res = TT.PackedNetworks.from_networks(nets).cap_prefix(max_prefix)
+            self.assertEqual(res.to_networks(), ref)
+
+    def _assert_summarize_batch(self):
+        for nets in self.nets_list:
+            pnets = TT.PackedNetworks.from_networks(nets)
+            prefix = min(n.prefixlen for n in nets)
+            res = pnets.summarize_batch(list(range(0, len(nets), 10)),
+                                        prefix=prefix)
+            for idx, snet in zip(range(0, len(nets), 10), res):
+                sups = set(n.supernet(new_prefix=prefix)
+                           for n in nets[idx:idx + 10])
+                if len(sups) == 1:
+                    self.assertEqual(snet, (int(sups.pop().network_address),
+                                            prefix))
+                else:
+                    self.assertTrue(snet is None)
+
+    def test_10_collapse(self):
+        self._assert_collapse()
+
+    def test_20_cap_prefix(self):
+        self._assert_cap_prefix()
+
+    def test_30_summarize_batch(self):
+        self._assert_summarize_batch()
+
+    @mock.patch.object(TT, "numpy", None)
+    def test_40_without_numpy(self):
+        self._assert_collapse()
+        self._assert_cap_prefix()
+        self._assert_summarize_batch()
+
+# vim:sw=4:ts=4:et:
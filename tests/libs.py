@@ -5,9 +5,18 @@
 """nof.libs test cases
 """
 import glob
+import os
 import os.path
+import shutil
+import unittest
+
+import mock
+import pandas
 
 import nof.libs as TT
+import nof.utils
+
+from nof.globals import FT_FORTI_SHOW_CONFIG
 
 from . import common as C
 
@@ -24,4 +33,295 @@ class V1_API_10_TestCase(C.BluePrintTestCaseWithWorkdir):
                                             '*', "*.json"))
             self.assertTrue(ofiles)
 
+    def test_20_parse_fortigate_config_and_save_files__incremental(self):
+        src = self.cnf_files[0]
+        (hname, _cnf) = TT.parse_fortigate_config_and_save_files(
+            src, incremental=True
+        )
+        hdir = os.path.join(os.path.dirname(src), hname)
+        self.assertTrue(os.path.exists(
+            os.path.join(hdir, TT.FORTI_FIREWALL_POLICIES_FINGERPRINT)
+        ))
+
+        # The firewall policy table should not be made again.
+        with mock.patch.object(
+            TT.fortios_xutils, "make_and_save_firewall_policy_table"
+        ) as make_fn:
+            TT.parse_fortigate_config_and_save_files(src, incremental=True)
+            self.assertFalse(make_fn.called)
+
+
+class FirewallPolicyIndexTestCase(unittest.TestCase):
+
+    ipas = ("127.0.0.1", "192.168.122.1", "192.168.122.254", "192.168.2.2",
+            "192.168.3.5", "192.168.3.4", "10.0.0.1")
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        udir = nof.utils.uploaddir(FT_FORTI_SHOW_CONFIG, self.workdir)
+        os.makedirs(udir)
+
+        self.hostnames = []
+        for src in C.list_res_files("forti/show_configs/*.txt"):
+            fpath = os.path.join(udir, os.path.basename(src))
+            shutil.copy(src, fpath)
+            (hname, _cnf) = TT.parse_fortigate_config_and_save_files(fpath)
+            self.hostnames.append(hname)
+
+        TT.POLICY_TABLE_CACHE.clear()
+
+    def tearDown(self):
+        TT.POLICY_TABLE_CACHE.clear()
+        C.prune_workdir(self.workdir)
+
+    def _assert_search_results(self, hname):
+        tbl = TT.load_firewall_policy_table(hname, datadir=self.workdir)
+        table = TT.load_firewall_policy_columns(hname, datadir=self.workdir)
+        idx = TT.load_firewall_policy_index(hname, datadir=self.workdir)
+        self.assertTrue(len(idx))
+
+        for ipa in self.ipas:
+            ref = TT.search_firewall_policy_by_addr(tbl, ipa)
+            self.assertEqual(
+                TT.search_firewall_policy_by_addr(table, ipa, index=idx),
+                ref, (hname, ipa)
+            )
+            self.assertEqual(TT.search_firewall_policy_by_addr(table, ipa),
+                             ref, (hname, ipa))
+
+    def test_10_search_firewall_policy_by_addr__index(self):
+        for hname in self.hostnames:
+            with mock.patch.object(TT, "make_firewall_policy_index") as fn:
+                self._assert_search_results(hname)
+                self.assertFalse(fn.called)  # It was loaded from the file.
+
+    def test_20_search_firewall_policy_by_addr__index_not_saved(self):
+        for hname in self.hostnames:
+            udir = nof.utils.uploaddir(FT_FORTI_SHOW_CONFIG, self.workdir)
+            os.remove(os.path.join(udir, hname,
+                                   TT.FORTI_FIREWALL_POLICIES_INDEX))
+            self._assert_search_results(hname)
+
+    def test_22_search_firewall_policy_by_addr__columns_not_saved(self):
+        udir = nof.utils.uploaddir(FT_FORTI_SHOW_CONFIG, self.workdir)
+        for hname in self.hostnames:
+            for fname in (TT.FORTI_FIREWALL_POLICIES_INDEX,
+                          TT.FORTI_FIREWALL_POLICIES_COLUMNS):
+                os.remove(os.path.join(udir, hname, fname))
+
+            self._assert_search_results(hname)
+            self.assertTrue(os.path.exists(
+                os.path.join(udir, hname, TT.FORTI_FIREWALL_POLICIES_COLUMNS)
+            ))
+
+    def test_24_load_firewall_policy_columns__stale(self):
+        hname = self.hostnames[0]
+        udir = nof.utils.uploaddir(FT_FORTI_SHOW_CONFIG, self.workdir)
+        tpath = os.path.join(udir, hname, TT.FORTI_FIREWALL_POLICIES)
+        os.utime(tpath, ns=(0, 0))
+
+        table = TT.load_firewall_policy_columns(hname, datadir=self.workdir)
+        self.assertEqual(table.meta["table"], TT._file_stat(tpath))
+
+    def test_26_load_firewall_policy_columns__records(self):
+        for hname in self.hostnames:
+            tbl = TT.load_firewall_policy_table(hname, datadir=self.workdir)
+            table = TT.load_firewall_policy_columns(hname,
+                                                    datadir=self.workdir)
+
+            self.assertEqual(table.columns, list(tbl.columns))
+            self.assertEqual(table.records(range(len(table))),
+                             tbl.fillna('').to_dict(orient="records"))
+
+    def test_30_search_firewall_policy_by_addr__invalid_ipa(self):
+        hname = self.hostnames[0]
+        tbl = TT.load_firewall_policy_columns(hname, datadir=self.workdir)
+        idx = TT.load_firewall_policy_index(hname, datadir=self.workdir)
+
+        self.assertRaises(ValueError, TT.search_firewall_policy_by_addr,
+                          tbl, "not_an_ip", index=idx)
+
+    def test_40_search_firewall_policies_by_addrs(self):
+        for hname in self.hostnames:
+            tbl = TT.load_firewall_policy_columns(hname,
+                                                  datadir=self.workdir)
+            idx = TT.load_firewall_policy_index(hname, datadir=self.workdir)
+
+            res = list(TT.search_firewall_policies_by_addrs(
+                tbl, self.ipas + ("192.168.0.0/16", None), idx
+            ))
+            for ipa, ref in zip(self.ipas, res):
+                self.assertEqual(
+                    ref, dict(addr=ipa,
+                              policies=TT.search_firewall_policy_by_addr(
+                                  tbl, ipa, index=idx
+                              ))
+                )
+
+            self.assertEqual(
+                [r["edit"] for r in res[-2]["policies"]],
+                [r["edit"] for r in tbl.records(range(len(tbl)))
+                 if r["srcaddrs"] or r["dstaddrs"]]
+            )
+            self.assertTrue(res[-1]["error"])
+
+    def test_50_query_firewall_policy_table(self):
+        hname = self.hostnames[-1]
+        tbl = TT.load_firewall_policy_columns(hname, datadir=self.workdir)
+        texts = TT.load_firewall_policy_texts(hname, datadir=self.workdir)
+        edits = tbl.values("edit")
+
+        (cnt, res) = TT.query_firewall_policy_table(tbl, texts)
+        self.assertEqual((cnt, [r["edit"] for r in res]), (len(tbl), edits))
+
+        (cnt, res) = TT.query_firewall_policy_table(
+            tbl, texts, start=1, length=2, orders=[("edit", False)]
+        )
+        self.assertEqual((cnt, [r["edit"] for r in res]),
+                         (len(tbl), sorted(edits, reverse=True)[1:3]))
+
+        (cnt, res) = TT.query_firewall_policy_table(
+            tbl, texts, search=("192.168.122.", ["srcaddrs", "dstaddrs"]),
+            orders=[("name", True)]
+        )
+        self.assertTrue(0 < cnt < len(tbl))
+        self.assertEqual([r["name"] for r in res],
+                         sorted(r["name"] for r in res))
+
+        (cnt, res) = TT.query_firewall_policy_table(
+            tbl, texts, searches=[("srcaddrs", "192.168.2.2"),
+                                  ("action", "ACCEPT")]
+        )
+        self.assertEqual(cnt, 1)
+        self.assertTrue("192.168.2.2/32" in res[0]["srcaddrs"])
+
+
+def _modify_show_config(content):
+    return content.replace(
+        'set name "Test1"', 'set name "Test1x"'
+    ).replace(
+        "    edit 20\n", "    edit 30\n"
+    ).replace(
+        "config firewall address\n",
+        "config firewall address\n"
+        "    edit \"host_10.9.9.9\"\n"
+        "        set subnet 10.9.9.9 255.255.255.255\n"
+        "    next\n"
+    )
+
+
+class FirewallConfigsDiffTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.udir = nof.utils.uploaddir(FT_FORTI_SHOW_CONFIG, self.workdir)
+        os.makedirs(self.udir)
+
+        src = C.list_res_files("forti/show_configs/*.txt")[0]
+        content = open(src).read()
+        self.paths = [os.path.join(self.udir, f) for f in ("0.txt", "1.txt")]
+        for path, data in zip(self.paths,
+                              (content, _modify_show_config(content))):
+            with open(path, 'w') as out:
+                out.write(data)
+
+        TT.POLICY_TABLE_CACHE.clear()
+
+    def tearDown(self):
+        TT.POLICY_TABLE_CACHE.clear()
+        C.prune_workdir(self.workdir)
+
+    def _parse(self, path):
+        (hname, _cnf) = TT.parse_fortigate_config_and_save_files(path)
+        return hname
+
+    def test_10_diff_firewall_configs__no_previous(self):
+        hname = self._parse(self.paths[0])
+        self.assertRaises(ValueError, TT.diff_firewall_configs, hname,
+                          datadir=self.workdir)
+
+    def test_20_diff_firewall_configs(self):
+        self._parse(self.paths[0])
+        hname = self._parse(self.paths[1])
+        self._parse(self.paths[1])  # It should not change the previous.
+
+        res = TT.diff_firewall_configs(hname, datadir=self.workdir)
+        self.assertEqual(res["hostname"], hname)
+        self.assertEqual((res["previous"]["filename"],
+                          res["current"]["filename"]), ("0.txt", "1.txt"))
+        self.assertEqual(list(res["diffs"]), list(TT.FORTI_DIFF_SOURCES))
+
+        pdiff = res["diffs"]["policies"]
+        self.assertEqual([r["edit"] for r in pdiff["added"]], [30])
+        self.assertEqual([r["edit"] for r in pdiff["removed"]], [20])
+        self.assertEqual([(m["key"], m["changes"])
+                          for m in pdiff["modified"]],
+                         [(1, dict(name=["Test1", "Test1x"]))])
+
+        adiff = res["diffs"]["addresses"]
+        self.assertEqual([a["edit"] for a in adiff["added"]],
+                         ["host_10.9.9.9"])
+        self.assertFalse(adiff["removed"] or adiff["modified"])
+        self.assertEqual(res["diffs"]["services"],
+                         dict(added=[], removed=[], modified=[]))
+
+        res = TT.diff_firewall_configs(hname, kinds=["addrgrps"],
+                                       datadir=self.workdir)
+        self.assertEqual(list(res["diffs"]), ["addrgrps"])
+        self.assertRaises(ValueError, TT.diff_firewall_configs, hname,
+                          kinds=["not_a_kind"], datadir=self.workdir)
+
+
+class PolicyTableCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.fpath = os.path.join(self.workdir, TT.FORTI_FIREWALL_POLICIES)
+        C.touch_file(self.fpath)
+        self.load_fn = mock.Mock(
+            side_effect=lambda _p: pandas.DataFrame(dict(a=range(10)))
+        )
+
+    def tearDown(self):
+        C.prune_workdir(self.workdir)
+
+    def test_10_get(self):
+        cache = TT.PolicyTableCache()
+        tbl = cache.get(self.fpath, self.load_fn)
+        self.assertTrue(cache.get(self.fpath, self.load_fn) is tbl)
+        self.assertEqual(self.load_fn.call_count, 1)
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]),
+                         (1, 1, 1))
+        self.assertTrue(0 < stats["size"] <= stats["max_size"])
+
+    def test_20_get__file_replaced(self):
+        cache = TT.PolicyTableCache()
+        cache.get(self.fpath, self.load_fn)
+
+        C.touch_file(self.fpath, "{}\n" * 2)
+        cache.get(self.fpath, self.load_fn)
+        self.assertEqual(self.load_fn.call_count, 2)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_30_get__evicted(self):
+        cache = TT.PolicyTableCache()
+        cache.get(self.fpath, self.load_fn)
+        size = cache.stats()["size"]
+
+        fpath2 = os.path.join(self.workdir, "another.json")
+        C.touch_file(fpath2)
+        cache.resize(size)
+        cache.get(fpath2, self.load_fn)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+        cache.get(self.fpath, self.load_fn)  # It was evicted.
+        self.assertEqual(self.load_fn.call_count, 3)
+
+        cache.resize(0)
+        self.assertEqual(cache.stats()["entries"], 0)
+        cache.get(self.fpath, self.load_fn)  # Too large to keep.
+        self.assertEqual(cache.stats()["entries"], 0)
+
 # vim:sw=4:ts=4:et:
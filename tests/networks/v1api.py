@@ -5,6 +5,7 @@
 # pylint: disable=invalid-name,missing-function-docstring
 """.networks.v1api test cases
 """
+import gzip
 import os.path
 import os
 import shutil
@@ -68,6 +69,33 @@ class Get_Or_Upload_10_TestCase(C.BluePrintTestCaseWithWorkdir):
                                           "file: " + opath))
             self.assertEqual(resp.data, content.encode("utf-8"))
 
+    def test_20_get_networks__encodings_and_etag(self):
+        fpath = self.net_files[0]
+        content = open(fpath, 'rb').read()
+        resp = self.client.post(os.path.join(TT.API_PREFIX,
+                                             os.path.basename(fpath)),
+                                data=content)
+        self.assertStatus(resp, 201, resp.data)
+        upath = os.path.join(TT.API_PREFIX,
+                             os.path.basename(resp.headers["Location"]))
+
+        resp = self.client.get(upath, headers={"Accept-Encoding": "gzip"})
+        self.assert200(resp)
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertTrue("Accept-Encoding" in resp.headers["Vary"])
+        self.assertEqual(gzip.decompress(resp.data), content)
+        etag = resp.headers["ETag"]
+
+        resp = self.client.get(upath, headers={"Accept-Encoding": "gzip",
+                                               "If-None-Match": etag})
+        self.assertStatus(resp, 304)
+
+        resp = self.client.get(upath, headers={"If-None-Match": etag})
+        self.assert200(resp)
+        self.assertEqual(resp.data, content)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        self.assertFalse(resp.headers.get("Content-Encoding"))
+
 
 class Find_Networks_20_TestCase(C.BluePrintTestCaseWithWorkdir):
 
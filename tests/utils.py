@@ -4,8 +4,13 @@
 # pylint: disable=invalid-name,missing-function-docstring
 """nof.utils test cases
 """
+import gzip
+import io
 import os.path
 import os
+import stat
+import threading
+import time
 import unittest
 import tempfile
 import mock
@@ -70,6 +75,30 @@ class TestFunctions(unittest.TestCase):
         res = TT.checksum(content=content)
         self.assertEqual(res, ref)
 
+    def test_36_checksum__bytes(self):
+        content = b"hello, world!\n"
+        ref = "e91ba0972b9055187fa2efa8b5c156f487a8293a"
+        self.assertEqual(TT.checksum(content=content), ref)
+
+    def test_38_checksum_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = os.path.join(tmpdir, "hello.txt")
+            content = b"hello, world!\n" * 1000
+            open(fpath, 'wb').write(content)
+
+            ref = TT.checksum(content=content)
+            with open(fpath, 'rb') as inp:
+                self.assertEqual(TT.checksum_stream(inp, chunk_size=7), ref)
+
+            self.assertEqual(TT.checksum_file(fpath), ref)
+            with mock.patch.object(TT, "checksum_stream") as stream_fn:
+                self.assertEqual(TT.checksum_file(fpath), ref)
+                self.assertFalse(stream_fn.called)  # cached.
+
+                open(fpath, 'ab').write(b"!")
+                TT.checksum_file(fpath)
+                self.assertTrue(stream_fn.called)  # changed.
+
     def test_40_uploaded_filename__no_content(self):
         fname = "test.txt"
         self.assertEqual(TT.uploaded_filename(fname), fname)
@@ -86,6 +115,30 @@ class TestFunctions(unittest.TestCase):
             res = TT.uploaded_filename(fname, content=content)
             self.assertEqual(res, ref)
 
+    def test_50_save_uploaded_stream(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = "hello.txt"
+            content = b"hello, world!\n" * 1000
+
+            ref = TT.uploaded_filepath(fname, "foo", content=content,
+                                       datadir=tmpdir)
+            res = TT.save_uploaded_stream(io.BytesIO(content), fname, "foo",
+                                          datadir=tmpdir, chunk_size=7)
+            self.assertEqual(res, ref)
+            self.assertEqual(open(res, 'rb').read(), content)
+            self.assertEqual(os.listdir(os.path.dirname(res)),
+                             [os.path.basename(res)])
+
+    def test_52_save_uploaded_stream__mode(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ref = os.path.join(tmpdir, "ref.txt")
+            open(ref, 'w').write("ref\n")
+
+            res = TT.save_uploaded_stream(io.BytesIO(b"hello\n"), "a.txt",
+                                          "foo", datadir=tmpdir)
+            self.assertEqual(stat.S_IMODE(os.stat(res).st_mode),
+                             stat.S_IMODE(os.stat(ref).st_mode))
+
     def test_60_ensure_dir_exists(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             datadir = os.path.join(tmpdir, "a/b/c/d")
@@ -94,6 +147,56 @@ class TestFunctions(unittest.TestCase):
             self.assertTrue(os.path.exists(datadir))
             self.assertTrue(os.path.isdir(datadir))
 
+    def test_61_dir_locked(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (tdir, steps) = (os.path.join(tmpdir, "a"), [])
+
+            def _work(name):
+                with TT.dir_locked(tdir):
+                    steps.append(name)
+                    time.sleep(0.05)
+                    steps.append(name)
+
+            threads = [threading.Thread(target=_work, args=(n, ))
+                       for n in "abc"]
+            for thr in threads:
+                thr.start()
+            for thr in threads:
+                thr.join()
+
+            self.assertEqual(sorted(steps[::2]), list("abc"))
+            self.assertEqual(steps[::2], steps[1::2])
+            self.assertTrue(os.path.exists(os.path.join(tdir,
+                                                        TT.LOCK_FILENAME)))
+
+    def test_62_save_file_atomically(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = os.path.join(tmpdir, "a/b/c.txt")
+            content = b"hello, world!\n"
+
+            self.assertEqual(TT.save_file_atomically(content, fpath),
+                             len(content))
+            self.assertEqual(open(fpath, 'rb').read(), content)
+            self.assertEqual(os.listdir(os.path.dirname(fpath)), ["c.txt"])
+
+    def test_64_save_compressed_copies(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = os.path.join(tmpdir, "a.json")
+            content = b'{"a": 1}\n' * 100
+            TT.save_file_atomically(content, fpath)
+
+            res = TT.save_compressed_copies(fpath)
+            self.assertTrue(fpath + ".gz" in res)
+            self.assertEqual(len(res), len(TT.compressed_copy_encodings()))
+            self.assertEqual(TT.compressed_copy_path(fpath, "gzip"),
+                             fpath + ".gz")
+            self.assertEqual(gzip.open(fpath + ".gz").read(), content)
+
+            # The copy is stale if the original was changed.
+            TT.save_file_atomically(b"{}\n", fpath)
+            os.utime(fpath, ns=(0, 0))
+            self.assertTrue(TT.compressed_copy_path(fpath, "gzip") is None)
+
     def test_70_list_filenames(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             fnames = "012.yml abc.txt xyz.json".split()